@@ -2,6 +2,9 @@
 Facebook Events Sync
 """
 from fest.facebook import FacebookPage  # noqa: F401
+from fest.facebook import FacebookPageGroup  # noqa: F401
 from fest.google import GoogleCalendar  # noqa: F401
+from fest.group import SyncGroup  # noqa: F401
+from fest.window import TimeWindow  # noqa: F401
 
 __version__ = "5.2.0"
@@ -0,0 +1,141 @@
+"""
+fest command line
+"""
+import argparse
+import cProfile
+import logging
+import pstats
+import re
+import sys
+import time
+import tracemalloc
+import urllib
+
+from fest.cassette import Cassette
+from fest.cassette import ReplayAdapter
+from fest.facebook import FacebookPage
+from fest.google import GoogleCalendar
+from fest.transport import Transport
+
+CALENDAR_PATH = re.compile(r"/calendars/([^/]+)/events")
+PAGE_PATH = re.compile(r"^/(?:v[0-9.]+/)?([^/]+)/events$")
+TOP = 25
+
+
+def targets(cassette):
+    """
+    Get the first facebook page ID & Google Calendar ID in a cassette.
+    """
+    page_id = calendar_id = None
+    for entry in cassette.entries():
+        path = urllib.parse.urlsplit(entry["url"]).path
+        page = PAGE_PATH.search(path)
+        calendar = CALENDAR_PATH.search(path)
+        if page_id is None and page:
+            page_id = page.group(1)
+        if calendar_id is None and calendar:
+            calendar_id = urllib.parse.unquote(calendar.group(1))
+    return page_id, calendar_id
+
+
+def profile(opts):
+    """
+    Replay a recorded sync under cProfile & tracemalloc.
+    """
+    cassette = Cassette(opts.cassette)
+    page_id, calendar_id = targets(cassette)
+    http = Transport(adapter=ReplayAdapter(cassette, realtime=opts.realtime))
+    page = FacebookPage(http.graphapi("replay"), opts.page_id or page_id)
+    gcal = GoogleCalendar(
+        http.calendarapi(opts.discovery_path),
+        opts.calendar_id or calendar_id,
+    )
+    time_filter = None if opts.time_filter == "all" else opts.time_filter
+
+    # Sync under profilers
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+    profiler.enable()
+    sync = gcal.sync(page, time_filter=time_filter).execute(dryrun=opts.dryrun)
+    profiler.disable()
+    elapsed = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Report
+    counts = {verb: len(x) for verb, x in sync.responses.items()}
+    errors = {verb: len(x) for verb, x in sync.errors.items() if x}
+    print(f"{page.id} => {gcal.calendar_id} in {elapsed:.3f}s {counts} errors={errors}")
+    stats = pstats.Stats(profiler, stream=sys.stdout)
+    stats.sort_stats(opts.sort).print_stats(opts.top)
+    print(f"Peak memory: {peak / 1024:.1f} KiB")
+    for stat in snapshot.statistics("lineno")[: opts.top]:
+        print(stat)
+    return 1 if errors else 0
+
+
+def main(args=None):
+    """
+    fest command.
+    """
+    parser = argparse.ArgumentParser(prog="fest")
+    commands = parser.add_subparsers(dest="command", required=True)
+    parser_profile = commands.add_parser(
+        "profile",
+        help="replay a recorded sync under cProfile & tracemalloc",
+    )
+    parser_profile.add_argument("cassette", help="path to recorded cassette")
+    parser_profile.add_argument(
+        "-p",
+        "--page-id",
+        help="facebook page ID (default first recorded)",
+    )
+    parser_profile.add_argument(
+        "-c",
+        "--calendar-id",
+        help="Google Calendar ID (default first recorded)",
+    )
+    parser_profile.add_argument(
+        "-t",
+        "--time-filter",
+        choices=("upcoming", "past", "all"),
+        default="upcoming",
+        help="facebook events to sync",
+    )
+    parser_profile.add_argument(
+        "-s",
+        "--sort",
+        default="cumulative",
+        help="pstats sort key",
+    )
+    parser_profile.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=TOP,
+        help="number of hot functions & allocations to print",
+    )
+    parser_profile.add_argument(
+        "--discovery-path",
+        help="path to cached Calendar API discovery document",
+    )
+    parser_profile.add_argument(
+        "--realtime",
+        action="store_true",
+        help="wait as long as each recorded response took",
+    )
+    parser_profile.add_argument(
+        "--dryrun",
+        action="store_true",
+        help="plan syncs without replaying writes",
+    )
+    parser_profile.set_defaults(func=profile)
+    opts = parser.parse_args(args)
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
+    return opts.func(opts)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())  # pragma: no cover
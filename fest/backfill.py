@@ -0,0 +1,311 @@
+"""
+Backfill
+"""
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from functools import partial
+
+from fest import utils
+from fest.facebook import FacebookPage
+from fest.google import SLICE_SPAN
+from fest.google import GoogleCalendar
+from fest.google import GoogleSliceSyncFuture
+from fest.google import GoogleSyncFuture
+from fest.window import TimeWindow
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def clients():
+    """
+    Get API clients & rate limiters configured by the environment.
+    """
+    # pylint: disable=import-outside-toplevel
+    from fest import heroku
+
+    return (
+        heroku.graphapi(),
+        heroku.calendarapi(),
+        heroku.graph_limiter(),
+        heroku.calendar_limiter(),
+    )
+
+
+def starts_between(since, until, event):
+    """
+    Test if event starts in `[since, until)`.
+    """
+    return since <= utils.parse_datetime(event["start_time"]) < until
+
+
+def sync_slice(factory, page_id, calendar_id, since, until, dryrun=False):
+    """
+    Sync events of a page starting in a slice, in a worker process.
+
+    :param function factory: function returning API clients (& rate limiters)
+    :param str page_id: facebook page ID
+    :param str calendar_id: Google Calendar ID
+    :param datetime since: start of slice
+    :param datetime until: end of slice
+    :param bool dryrun: plan sync without writing to the calendar
+    """
+    graphapi, calendarapi, *limiters = factory()
+    graph_limiter, calendar_limiter = limiters or (None, None)
+    page = FacebookPage(graphapi, page_id, limiter=graph_limiter)
+    gcal = GoogleCalendar(calendarapi, calendar_id, limiter=calendar_limiter)
+    window = TimeWindow(since, until, [partial(starts_between, since, until)])
+    request = page.get_events(window=window)
+    sync = BackfillSyncFuture(request, page, gcal, window=window, resolve=True)
+    sync.execute(dryrun=dryrun)
+    return {
+        "counts": {verb: len(x) for verb, x in sync.responses.items()},
+        "errors": {
+            verb: {k: repr(v) for k, v in x.items()} for verb, x in sync.errors.items()
+        },
+    }
+
+
+class BackfillSyncFuture(GoogleSyncFuture):
+    """
+    Sync future of the events starting in its window.
+
+    Events overlapping two slices belong to the slice they start in, so
+    slices synced in parallel never plan writes to the same event. Events
+    moved from another slice are looked up by ID, across the whole window,
+    and updated rather than created again; their old slice keeps them, as
+    the probe still finds them.
+    """
+
+    def index(self, *args, **kwargs):
+        since, until = (utils.to_utc(x) for x in self.window.bounds())
+        return {
+            x["facebook_id"]: {"digest": x["digest"], "google_id": x["google_id"]}
+            for x in self.calendar.iter_index(self.page.id, *args, **kwargs)
+            if x["start"] and since <= x["start"] < until
+        }
+
+
+class Journal:
+    """
+    Append-only JSON-lines journal of completed backfill slices.
+
+    :param str path: path to journal file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def completed(self, page_id, calendar_id):
+        """
+        Get `(since, until)` of completed slices of a page/calendar pair.
+
+        A partially written last line, from an interrupted backfill, is
+        ignored.
+        """
+        completed = set()
+        try:
+            with open(self.path) as stream:
+                for line in stream:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if (entry["page_id"], entry["calendar_id"]) == (
+                        page_id,
+                        calendar_id,
+                    ):
+                        completed.add((entry["since"], entry["until"]))
+        except FileNotFoundError:
+            pass
+        return completed
+
+    def record(self, entry):
+        """
+        Append entry durably.
+        """
+        with open(self.path, "a") as stream:
+            stream.write(json.dumps(entry) + "\n")
+            stream.flush()
+            os.fsync(stream.fileno())
+
+
+class Backfill:
+    """
+    Resumable backfill of a page's events, over slices synced in parallel.
+
+    The extent of events on either side is split into slices of `span`,
+    aligned to a fixed grid so they are the same when a backfill resumes.
+    Slices not yet in the journal are synced by a pool of `max_workers`
+    processes, each building its own clients with `factory`, and recorded
+    in the journal as they complete.
+
+    :param str page_id: facebook page ID
+    :param str calendar_id: Google Calendar ID
+    :param object journal: Journal of completed slices
+    :param function factory: picklable function returning API clients
+    :param timedelta span: duration of each slice
+    :param int max_workers: number of worker processes (default CPU count)
+    :param object window: TimeWindow to backfill (optional)
+    """
+
+    def __init__(
+        self,
+        page_id,
+        calendar_id,
+        journal,
+        factory=clients,
+        span=SLICE_SPAN,
+        max_workers=None,
+        window=None,
+    ):
+        self.page_id = page_id
+        self.calendar_id = calendar_id
+        self.journal = journal
+        self.factory = factory
+        self.span = span
+        self.max_workers = max_workers
+        self.window = window or TimeWindow()
+        self.logger = utils.logger(self)
+
+    def slices(self):
+        """
+        Get `(since, until)` of grid-aligned slices covering all events.
+        """
+        graphapi, calendarapi, *_ = self.factory()
+        page = FacebookPage(graphapi, self.page_id)
+        gcal = GoogleCalendar(calendarapi, self.calendar_id)
+        since, until = GoogleSliceSyncFuture(page, gcal, window=self.window).extent()
+        if since is None:
+            return []
+        start = EPOCH + (since - EPOCH) // self.span * self.span
+        slices = []
+        while start < until:
+            lower = max(start, self.window.since or start)
+            upper = min(start + self.span, self.window.until or start + self.span)
+            slices.append((lower, upper))
+            start += self.span
+        return slices
+
+    def execute(self, dryrun=False):
+        """
+        Sync slices not yet completed and record them in the journal.
+
+        Returns entries of slices synced by this run, including slices that
+        failed or had writes fail, which carry an `error`, are not recorded
+        and are retried by the next run.
+        """
+        completed = self.journal.completed(self.page_id, self.calendar_id)
+        slices = [
+            (since, until)
+            for since, until in self.slices()
+            if (since.isoformat(), until.isoformat()) not in completed
+        ]
+        self.logger.info("BACKFILL %d SLICES", len(slices))
+        entries = []
+        with ProcessPoolExecutor(self.max_workers) as executor:
+            futures = {
+                executor.submit(
+                    sync_slice,
+                    self.factory,
+                    self.page_id,
+                    self.calendar_id,
+                    since,
+                    until,
+                    dryrun,
+                ): (since, until)
+                for since, until in slices
+            }
+            for future in as_completed(futures):
+                since, until = futures[future]
+                entry = {
+                    "page_id": self.page_id,
+                    "calendar_id": self.calendar_id,
+                    "since": since.isoformat(),
+                    "until": until.isoformat(),
+                }
+                try:
+                    entry.update(future.result())
+                except Exception as err:  # pylint: disable=broad-except
+                    self.logger.exception("%s..%s FAILED", since, until)
+                    entry.update(error=repr(err))
+                else:
+                    failed = sum(len(x) for x in entry["errors"].values())
+                    if failed:
+                        self.logger.error(
+                            "%s..%s %d WRITES FAILED", since, until, failed
+                        )
+                        entry.update(error=f"{failed} writes failed")
+                    else:
+                        self.logger.info("%s..%s DONE", since, until)
+                        if not dryrun:
+                            self.journal.record(entry)
+                entries.append(entry)
+        return entries
+
+
+def main(args=None):
+    """
+    Backfill command.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("page_id", help="facebook page ID")
+    parser.add_argument("calendar_id", help="Google Calendar ID")
+    parser.add_argument(
+        "-j",
+        "--journal",
+        default="fest-backfill.jsonl",
+        help="path to checkpoint journal",
+    )
+    parser.add_argument(
+        "-d",
+        "--days",
+        type=int,
+        default=SLICE_SPAN.days,
+        help="days per slice",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="number of worker processes",
+    )
+    parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="ISO timestamp with offset to backfill from",
+    )
+    parser.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        help="ISO timestamp with offset to backfill until",
+    )
+    parser.add_argument(
+        "--dryrun",
+        action="store_true",
+        help="plan syncs without writing to the calendar",
+    )
+    opts = parser.parse_args(args)
+    logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
+    backfill = Backfill(
+        opts.page_id,
+        opts.calendar_id,
+        Journal(opts.journal),
+        span=timedelta(days=opts.days),
+        max_workers=opts.workers,
+        window=TimeWindow(opts.since, opts.until),
+    )
+    backfill.logger.setLevel("INFO")
+    entries = backfill.execute(dryrun=opts.dryrun)
+    print(json.dumps(entries))
+    return 1 if any("error" in x for x in entries) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())  # pragma: no cover
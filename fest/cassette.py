@@ -0,0 +1,249 @@
+"""
+Record & replay HTTP interactions
+"""
+import base64
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+import urllib
+from collections import defaultdict
+from collections import deque
+from datetime import timedelta
+
+import requests
+
+BATCH_ID = re.compile(r"<([0-9a-f-]{36}) \+ ([^>]*)>")
+SECRET_PARAMS = ("access_token",)
+SKIP_HEADERS = ("content-encoding", "content-length", "set-cookie", "transfer-encoding")
+
+
+class CassetteError(Exception):
+    """
+    Request without a recorded response.
+    """
+
+
+def opener(path):
+    """
+    Get function opening a plain or gzip-compressed (`.gz`) cassette.
+    """
+    return gzip.open if str(path).endswith(".gz") else open
+
+
+def strip_url(url):
+    """
+    Get URL without secret query params, with sorted query params.
+    """
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    query = sorted(x for x in query if x[0] not in SECRET_PARAMS)
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def route(method, url):
+    """
+    Get `METHOD path` of a request, without query params.
+    """
+    return f"{method} {urllib.parse.urlsplit(url).path}"
+
+
+def request_text(request):
+    """
+    Get decoded body of a prepared request.
+    """
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode()
+    if request.headers.get("content-encoding") == "gzip":
+        body = gzip.decompress(body)
+    return body.decode("utf-8", "replace")
+
+
+def request_key(request):
+    """
+    Get key matching a prepared request to its recorded response.
+
+    Batch requests are keyed by the IDs of their sub-requests rather than
+    their random multipart boundaries, and form bodies without secrets.
+    """
+    text = request_text(request)
+    ids = BATCH_ID.findall(text)
+    content_type = request.headers.get("content-type") or ""
+    if ids:
+        signature = sorted(x for _, x in ids)
+    elif content_type.startswith("application/x-www-form-urlencoded"):
+        query = urllib.parse.parse_qsl(text, keep_blank_values=True)
+        signature = sorted(x for x in query if x[0] not in SECRET_PARAMS)
+    else:
+        signature = text
+    key = json.dumps([request.method, strip_url(request.url), signature])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class Cassette:
+    """
+    JSON-lines file of recorded HTTP request/response pairs.
+
+    Cassettes with a `.gz` extension are gzip-compressed. Request headers
+    are not recorded and access tokens are stripped from recorded URLs.
+
+    Requests are replayed with the response recorded for the same request,
+    in recorded order. Requests whose parameters changed since the
+    recording (e.g. the bounds of `upcoming` events) fall back to the next
+    unused response recorded for the same method & path.
+
+    :param str path: path to cassette
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.keys = None
+        self.routes = None
+
+    def record(self, request, response, elapsed):
+        """
+        Append a request/response pair to the cassette.
+
+        :param object request: requests PreparedRequest
+        :param object response: requests Response
+        :param float elapsed: seconds until the response was read
+        """
+        content = response.content
+        entry = {
+            "key": request_key(request),
+            "method": request.method,
+            "url": strip_url(request.url),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {
+                key: value
+                for key, value in response.headers.items()
+                if key.lower() not in SKIP_HEADERS
+            },
+            "elapsed": round(elapsed, 6),
+        }
+        try:
+            entry.update(content=content.decode("utf-8"))
+        except UnicodeDecodeError:
+            entry.update(content=base64.b64encode(content).decode(), base64=True)
+        batch_id = BATCH_ID.search(request_text(request))
+        if batch_id:
+            entry.update(batch_id=batch_id.group(1))
+        line = json.dumps(entry, separators=(",", ":"))
+        with self.lock, opener(self.path)(self.path, "at") as stream:
+            stream.write(f"{line}\n")
+
+    def entries(self):
+        """
+        Yield recorded entries, ignoring a partially written last line.
+        """
+        with opener(self.path)(self.path, "rt") as stream:
+            for line in stream:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def load(self):
+        """
+        Load recorded entries for replay.
+        """
+        self.keys = defaultdict(deque)
+        self.routes = defaultdict(deque)
+        for entry in self.entries():
+            entry.update(pending=True)
+            self.keys[entry["key"]].append(entry)
+            self.routes[route(entry["method"], entry["url"])].append(entry)
+
+    def match(self, request):
+        """
+        Take the recorded entry of a prepared request.
+        """
+        with self.lock:
+            if self.keys is None:
+                self.load()
+            queues = (
+                self.keys[request_key(request)],
+                self.routes[route(request.method, request.url)],
+            )
+            for queue in queues:
+                while queue:
+                    entry = queue.popleft()
+                    # Entries are queued by key and by route; take each once
+                    if entry.pop("pending", False):
+                        return entry
+        raise CassetteError(f"{request.method} {strip_url(request.url)} not recorded")
+
+    @staticmethod
+    def response(request, entry):
+        """
+        Build response to a prepared request from a recorded entry.
+        """
+        content = entry["content"]
+        batch_id = entry.get("batch_id")
+        if batch_id:
+            # Sub-responses refer to the random ID of the new batch
+            new_id = BATCH_ID.search(request_text(request))
+            content = content.replace(batch_id, new_id.group(1))
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=entry["elapsed"])
+        # pylint: disable=protected-access
+        if entry.get("base64"):
+            response._content = base64.b64decode(content)
+        else:
+            response._content = content.encode("utf-8")
+        return response
+
+
+class RecordingAdapter(requests.adapters.HTTPAdapter):
+    """
+    Connection pool adapter recording every request/response pair.
+
+    :param object cassette: Cassette to record to
+    """
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        response.content  # pylint: disable=pointless-statement
+        self.cassette.record(request, response, time.perf_counter() - start)
+        return response
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """
+    Adapter answering requests with recorded responses, without network.
+
+    :param object cassette: Cassette to replay
+    :param bool realtime: wait as long as each recorded response took
+    """
+
+    def __init__(self, cassette, realtime=False):
+        super().__init__()
+        self.cassette = cassette
+        self.realtime = realtime
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        entry = self.cassette.match(request)
+        if self.realtime:
+            time.sleep(entry["elapsed"])
+        response = self.cassette.response(request, entry)
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
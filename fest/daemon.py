@@ -0,0 +1,125 @@
+"""
+Scheduler daemon
+"""
+import random
+import signal
+import threading
+import time
+
+from fest import utils
+
+BACKOFF = 2
+INTERVAL = 900
+JITTER = 0.1
+MAX_INTERVAL = 21600
+MIN_INTERVAL = 60
+
+
+class Daemon:
+    """
+    Long-running scheduler of a SyncGroup's pairs, keeping its clients warm.
+
+    Each pair is synced on its own interval, with jitter. The interval of a
+    pair whose page events changed since its last run (as seen by their
+    digests) is divided by `backoff`; that of a quiet pair is multiplied by
+    it, within `min_interval` and `max_interval`.
+
+    Stopping (on SIGTERM or SIGINT while running) lets in-flight syncs and
+    their batches finish before returning.
+
+    :param object group: SyncGroup of pairs to schedule
+    :param float interval: initial seconds between syncs of a pair
+    :param float min_interval: minimum seconds between syncs of a pair
+    :param float max_interval: maximum seconds between syncs of a pair
+    :param float backoff: interval multiplier for quiet pairs
+    :param float jitter: maximum fraction of interval to jitter
+    """
+
+    def __init__(
+        self,
+        group,
+        interval=INTERVAL,
+        min_interval=MIN_INTERVAL,
+        max_interval=MAX_INTERVAL,
+        backoff=BACKOFF,
+        jitter=JITTER,
+    ):
+        self.group = group
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.schedule = [
+            {"pair": pair, "interval": interval, "due": 0, "digests": None}
+            for pair in group.pairs
+        ]
+        self.stopping = threading.Event()
+        self.logger = utils.logger(self)
+
+    def run(self, dryrun=False):
+        """
+        Run scheduled syncs until stopped.
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        while not self.stopping.is_set():
+            delay = self.tick(dryrun)
+            self.stopping.wait(delay)
+        self.logger.info("STOPPED")
+
+    def stop(self, *_):
+        """
+        Stop after in-flight syncs finish.
+        """
+        self.logger.info("STOPPING")
+        self.stopping.set()
+
+    def tick(self, dryrun=False):
+        """
+        Sync pairs that are due and reschedule them.
+
+        Returns seconds until the next pair is due.
+        """
+        due = [x for x in self.schedule if x["due"] <= time.monotonic()]
+        if due:
+            results = self.group.execute(dryrun=dryrun, pairs=[x["pair"] for x in due])
+            for entry, result in zip(due, results):
+                self.adapt(entry, result)
+                entry["due"] = time.monotonic() + self.delay(entry["interval"])
+        return max(0, min(x["due"] for x in self.schedule) - time.monotonic())
+
+    def adapt(self, entry, result):
+        """
+        Tighten interval of a changed pair or back off a quiet one.
+
+        Failed syncs keep their interval.
+        """
+        digests = result["digests"]
+        if digests is None:
+            return
+        if entry["digests"] is not None:
+            if digests != entry["digests"]:
+                interval = entry["interval"] / self.backoff
+            else:
+                interval = entry["interval"] * self.backoff
+            interval = max(self.min_interval, min(self.max_interval, interval))
+            self.logger.info(
+                "%s => %s EVERY %ss",
+                entry["pair"]["page_id"],
+                entry["pair"]["calendar_id"],
+                interval,
+            )
+            entry["interval"] = interval
+        entry["digests"] = digests
+
+    def delay(self, interval):
+        """
+        Get interval with jitter.
+        """
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+if __name__ == "__main__":
+    from fest import heroku  # pragma: no cover
+
+    heroku.daemon()  # pragma: no cover
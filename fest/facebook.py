@@ -1,16 +1,91 @@
 """
 facebook
 """
+import json
+import logging
 import urllib
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from collections.abc import Mapping
+from functools import partial
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
-from copy import deepcopy
 
 from fest import utils
+from fest.metrics import NullSink
+from fest.window import TimeWindow
 
 DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+MAX_BATCH_REQUESTS = 50  # facebook-imposed limit
 MAX_OBJECTS = 50  # facebook-imposed limit
+MAX_WORKERS = 4
+EVENT_FIELDS = (
+    "id",
+    "name",
+    "description",
+    "start_time",
+    "end_time",
+    "event_times",
+    "place",
+)
+# Keys of default Graph API event payloads, in their usual order
+LEGACY_FIELDS = (
+    "description",
+    "end_time",
+    "name",
+    "place",
+    "start_time",
+    "event_times",
+    "id",
+)
+
+
+class GraphBatchError(Exception):
+    """
+    Failed sub-request of a GraphAPI batch request.
+    """
+
+
+class Occurrence(Mapping):
+    """
+    Single occurrence of a recurring facebook event.
+
+    Overlays an entry of the parent's `event_times` on the parent event,
+    hiding the parent's `event_times`. Keys are ordered as in a copy of
+    the parent updated with the entry.
+
+    :param dict event: recurring facebook event
+    :param dict event_time: entry of the event's `event_times`
+    """
+
+    __slots__ = ("event", "event_time")
+
+    def __init__(self, event, event_time):
+        self.event = event
+        self.event_time = event_time
+
+    def __getitem__(self, key):
+        try:
+            return self.event_time[key]
+        except KeyError:
+            if key == "event_times":
+                raise
+            return self.event[key]
+
+    def __iter__(self):
+        for key in self.event:
+            if key != "event_times":
+                yield key
+        for key in self.event_time:
+            if key not in self.event:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
 
 
 class FacebookPage:
@@ -19,13 +94,43 @@ class FacebookPage:
 
     :param object graphapi: GraphAPI client
     :param str page_id: facebook page ID/Alias
+    :param int prefetch: number of result pages to read ahead
+    :param int max_workers: maximum number of concurrent object requests
+    :param int retries: number of retries for failed object requests
+    :param list fields: event fields to request in addition to `EVENT_FIELDS`
+    :param object metrics: metrics sink (optional)
+    :param object limiter: RateLimiter of GraphAPI calls (optional)
     """
 
-    def __init__(self, graphapi, page_id):
+    def __init__(
+        self,
+        graphapi,
+        page_id,
+        prefetch=utils.PREFETCH_PAGES,
+        max_workers=MAX_WORKERS,
+        retries=utils.MAX_RETRIES,
+        fields=(),
+        metrics=None,
+        limiter=None,
+    ):
         self.graphapi = graphapi
         self.id = page_id  # pylint: disable=invalid-name
+        self.prefetch = prefetch
+        self.max_workers = max_workers
+        self.retries = retries
+        self.fields = ",".join(dict.fromkeys(EVENT_FIELDS + tuple(fields)))
+        self.metrics = metrics or NullSink()
+        self.limiter = limiter
         self.logger = utils.logger(self)
 
+    def throttle(self, calls=1):
+        """
+        Wait until the rate limiter allows GraphAPI calls, if any.
+        """
+        if self.limiter is not None:
+            wait = self.limiter.acquire(calls)
+            self.metrics.observe("ratelimit_wait_seconds", wait, api="graph")
+
     def get_events(self, **args):
         """
         Get events as Future.
@@ -38,74 +143,166 @@ class FacebookPage:
         """
         return utils.Future(self.iter_objects(ids, **args))
 
-    def iter_events(self, **args):
+    def iter_events(self, window=None, **args):
         """
         Yield events from pages of GraphAPI `get_object` results.
         Recurring events are exploded into individual objects.
+
+        If a `TimeWindow` is given, its bounds are pushed down to Graph API
+        and only events inside it are yielded. Pagination stops once pages
+        are entirely outside the window, or outside the window implied by
+        `time_filter`.
+
+        Only the fields used by `to_google`, plus any extra fields of the
+        page, are requested unless `fields` is given.
         """
-        # Get initial response
-        path = f"{self.id}/events"
-        params = urllib.parse.urlencode(args)
-        self.logger.info("GET /%s?%s", path, params)
-        response = self.graphapi.get_object(path, **args)
+        args = self.events_args(window, **args)
+        bounds = window or TimeWindow.from_time_filter(args.get("time_filter"))
+        cursor = partial(self.window_cursor, bounds)
+        pages = utils.paginate(self.fetch_events, cursor, args, self.prefetch)
+        try:
+            for response in pages:
+                yield from self.iter_response(response, window, **args)
+        finally:
+            pages.close()
+
+    def events_args(self, window=None, **args):
+        """
+        Get GraphAPI args for listing events in a window.
+        """
+        params = {"fields": self.fields}
+        if window is not None:
+            params.update(window.params())
+        return dict(params, **args)
 
-        # Yield items in this page
+    def iter_response(self, response, window=None, **args):
+        """
+        Yield events in a page of GraphAPI results.
+        """
         for event in response["data"]:
-            yield from self.explode_event(event, **args)
+            for occurrence in self.explode_event(event, **args):
+                if window is None or window.contains(occurrence):
+                    yield occurrence
 
-        # Yield items from subsequent pages
+    def fetch_events(self, **args):
+        """
+        Get a single page of events from GraphAPI.
+        """
+        path = f"{self.id}/events"
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("GET /%s?%s", path, urllib.parse.urlencode(args))
+        self.throttle()
+        with self.metrics.span("api_request", api="graph", endpoint="events"):
+            response = self.graphapi.get_object(path, **args)
+        self.metrics.increment("pages_fetched_total", api="graph")
+        return response
+
+    @staticmethod
+    def cursor(response):
+        """
+        Get args for the next page of GraphAPI results.
+        """
         try:
-            args.update(after=response["paging"]["cursors"]["after"])
-            yield from self.iter_events(**args)
+            return {"after": response["paging"]["cursors"]["after"]}
         except KeyError:
-            pass
+            return None
+
+    def window_cursor(self, bounds, response):
+        """
+        Get args for the next page of GraphAPI results, unless following
+        pages are entirely outside the window.
 
-    def iter_objects(self, ids, **args):
+        Checked before the next page is fetched, so pages read ahead are
+        not fetched either.
+        """
+        if bounds.exhausted(response["data"]):
+            self.logger.info("GET /%s/events DONE (outside window)", self.id)
+            return None
+        return self.cursor(response)
+
+    def iter_objects(self, ids, ordered=True, **args):
         """
         Yield objects from GraphAPI `get_objects` results.
+
+        Chunks of `MAX_OBJECTS` IDs are fetched concurrently and yielded in
+        order, or as they complete if `ordered` is false. Event fields are
+        requested unless `fields` is given.
         """
+        args.setdefault("fields", self.fields)
+
         # Split `ids` into chunks of `MAX_OBJECTS` for Graph API
-        chunks = list(range(0, len(ids), MAX_OBJECTS)) + [len(ids)]
+        chunks = [ids[i : i + MAX_OBJECTS] for i in range(0, len(ids), MAX_OBJECTS)]
 
         # Yield objects from chunks
-        for left, right in zip(chunks[:-1], chunks[1:]):
-            self.logger.info("GET /%s", ",".join(ids[left:right]))
-            objs = self.graphapi.get_objects(ids[left:right], **args)
-            yield from objs.values()
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            futures = [
+                executor.submit(self.fetch_objects, chunk, **args) for chunk in chunks
+            ]
+            try:
+                for future in futures if ordered else as_completed(futures):
+                    yield from future.result().values()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def fetch_objects(self, ids, **args):
+        """
+        Get a single chunk of objects from GraphAPI, retrying on errors.
+        """
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("GET /%s", ",".join(ids))
+        func = partial(self.fetch_objects_once, ids, **args)
+        return utils.retry(func, self.retries, on_retry=self.count_retry)
+
+    def count_retry(self, err):
+        """
+        Count a retried GraphAPI request.
+        """
+        # pylint: disable=unused-argument
+        self.metrics.increment("retries_total", api="graph")
+
+    def fetch_objects_once(self, ids, **args):
+        """
+        Get a single chunk of objects from GraphAPI.
+        """
+        # Graph API counts each object of the request as a call
+        self.throttle(len(ids))
+        with self.metrics.span("api_request", api="graph", endpoint="objects"):
+            response = self.graphapi.get_objects(ids, **args)
+        self.metrics.increment("objects_fetched_total", len(ids), api="graph")
+        return response
 
     @staticmethod
     def explode_event(event, **args):
         """
-        Yield recurring facebook event as individual copies.
-        """
-        # Yield recurring events
-        try:
-            for event_time in event["event_times"]:
-                start_time = datetime.strptime(
-                    event_time["start_time"],
-                    DATETIME_FORMAT,
-                )
-                end_time = datetime.strptime(
-                    event_time["end_time"],
-                    DATETIME_FORMAT,
-                )
-
-                # Only yield upcoming/past events if `time_filter` specified
-                time_filter = args.get("time_filter")
-                now = datetime.utcnow().replace(tzinfo=timezone.utc)
-                if (
-                    (time_filter is None)
-                    or (time_filter == "upcoming" and start_time >= now)
-                    or (time_filter == "past" and end_time <= now)
-                ):
-                    this_event = deepcopy(event)
-                    del this_event["event_times"]
-                    this_event.update(event_time)
-                    yield this_event
+        Yield recurring facebook event as individual occurrences.
 
+        Occurrences are read-only views over the parent event, so the
+        parent payload is shared rather than copied.
+        """
         # Yield single event
-        except KeyError:
+        event_times = event.get("event_times")
+        if event_times is None:
             yield event
+            return
+
+        # Only yield upcoming/past events if `time_filter` specified
+        time_filter = args.get("time_filter")
+        now = datetime.now(timezone.utc)
+        if time_filter == "upcoming":
+            event_times = (
+                x for x in event_times if utils.parse_datetime(x["start_time"]) >= now
+            )
+        elif time_filter == "past":
+            event_times = (
+                x
+                for x in event_times
+                if utils.parse_datetime(x.get("end_time") or x["start_time"]) <= now
+            )
+
+        # Yield recurring events
+        for event_time in event_times:
+            yield Occurrence(event, event_time)
 
     @staticmethod
     def location_string(event):
@@ -122,7 +319,40 @@ class FacebookPage:
         values = [str(loc[x]) for x in keys if x in loc]
         return " ".join(values) or None
 
-    def to_google(self, event):
+    def digest(self, event):
+        """
+        Get canonical digest of the event fields that feed `to_google`.
+        """
+        return utils.canonical_digest(
+            {
+                "description": event.get("description"),
+                "end_time": event.get("end_time"),
+                "id": event["id"],
+                "location": self.location_string(event),
+                "name": event.get("name"),
+                "page_id": self.id,
+                "start_time": event["start_time"],
+            }
+        )
+
+    def digest_matches(self, event, other, digest=None):
+        """
+        Test if a stored digest matches the event.
+
+        Legacy (unversioned) digests are compared against the legacy
+        digest of the whole event, so unchanged events are not rewritten.
+        As legacy digests depend on key order, they match either the event
+        as received, or rebuilt in the order of the default payload, from
+        before events were fetched with a `fields` projection.
+        """
+        if other and other.startswith(utils.DIGEST_PREFIX):
+            return other == (digest or self.digest(event))
+        if other == utils.digest(dict(event)):
+            return True
+        legacy = {key: event[key] for key in LEGACY_FIELDS if key in event}
+        return other == utils.digest(legacy)
+
+    def to_google(self, event, digest=None):
         """
         Convert a facebook event to a Google Calendar event.
         """
@@ -131,16 +361,16 @@ class FacebookPage:
         desc = event.get("description")
         url = f"https://www.facebook.com/{facebook_id}"
         description = f"{desc}\n\n{url}"
-        start_time = datetime.strptime(event["start_time"], DATETIME_FORMAT)
+        start_time = utils.parse_datetime(event["start_time"])
         try:
-            end_time = datetime.strptime(event["end_time"], DATETIME_FORMAT)
+            end_time = utils.parse_datetime(event["end_time"])
         except KeyError:
             end_time = start_time + timedelta(hours=1)
         time_zone = start_time.tzname() or end_time.tzname()
         start_time = start_time.isoformat()
         end_time = end_time.isoformat()
         location = self.location_string(event)
-        digest = utils.digest(event)
+        digest = digest or self.digest(event)
         google_event = {
             "summary": summary,
             "description": description,
@@ -161,4 +391,109 @@ class FacebookPage:
                 },
             },
         }
+        if isinstance(event, Occurrence):
+            private = google_event["extendedProperties"]["private"]
+            private.update(facebookParentId=event.event["id"])
         return google_event
+
+
+class FacebookPageGroup:
+    """
+    Group of facebook pages whose events are fetched with GraphAPI batch
+    requests of up to `MAX_BATCH_REQUESTS` pages each.
+
+    :param object graphapi: GraphAPI client
+    :param list pages: FacebookPage objects
+    :param object limiter: RateLimiter of GraphAPI calls (optional)
+    """
+
+    def __init__(self, graphapi, pages, limiter=None):
+        self.graphapi = graphapi
+        self.pages = {x.id: x for x in pages}
+        self.limiter = limiter
+        self.logger = utils.logger(self)
+
+    def get_events(self, window=None, **args):
+        """
+        Get events of each page as Futures, keyed by page ID.
+        """
+        events, errors = self.fetch(window, **args)
+        return {
+            page_id: utils.Future(
+                self.iter_results(events[page_id], errors.get(page_id))
+            )
+            for page_id in self.pages
+        }
+
+    @staticmethod
+    def iter_results(events, err=None):
+        """
+        Yield fetched events of a page, or raise its error.
+        """
+        if err is not None:
+            raise err
+        yield from events
+
+    def fetch(self, window=None, **args):
+        """
+        Fetch events of all pages, following each page's cursors.
+
+        Returns events and errors keyed by page ID. Each round of requests
+        batches the next page of results of every unfinished page.
+        """
+        events = {x: [] for x in self.pages}
+        errors = {}
+        pending = {
+            x: page.events_args(window, **args) for x, page in self.pages.items()
+        }
+        while pending:
+            requests = list(pending.items())
+            pending = {}
+            for left in range(0, len(requests), MAX_BATCH_REQUESTS):
+                chunk = requests[left : left + MAX_BATCH_REQUESTS]
+                responses = self.fetch_batch(chunk)
+                for (page_id, page_args), response in zip(chunk, responses):
+                    page = self.pages[page_id]
+                    try:
+                        body = self.parse(response)
+                    except GraphBatchError as err:
+                        errors[page_id] = err
+                        continue
+                    events[page_id].extend(
+                        page.iter_response(body, window, **page_args)
+                    )
+                    cursor = page.cursor(body)
+                    time_filter = page_args.get("time_filter")
+                    bounds = window or TimeWindow.from_time_filter(time_filter)
+                    if cursor is not None and not bounds.exhausted(body["data"]):
+                        pending[page_id] = dict(page_args, **cursor)
+        return events, errors
+
+    def fetch_batch(self, requests):
+        """
+        Get a single GraphAPI batch of `(page_id, args)` event requests.
+        """
+        batch = [
+            {
+                "method": "GET",
+                "relative_url": f"{page_id}/events?{urllib.parse.urlencode(args)}",
+            }
+            for page_id, args in requests
+        ]
+        self.logger.info("POST / (batch of %d)", len(batch))
+        if self.limiter is not None:
+            # Graph API counts each request of a batch as a call
+            self.limiter.acquire(len(batch))
+        return self.graphapi.request("", post_args={"batch": json.dumps(batch)})
+
+    @staticmethod
+    def parse(response):
+        """
+        Get JSON body of a batch sub-response.
+        """
+        if response is None:
+            raise GraphBatchError("Batch request timed out")
+        body = json.loads(response.get("body") or "{}")
+        if response.get("code") != 200:
+            raise GraphBatchError(body.get("error", {}).get("message", body))
+        return body
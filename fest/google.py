@@ -2,11 +2,96 @@
 Google Calendar.
 """
 import json
+import logging
+import queue
+import threading
+import time
 import urllib
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from datetime import timedelta
+from itertools import chain
+from itertools import islice
 
 from fest import utils
+from fest.metrics import NullSink
+from fest.window import TimeWindow
 
+INDEX_FIELDS = (
+    "nextPageToken,nextSyncToken,"
+    "items(id,status,start,end,extendedProperties/private)"
+)
 MAX_BATCH_REQUESTS = 50
+MAX_LOOKUPS = 50
+MAX_RESULTS = 2500
+MIN_BATCH_REQUESTS = 5
+PIPELINE_DEPTH = 100
+BATCH_REQUESTS_STEP = 5
+TARGET_BATCH_LATENCY = 10
+RATE_LIMIT_REASONS = ("ratelimitexceeded", "userratelimitexceeded")
+SLICE_SPAN = timedelta(days=90)
+
+
+def throttled(err):
+    """
+    Test if a Calendar API error is a rate-limit response.
+    """
+    status = utils.http_status(err)
+    if status == 403:
+        content = getattr(err, "content", b"") or b""
+        reason = f"{err} {content.decode(errors='replace')}".lower()
+        return any(x in reason for x in RATE_LIMIT_REASONS)
+    return status == 429
+
+
+def retryable(err):
+    """
+    Test if a Calendar API error is transient and worth retrying.
+    """
+    return throttled(err) or (utils.http_status(err) or 0) >= 500
+
+
+class BatchController:
+    """
+    AIMD controller of batch size and number of in-flight batches.
+
+    Batches that complete under the target latency without being
+    rate-limited additively increase both; a slow or rate-limited batch
+    halves them.
+
+    :param int max_concurrency: maximum number of in-flight batches
+    :param int max_size: maximum number of sub-requests per batch
+    :param int min_size: minimum number of sub-requests per batch
+    :param float target_latency: seconds per batch above which to back off
+    """
+
+    def __init__(
+        self,
+        max_concurrency=1,
+        max_size=MAX_BATCH_REQUESTS,
+        min_size=MIN_BATCH_REQUESTS,
+        target_latency=TARGET_BATCH_LATENCY,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_size = max_size
+        self.min_size = min_size
+        self.target_latency = target_latency
+        self.concurrency = 1
+        self.size = max_size
+        self.lock = threading.Lock()
+
+    def record(self, latency, limited=False):
+        """
+        Adjust batch size & concurrency from an executed batch.
+        """
+        with self.lock:
+            if limited or latency > self.target_latency:
+                self.concurrency = max(1, self.concurrency // 2)
+                self.size = max(self.min_size, self.size // 2)
+            else:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                self.size = min(self.max_size, self.size + BATCH_REQUESTS_STEP)
 
 
 class GoogleCalendar:
@@ -15,15 +100,48 @@ class GoogleCalendar:
 
     :param object calendarapi: Google Calendar API client
     :param str calendar_id: Google Calendar ID
+    :param int prefetch: number of result pages to read ahead
+    :param object store: state store for incremental listing (optional)
+    :param int reconcile_interval: seconds between store/API reconciliations
+    :param int retries: number of retries for failed batch sub-requests
+    :param object controller: BatchController shared by calendars (optional)
+    :param object metrics: metrics sink (optional)
+    :param object limiter: RateLimiter of Calendar API calls (optional)
     """
 
-    def __init__(self, calendarapi, calendar_id):
+    def __init__(
+        self,
+        calendarapi,
+        calendar_id,
+        prefetch=utils.PREFETCH_PAGES,
+        store=None,
+        reconcile_interval=None,
+        retries=utils.MAX_RETRIES,
+        controller=None,
+        metrics=None,
+        limiter=None,
+    ):
         self.calendarapi = calendarapi
         self.calendar_id = calendar_id
+        self.prefetch = prefetch
+        self.store = store
+        self.reconcile_interval = reconcile_interval
+        self.retries = retries
+        self.controller = controller or BatchController()
+        self.metrics = metrics or NullSink()
+        self.limiter = limiter
         self.logger = utils.logger(self)
         self.batch = calendarapi.new_batch_http_request
         self.events = calendarapi.events
 
+    def throttle(self, calls=1):
+        """
+        Wait until the rate limiter allows Calendar API calls, if any.
+        """
+        if self.limiter is not None:
+            wait = self.limiter.acquire(calls)
+            self.metrics.observe("ratelimit_wait_seconds", wait, api="calendar")
+
     def get_events(self, **kwargs):
         """
         Get Google Calendar events.
@@ -34,90 +152,389 @@ class GoogleCalendar:
         """
         Yield calendar event objects.
         """
-        # Get initial response
-        params = urllib.parse.urlencode(kwargs)
-        self.logger.info("GET /%s?%s", self.calendar_id, params)
+        pages = utils.paginate(self.fetch_events, self.cursor, kwargs, self.prefetch)
+        for response in pages:
+            yield from response.get("items") or []
+
+    def fetch_events(self, **kwargs):
+        """
+        Get a single page of calendar events.
+        """
+        if self.logger.isEnabledFor(logging.DEBUG):
+            params = urllib.parse.urlencode(kwargs)
+            self.logger.debug("GET /%s?%s", self.calendar_id, params)
         events = self.events()
         request = events.list(calendarId=self.calendar_id, **kwargs)
-        response = request.execute()
+        self.throttle()
+        with self.metrics.span("api_request", api="calendar", endpoint="list"):
+            response = request.execute()
+        self.metrics.increment("pages_fetched_total", api="calendar")
+        return response
 
-        # Yield items in this page
-        items = response.get("items") or []
-        yield from items
-
-        # Yield items from subsequent pages
+    @staticmethod
+    def cursor(response):
+        """
+        Get kwargs for the next page of calendar events.
+        """
         try:
-            kwargs.update(pageToken=response["nextPageToken"])
-            yield from self.iter_events(**kwargs)
+            return {"pageToken": response["nextPageToken"]}
         except KeyError:
-            pass
+            return None
+
+    def iter_index(
+        self, page_id, time_min=None, time_max=None, facebook_ids=None, parent_ids=()
+    ):
+        """
+        Yield records of a page's calendar events in a time window.
+
+        Records are read from the state store, if one is configured, after
+        applying calendar changes since the last reconciliation when one is
+        due. Otherwise they are listed from the Calendar API.
+
+        Reconciliations of a calendar are serialized with the reading of its
+        records, so syncs sharing a calendar never read it mid-resync.
+
+        Listings request only the `INDEX_FIELDS` of `MAX_RESULTS` events per
+        page; use `iter_events` for full event resources.
+
+        If `facebook_ids` are given, only records of those facebook events,
+        or of occurrences of the recurring events in `parent_ids`, are
+        yielded and the API is only asked for those events.
+        """
+        if self.store is not None:
+            with self.store.calendar_lock(self.calendar_id):
+                if self.reconcile_due():
+                    self.sync_index()
+                records = list(
+                    self.store.iter_events(
+                        self.calendar_id,
+                        page_id,
+                        time_min and utils.to_utc(time_min),
+                        time_max and utils.to_utc(time_max),
+                    )
+                )
+            if facebook_ids is None:
+                yield from records
+            else:
+                yield from (
+                    x
+                    for x in records
+                    if x["facebook_id"] in facebook_ids
+                    or x.get("parent_id") in parent_ids
+                )
+        elif facebook_ids is not None:
+            seen = set()
+            filters = [f"facebookId={x}" for x in facebook_ids]
+            filters.extend(f"facebookParentId={x}" for x in parent_ids)
+            for prop in filters:
+                events = self.iter_events(
+                    fields=INDEX_FIELDS,
+                    singleEvents=True,
+                    privateExtendedProperty=[f"facebookPageId={page_id}", prop],
+                )
+                for event in events:
+                    if event["id"] not in seen:
+                        seen.add(event["id"])
+                        yield self.record(event)
+        else:
+            kwargs = {"timeMin": time_min, "timeMax": time_max}
+            events = self.iter_events(
+                fields=INDEX_FIELDS,
+                maxResults=MAX_RESULTS,
+                singleEvents=True,
+                privateExtendedProperty=f"facebookPageId={page_id}",
+                **{k: v for k, v in kwargs.items() if v is not None},
+            )
+            yield from (self.record(x) for x in events)
+
+    def reconcile_due(self):
+        """
+        Test if the state store is due to be reconciled with the Calendar API.
+        """
+        if self.reconcile_interval is None:
+            return True
+        reconciled_at = self.store.get_meta(self.calendar_id, "reconciledAt")
+        if reconciled_at is None:
+            return True
+        return time.time() - reconciled_at >= self.reconcile_interval
+
+    def sync_index(self):
+        """
+        Apply calendar changes since the last sync token to the state store.
+
+        Falls back to a full resync if the sync token has expired.
+        """
+        token = self.store.get_meta(self.calendar_id, "syncToken")
+        if token is None:
+            return self.resync_index()
+        try:
+            return self.apply_changes(syncToken=token)
+        except Exception as err:
+            if utils.http_status(err) != 410:
+                raise
+            self.logger.info("GET /%s 410 GONE", self.calendar_id)
+            return self.resync_index()
 
-    def sync(self, page, **kwargs):
+    def resync_index(self):
+        """
+        Replace calendar state with a full listing.
+        """
+        self.store.clear(self.calendar_id)
+        return self.apply_changes()
+
+    def apply_changes(self, **kwargs):
+        """
+        Apply pages of calendar changes to the state store.
+        """
+        kwargs.update(fields=INDEX_FIELDS, maxResults=MAX_RESULTS, singleEvents=True)
+        pages = utils.paginate(self.fetch_events, self.cursor, kwargs, self.prefetch)
+        for response in pages:
+            records = []
+            deleted = []
+            for event in response.get("items") or []:
+                private = event.get("extendedProperties", {}).get("private", {})
+                if event.get("status") == "cancelled" or "facebookId" not in private:
+                    deleted.append(event["id"])
+                else:
+                    records.append(self.record(event))
+            self.store.update(self.calendar_id, records, deleted)
+        token = response.get("nextSyncToken")
+        self.store.update(self.calendar_id, syncToken=token, reconciledAt=time.time())
+        return token
+
+    @staticmethod
+    def record(event):
+        """
+        Get state record of a calendar event.
+        """
+        private = event["extendedProperties"]["private"]
+        start = event.get("start", {}).get("dateTime")
+        end = event.get("end", {}).get("dateTime")
+        return {
+            "google_id": event["id"],
+            "facebook_id": private["facebookId"],
+            "page_id": private.get("facebookPageId"),
+            "parent_id": private.get("facebookParentId"),
+            "digest": private.get("facebookDigest"),
+            "start": start and utils.to_utc(start),
+            "end": end and utils.to_utc(end),
+        }
+
+    def sync(self, page, probe=True, window=None, **kwargs):
         """
         Get GoogleSyncFuture instance.
+
+        With `probe=False`, calendar events missing from the page listing
+        are deleted without checking that they were deleted on facebook.
+        A `TimeWindow` restricts both the page listing and the calendar
+        events considered.
+        """
+        request = page.get_events(window=window, **kwargs)
+        return GoogleSyncFuture(request, page, self, probe, window)
+
+    def sync_pipelined(
+        self, page, probe=True, window=None, depth=PIPELINE_DEPTH, **kwargs
+    ):
+        """
+        Get GooglePipelineSyncFuture instance.
+
+        Like `sync`, but writes start while facebook events are still being
+        listed. The calendar events considered are those of `window`, or of
+        the window of `time_filter`, which may be listed concurrently.
+        """
+        request = page.get_events(window=window, **kwargs)
+        window = window or TimeWindow.from_time_filter(kwargs.get("time_filter"))
+        return GooglePipelineSyncFuture(request, page, self, probe, window, depth)
+
+    def sync_slices(self, page, probe=True, window=None, span=SLICE_SPAN):
+        """
+        Get GoogleSliceSyncFuture instance.
+
+        Like `sync`, but the window is synced in consecutive slices of
+        `span` so that memory use does not grow with the size of the page.
+        """
+        return GoogleSliceSyncFuture(page, self, probe, window, span)
+
+    def sync_events(self, page, ids, removed=()):
+        """
+        Get GoogleSyncFuture of only the given facebook events.
+
+        Events are fetched by ID, except those known to be `removed`, and
+        only their calendar events are created, updated or deleted. Calendar
+        events of occurrences of recurring events are found by their parent
+        ID, so occurrences dropped from an event, or of a removed event, are
+        deleted too.
+
+        :param object page: FacebookPage instance
+        :param list ids: IDs of changed facebook events
+        :param list removed: IDs of facebook events removed from the page
         """
-        return GoogleSyncFuture(page.get_events(**kwargs), page, self)
+        objects = page.get_objects([x for x in ids if x not in removed]).request
+        request = utils.Future(y for x in objects for y in page.explode_event(x))
+        return GoogleSyncFuture(request, page, self, probe=False, ids=ids)
 
 
 class GoogleSyncFuture:
     """
     FacebookPage => GoogleCalendar sync future.
+
+    :param object request: future of facebook events
+    :param object page: FacebookPage instance
+    :param object calendar: GoogleCalendar instance
+    :param bool probe: check missing events still exist before deleting
+    :param object window: TimeWindow of calendar events to sync (optional)
+    :param list ids: facebook IDs of the only calendar events to sync (optional)
+    :param bool resolve: look up calendar events of facebook events missing
+        from the time-bounded index by ID, at any time
     """
 
-    def __init__(self, request, page, calendar):
+    def __init__(
+        self,
+        request,
+        page,
+        calendar,
+        probe=True,
+        window=None,
+        ids=None,
+        resolve=False,
+    ):
         self.request = request
         self.page = page
         self.calendar = calendar
+        self.probe = probe
+        self.window = window
+        self.ids = ids
+        self.resolve = resolve
         self.requests = {"POST": {}, "PUT": {}, "DELETE": {}}
         self.responses = {"POST": {}, "PUT": {}, "DELETE": {}}
+        self.errors = {"POST": {}, "PUT": {}, "DELETE": {}}
+        self.digests = {}
 
     def callbackgen(self, verb):
         """
-        Generate callback function to collect responses.
+        Generate callback function to collect responses and errors.
         """
 
-        def callback(_, res, err):
+        def callback(facebook_id, res, err):
             if err:
-                raise err
-            facebook_id = res["extendedProperties"]["private"]["facebookId"]
-            self.responses[verb][facebook_id] = res
+                self.errors[verb][facebook_id] = err
+            else:
+                self.errors[verb].pop(facebook_id, None)
+                self.responses[verb][facebook_id] = res
 
         return callback
 
-    def batchgen(self, method, verb):
+    def batchgen(self, method, verb, requests):
         """
-        Generate batched requests with callback.
+        Get batched requests with callback.
         """
-        requests = self.requests[verb]
-        if any(requests):
-            count = 0
-            batch = self.calendar.batch(self.callbackgen(verb))
-            for req in requests.values():
-                self.calendar.logger.info(
+        batch = self.calendar.batch(self.callbackgen(verb))
+        debug = self.calendar.logger.isEnabledFor(logging.DEBUG)
+        for facebook_id, req in requests.items():
+            if debug:
+                self.calendar.logger.debug(
                     "%s /%s/events/%s", verb, req["calendarId"], req.get("eventId", "")
                 )
-                batch.add(method(**req))
-                count += 1
-                if count == MAX_BATCH_REQUESTS:
-                    count = 0
-                    yield batch
-                    batch = self.calendar.batch(self.callbackgen(verb))
-            yield batch
-
-    def execbatch(self, method, verb, dryrun=False):
-        """
-        Execute batches.
-        """
-        batches = self.batchgen(method, verb)
-        for batch in batches:
-            if dryrun:  # pragma: no cover
-                # pylint: disable=protected-access
-                for req in batch._requests.values():
-                    body = json.loads(req.body)
-                    fid = body["extendedProperties"]["private"]["facebookId"]
-                    self.responses[verb][fid] = body
+            batch.add(method(**req), request_id=facebook_id)
+        return batch
+
+    def runbatch(self, method, verb, requests, dryrun=False):
+        """
+        Execute a single batch and report its outcome to the controller.
+
+        A transient error of the batch request itself is recorded as the
+        error of each of its sub-requests, so they are retried like failed
+        sub-requests, and the batch is reported as rate-limited.
+        """
+        batch = self.batchgen(method, verb, requests)
+        self.calendar.metrics.observe("batch_size", len(requests), verb=verb)
+        if dryrun:  # pragma: no cover
+            # pylint: disable=protected-access
+            for fid, req in batch._requests.items():
+                self.responses[verb][fid] = json.loads(req.body or "{}")
+        else:
+            # Calendar API counts each request of a batch against quotas
+            self.calendar.throttle(len(requests))
+            start = time.monotonic()
+            try:
+                with self.calendar.metrics.span(
+                    "api_request", api="calendar", endpoint="batch"
+                ):
+                    batch.execute()
+            except Exception as err:  # pylint: disable=broad-except
+                if not retryable(err):
+                    raise
+                self.calendar.logger.warning("BATCH %s FAILED %s", verb, err)
+                self.errors[verb].update((x, err) for x in requests)
+                limited = True
             else:
-                batch.execute()
+                errors = [self.errors[verb].get(x) for x in requests]
+                limited = any(throttled(x) for x in errors if x is not None)
+            latency = time.monotonic() - start
+            self.calendar.controller.record(latency, limited)
+
+    def dispatch(self, method, verb, requests, dryrun=False):
+        """
+        Execute batches concurrently, sized by the calendar's controller.
+        """
+        controller = self.calendar.controller
+        items = iter(requests.items())
+        inflight = set()
+        with ThreadPoolExecutor(controller.max_concurrency) as executor:
+            while True:
+                while len(inflight) < controller.concurrency:
+                    chunk = dict(islice(items, controller.size))
+                    if not chunk:
+                        break
+                    future = executor.submit(self.runbatch, method, verb, chunk, dryrun)
+                    inflight.add(future)
+                if not inflight:
+                    break
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+
+    def execbatch(self, method, verb, dryrun=False, requests=None):
+        """
+        Execute batches of planned requests, or of a subset of them.
+
+        Sub-requests that fail with a transient error are regrouped into new
+        batches and retried with backoff. Permanent failures are collected
+        in `errors`.
+        """
+        requests = self.requests[verb] if requests is None else requests
+        facebook_ids = list(requests)
+        for attempt in range(self.calendar.retries + 1):
+            self.dispatch(method, verb, requests, dryrun)
+
+            # Regroup transient failures
+            errors = self.errors[verb]
+            requests = {
+                x: req
+                for x, req in requests.items()
+                if x in errors and retryable(errors[x])
+            }
+            if not requests or attempt == self.calendar.retries:
+                break
+            self.calendar.logger.info("RETRY %s x %d", verb, len(requests))
+            self.calendar.metrics.increment(
+                "retries_total", len(requests), api="calendar", verb=verb
+            )
+            time.sleep(utils.backoff(attempt))
+
+        # Log permanent failures
+        failed = 0
+        for facebook_id in facebook_ids:
+            err = self.errors[verb].get(facebook_id)
+            if err is not None:
+                failed += 1
+                self.calendar.logger.error("%s %s FAILED %s", verb, facebook_id, err)
+        executed = len(facebook_ids) - failed
+        if facebook_ids:
+            self.calendar.logger.info("%s x %d", verb, executed)
+        metrics = self.calendar.metrics
+        metrics.increment("requests_executed_total", executed, verb=verb, status="ok")
+        metrics.increment("requests_executed_total", failed, verb=verb, status="error")
 
     def execute(self, dryrun=False):
         """
@@ -125,57 +542,161 @@ class GoogleSyncFuture:
         """
         # Get facebook events
         facebook_events = {x["id"]: x for x in self.request.execute()}
-        if not any(facebook_events):
+        if not any(facebook_events) and self.window is None and self.ids is None:
             self.calendar.logger.info("NO-OP")
             return self
 
         # Get Google Calendar events
-        start_times = [
-            x["start_time"] for x in facebook_events.values() if "start_time" in x
-        ]
-        end_times = [x["end_time"] for x in facebook_events.values() if "end_time" in x]
-        google_events = {
-            x["extendedProperties"]["private"]["facebookId"]: {
-                "digest": x["extendedProperties"]["private"]["facebookDigest"],
-                "google_id": x["id"],
-            }
-            for x in self.calendar.iter_events(
-                timeMin=min(start_times + end_times),
-                timeMax=max(start_times + end_times),
-                singleEvents=True,
-                privateExtendedProperty=f"facebookPageId={self.page.id}",
-            )
-        }
+        if self.ids is None:
+            time_min, time_max = self.bounds(facebook_events.values())
+            google_events = self.index(time_min, time_max)
+            if self.resolve:
+                unindexed = [x for x in facebook_events if x not in google_events]
+                google_events.update(self.lookup(unindexed))
+        else:
+            ids = {*self.ids, *facebook_events}
+            google_events = self.index(facebook_ids=ids, parent_ids=set(self.ids))
 
         # Get create/update/delete request payloads
         for facebook_id, event in facebook_events.items():
-            digest = utils.digest(event)
-            if facebook_id not in google_events:
-                self.requests["POST"][facebook_id] = {
-                    "calendarId": self.calendar.calendar_id,
-                    "body": self.page.to_google(event),
-                }
-
-            elif digest != google_events[facebook_id]["digest"]:
-                self.requests["PUT"][facebook_id] = {
-                    "calendarId": self.calendar.calendar_id,
-                    "eventId": google_events[facebook_id]["google_id"],
-                    "body": self.page.to_google(event),
-                }
-        found_req = self.page.get_objects(list(google_events))
-        found_ids = {x["id"] for x in found_req.execute()}
-        for facebook_id in google_events.keys() - found_ids:
+            self.plan(facebook_id, event, google_events)
+        missing = [x for x in google_events if x not in facebook_events]
+        self.plan_deletes(missing, google_events)
+
+        # Execute batched requests, recording writes in state store even if
+        # a batch failed
+        events = self.calendar.events()
+        try:
+            self.execbatch(events.insert, "POST", dryrun)
+            self.execbatch(events.update, "PUT", dryrun)
+            self.execbatch(events.delete, "DELETE", dryrun)
+        finally:
+            if not dryrun:
+                self.save_index()
+        return self
+
+    def index(self, *args, **kwargs):
+        """
+        Get digest, Google ID & start of the page's calendar events by
+        facebook ID.
+
+        Arguments are passed to `GoogleCalendar.iter_index`.
+        """
+        return self.entries(self.calendar.iter_index(self.page.id, *args, **kwargs))
+
+    def lookup(self, facebook_ids):
+        """
+        Get index entries of the calendar events of facebook events, at any
+        time.
+
+        Without a state store, events are listed by ID, or the whole page's
+        events are listed once if there are more than `MAX_LOOKUPS` of them.
+        """
+        if not facebook_ids:
+            return {}
+        if self.calendar.store is None and len(facebook_ids) > MAX_LOOKUPS:
+            ids = set(facebook_ids)
+            records = self.calendar.iter_index(self.page.id)
+            return self.entries(x for x in records if x["facebook_id"] in ids)
+        return self.entries(
+            self.calendar.iter_index(self.page.id, facebook_ids=facebook_ids)
+        )
+
+    @staticmethod
+    def entries(records):
+        """
+        Get index entries of calendar event records by facebook ID.
+        """
+        return {
+            x["facebook_id"]: {
+                "digest": x["digest"],
+                "google_id": x["google_id"],
+                "start": x["start"],
+            }
+            for x in records
+        }
+
+    def plan(self, facebook_id, event, google_events):
+        """
+        Plan create/update request of a facebook event, if needed.
+
+        Returns the verb of the planned request, or None.
+        """
+        digest = self.digests[facebook_id] = self.page.digest(event)
+        if facebook_id not in google_events:
+            self.requests["POST"][facebook_id] = {
+                "calendarId": self.calendar.calendar_id,
+                "body": self.page.to_google(event, digest),
+            }
+            self.calendar.metrics.increment("requests_planned_total", verb="POST")
+            return "POST"
+        if not self.page.digest_matches(
+            event, google_events[facebook_id]["digest"], digest
+        ):
+            self.requests["PUT"][facebook_id] = {
+                "calendarId": self.calendar.calendar_id,
+                "eventId": google_events[facebook_id]["google_id"],
+                "body": self.page.to_google(event, digest),
+            }
+            self.calendar.metrics.increment("requests_planned_total", verb="PUT")
+            return "PUT"
+        return None
+
+    def plan_deletes(self, missing, google_events):
+        """
+        Plan delete requests of events missing from the facebook listing.
+
+        Unless `probe` is false, only those no longer found on facebook are
+        deleted. Returns the facebook IDs of the planned requests.
+        """
+        if self.probe and missing:
+            found_req = self.page.get_objects(missing, fields="id")
+            found_ids = {x["id"] for x in found_req.execute()}
+            missing = [x for x in missing if x not in found_ids]
+        for facebook_id in missing:
             self.requests["DELETE"][facebook_id] = {
                 "calendarId": self.calendar.calendar_id,
                 "eventId": google_events[facebook_id]["google_id"],
             }
+        self.calendar.metrics.increment(
+            "requests_planned_total", len(missing), verb="DELETE"
+        )
+        return missing
 
-        # Execute batched requests
-        events = self.calendar.events()
-        self.execbatch(events.insert, "POST", dryrun)
-        self.execbatch(events.update, "PUT", dryrun)
-        self.execbatch(events.delete, "DELETE", dryrun)
-        return self
+    def bounds(self, facebook_events):
+        """
+        Get time bounds of calendar events to sync.
+
+        Bounds of the sync window are used where set, otherwise the
+        earliest/latest times of the facebook events.
+        """
+        times = [
+            x[key]
+            for x in facebook_events
+            for key in ("start_time", "end_time")
+            if key in x
+        ]
+        time_min, time_max = min(times, default=None), max(times, default=None)
+        if self.window is not None:
+            since, until = self.window.bounds()
+            time_min = since or time_min
+            time_max = until or time_max
+        return time_min, time_max
+
+    def save_index(self):
+        """
+        Record executed writes in the calendar's state store, if any.
+        """
+        if self.calendar.store is not None:
+            records = [
+                self.calendar.record(res)
+                for verb in ("POST", "PUT")
+                for res in self.responses[verb].values()
+            ]
+            deleted = [
+                self.requests["DELETE"][x]["eventId"] for x in self.responses["DELETE"]
+            ]
+            self.calendar.store.update(self.calendar.calendar_id, records, deleted)
 
     def filter(self, func):
         """
@@ -183,3 +704,233 @@ class GoogleSyncFuture:
         """
         self.request = self.request.filter(func)
         return self
+
+
+class GooglePipelineSyncFuture(GoogleSyncFuture):
+    """
+    FacebookPage => GoogleCalendar sync future with pipelined stages.
+
+    The calendar events of the window are listed concurrently with the
+    first pages of facebook events. Facebook events are then planned as
+    their pages arrive, and planned requests are handed to a writer thread
+    through a bounded queue of `depth` requests. The writer executes a batch
+    whenever one is full, so reads and writes overlap. Deletions are planned
+    once the facebook listing is complete.
+
+    The calendar listing completes before the writer starts, but the writer
+    executes batches over the calendar's `BatchController`, concurrently
+    unless its `max_concurrency` is 1. Only then are Calendar API requests
+    never made from two threads at once; otherwise the calendar client needs
+    a thread-safe transport, e.g. `fest.transport.Transport`.
+
+    :param object request: future of facebook events
+    :param object page: FacebookPage instance
+    :param object calendar: GoogleCalendar instance
+    :param bool probe: check missing events still exist before deleting
+    :param object window: TimeWindow of calendar events to sync
+    :param int depth: maximum number of planned requests awaiting a writer
+    """
+
+    def __init__(
+        self, request, page, calendar, probe=True, window=None, depth=PIPELINE_DEPTH
+    ):
+        super().__init__(request, page, calendar, probe, window or TimeWindow())
+        self.depth = depth
+
+    def execute(self, dryrun=False):
+        """
+        Execute sync future.
+        """
+        planned = queue.Queue(self.depth)
+        try:
+            with ThreadPoolExecutor(2) as executor:
+                # List calendar events while the facebook listing starts
+                index = executor.submit(self.index, *self.window.bounds())
+                events = iter(self.request)
+                first = list(islice(events, 1))
+                google_events = index.result()
+
+                # Plan requests for the writer as facebook events arrive
+                writer = executor.submit(self.write, planned, dryrun)
+                try:
+                    seen = set()
+                    for event in chain(first, events):
+                        # Events may be listed again on a later cursor page
+                        if event["id"] in seen:
+                            continue
+                        seen.add(event["id"])
+                        verb = self.plan(event["id"], event, google_events)
+                        if verb is not None:
+                            planned.put((verb, event["id"]))
+                    missing = [x for x in google_events if x not in seen]
+                    for facebook_id in self.plan_deletes(missing, google_events):
+                        planned.put(("DELETE", facebook_id))
+                finally:
+                    planned.put(None)
+                writer.result()
+        finally:
+            # Record writes in state store, even if a batch failed
+            if not dryrun:
+                self.save_index()
+        return self
+
+    def write(self, planned, dryrun=False):
+        """
+        Execute batches of planned requests as they are queued.
+
+        Requests are batched by verb and remaining requests are executed
+        once the queue is closed with `None`.
+        """
+        events = self.calendar.events()
+        methods = {"POST": events.insert, "PUT": events.update, "DELETE": events.delete}
+        chunks = {verb: {} for verb in methods}
+        try:
+            for verb, facebook_id in iter(planned.get, None):
+                chunk = chunks[verb]
+                chunk[facebook_id] = self.requests[verb][facebook_id]
+                if len(chunk) >= self.calendar.controller.size:
+                    self.execbatch(methods[verb], verb, dryrun, chunk)
+                    chunks[verb] = {}
+        except BaseException:
+            # Unblock the planner before failing
+            for _ in iter(planned.get, None):
+                pass
+            raise
+        for verb, chunk in chunks.items():
+            if chunk:
+                self.execbatch(methods[verb], verb, dryrun, chunk)
+
+
+class SliceSyncFuture(GoogleSyncFuture):
+    """
+    Sync future of a single slice of a GoogleSliceSyncFuture.
+
+    Calendar events of facebook events missing from the slice's index are
+    looked up by ID, so events moved from another slice are updated rather
+    than created again. Only calendar events starting in the slice, whose
+    facebook event no slice has listed, are deleted, so events lasting past
+    their slice are kept.
+
+    :param object request: future of facebook events
+    :param object page: FacebookPage instance
+    :param object calendar: GoogleCalendar instance
+    :param bool probe: check missing events still exist before deleting
+    :param object window: TimeWindow of the slice
+    :param set listed: IDs of facebook events listed by slices so far
+    """
+
+    def __init__(self, request, page, calendar, probe, window, listed):
+        super().__init__(request, page, calendar, probe, window, resolve=True)
+        self.listed = listed
+
+    def plan_deletes(self, missing, google_events):
+        since, until = (utils.to_utc(x) for x in self.window.bounds())
+        missing = [
+            x
+            for x in missing
+            if x not in self.listed
+            and google_events[x]["start"]
+            and since <= google_events[x]["start"] < until
+        ]
+        return super().plan_deletes(missing, google_events)
+
+
+class GoogleSliceSyncFuture:
+    """
+    FacebookPage => GoogleCalendar sync future over consecutive time slices.
+
+    The sync window is split into slices of `span`, from the earliest to
+    the latest event on either side, and each slice is synced in turn by a
+    SliceSyncFuture. Only one slice of events, index records and requests
+    is held in memory at a time, so only counts of responses, and the IDs
+    of listed facebook events, are kept.
+
+    :param object page: FacebookPage instance
+    :param object calendar: GoogleCalendar instance
+    :param bool probe: check missing events still exist before deleting
+    :param object window: TimeWindow of calendar events to sync (optional)
+    :param timedelta span: duration of each slice
+    """
+
+    def __init__(self, page, calendar, probe=True, window=None, span=SLICE_SPAN):
+        self.page = page
+        self.calendar = calendar
+        self.probe = probe
+        self.window = window or TimeWindow()
+        self.span = span
+        self.counts = {"POST": 0, "PUT": 0, "DELETE": 0}
+        self.errors = {"POST": {}, "PUT": {}, "DELETE": {}}
+        self.digests = None
+        self.listed = set()
+
+    def execute(self, dryrun=False):
+        """
+        Execute sync of each slice.
+        """
+        for window in self.slices():
+            request = self.page.get_events(window=window)
+            sync = SliceSyncFuture(
+                request, self.page, self.calendar, self.probe, window, self.listed
+            )
+            sync.execute(dryrun=dryrun)
+            self.listed.update(sync.digests)
+            for verb, responses in sync.responses.items():
+                self.counts[verb] += len(responses)
+                self.errors[verb].update(sync.errors[verb])
+            self.digests = utils.canonical_digest(
+                [self.digests, sorted(sync.digests.items())]
+            )
+        return self
+
+    def slices(self):
+        """
+        Yield TimeWindows of consecutive slices of the sync window.
+        """
+        since, until = self.extent()
+        while since is not None and since < until:
+            yield TimeWindow(
+                since, min(since + self.span, until), self.window.predicates
+            )
+            since += self.span
+
+    def extent(self):
+        """
+        Get bounds of slices, covering every event on either side.
+
+        Returns `(None, None)` if there are no events.
+        """
+        since = until = None
+        for start, end in self.iter_times():
+            since = start if since is None else min(since, start)
+            until = end if until is None else max(until, end)
+        if since is None:
+            return None, None
+
+        # Widen bounds to include instant events, within the window
+        since -= timedelta(seconds=1)
+        until += timedelta(seconds=1)
+        if self.window.since is not None:
+            since = max(since, self.window.since)
+        if self.window.until is not None:
+            until = min(until, self.window.until)
+        return since, until
+
+    def iter_times(self):
+        """
+        Yield `(start, end)` datetimes of events on either side.
+
+        Both sides are streamed, with facebook events fetched with their
+        times only.
+        """
+        events = self.page.iter_events(
+            window=self.window,
+            fields="start_time,end_time,event_times",
+        )
+        records = self.calendar.iter_index(self.page.id, *self.window.bounds())
+        times = chain(
+            ((x.get("start_time"), x.get("end_time")) for x in events),
+            ((x["start"], x["end"]) for x in records),
+        )
+        for start, end in times:
+            if start:
+                yield utils.parse_datetime(start), utils.parse_datetime(end or start)
@@ -0,0 +1,216 @@
+"""
+Sync groups
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from fest import utils
+from fest.facebook import FacebookPage
+from fest.facebook import FacebookPageGroup
+from fest.google import BatchController
+from fest.google import GoogleCalendar
+from fest.google import GoogleSyncFuture
+
+MAX_WORKERS = 8
+
+
+class SyncGroup:
+    """
+    Group of FacebookPage => GoogleCalendar syncs sharing API clients.
+
+    Each pair is either a dict with `page_id`, `calendar_id` and an
+    optional `time_filter`, or a `(page_id, calendar_id[, time_filter])`
+    sequence.
+
+    The clients are shared by up to `max_workers` threads, so they must be
+    built over a thread-safe transport, e.g. `fest.transport.Transport`;
+    the default Graph API and `httplib2` transports are not. Otherwise use
+    `max_workers=1`.
+
+    :param object graphapi: GraphAPI client
+    :param object calendarapi: Google Calendar API client
+    :param list pairs: page/calendar pairs to sync
+    :param int max_workers: maximum number of concurrent syncs
+    :param object store: state store shared by calendars (optional)
+    :param int reconcile_interval: seconds between store/API reconciliations
+    :param object controller: BatchController shared by calendars (optional)
+    :param bool batch_pages: fetch page events with GraphAPI batch requests
+    :param object metrics: metrics sink shared by pages & calendars (optional)
+    :param object graph_limiter: RateLimiter shared by pages (optional)
+    :param object calendar_limiter: RateLimiter shared by calendars (optional)
+    """
+
+    def __init__(
+        self,
+        graphapi,
+        calendarapi,
+        pairs,
+        max_workers=MAX_WORKERS,
+        store=None,
+        reconcile_interval=None,
+        controller=None,
+        batch_pages=False,
+        metrics=None,
+        graph_limiter=None,
+        calendar_limiter=None,
+    ):
+        self.graphapi = graphapi
+        self.calendarapi = calendarapi
+        self.pairs = [self.pair(x) for x in pairs]
+        self.max_workers = max_workers
+        self.store = store
+        self.reconcile_interval = reconcile_interval
+        self.controller = controller or BatchController()
+        self.batch_pages = batch_pages
+        self.metrics = metrics
+        self.graph_limiter = graph_limiter
+        self.calendar_limiter = calendar_limiter
+        self.logger = utils.logger(self)
+
+    @staticmethod
+    def pair(config):
+        """
+        Normalize sync pair config to a dict.
+        """
+        try:
+            return {
+                "page_id": config["page_id"],
+                "calendar_id": config["calendar_id"],
+                "time_filter": config.get("time_filter"),
+            }
+        except TypeError:
+            page_id, calendar_id, *time_filter = config
+            return {
+                "page_id": page_id,
+                "calendar_id": calendar_id,
+                "time_filter": next(iter(time_filter), None),
+            }
+
+    def page(self, page_id):
+        """
+        Get FacebookPage sharing the group's client, metrics & rate limiter.
+        """
+        return FacebookPage(
+            self.graphapi,
+            page_id,
+            metrics=self.metrics,
+            limiter=self.graph_limiter,
+        )
+
+    def execute(self, dryrun=False, pairs=None):
+        """
+        Execute syncs over a bounded worker pool.
+
+        Returns one result per pair, in the order given. A failed sync is
+        reported in its result's `error` and does not stop the others;
+        writes that failed permanently are reported in `errors`, by verb &
+        facebook ID.
+
+        :param bool dryrun: plan syncs without writing to calendars
+        :param list pairs: subset of pairs to sync (default all)
+        """
+        pairs = self.pairs if pairs is None else [self.pair(x) for x in pairs]
+        prefetched = self.prefetch(pairs) if self.batch_pages else {}
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self.sync,
+                    dryrun=dryrun,
+                    prefetched=prefetched.get((pair["page_id"], pair["time_filter"])),
+                    **pair,
+                )
+                for pair in pairs
+            ]
+        return [future.result() for future in futures]
+
+    def prefetch(self, pairs):
+        """
+        Fetch events of every pair's page with GraphAPI batch requests.
+
+        Returns `(events, error)` keyed by `(page_id, time_filter)`. If a
+        batch request fails outright, pages are fetched individually.
+
+        :param list pairs: normalized pairs to prefetch
+        """
+        prefetched = {}
+        time_filters = dict.fromkeys(x["time_filter"] for x in pairs)
+        for time_filter in time_filters:
+            page_ids = dict.fromkeys(
+                x["page_id"] for x in pairs if x["time_filter"] == time_filter
+            )
+            pages = [self.page(x) for x in page_ids]
+            kwargs = {} if time_filter is None else {"time_filter": time_filter}
+            group = FacebookPageGroup(self.graphapi, pages, self.graph_limiter)
+            try:
+                events, errors = group.fetch(**kwargs)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("POST / (batch) FAILED")
+                continue
+            for page_id in page_ids:
+                prefetched[page_id, time_filter] = (
+                    events[page_id],
+                    errors.get(page_id),
+                )
+        return prefetched
+
+    def sync(
+        self,
+        page_id,
+        calendar_id,
+        time_filter=None,
+        dryrun=False,
+        prefetched=None,
+        ids=None,
+        removed=(),
+    ):
+        """
+        Sync a single page/calendar pair and capture its result.
+
+        If `ids` are given, only those facebook events are synced, see
+        `GoogleCalendar.sync_events`.
+        """
+        result = {
+            "page_id": page_id,
+            "calendar_id": calendar_id,
+            "time_filter": time_filter,
+            "responses": None,
+            "digests": None,
+            "errors": None,
+            "error": None,
+        }
+        try:
+            page = self.page(page_id)
+            gcal = GoogleCalendar(
+                self.calendarapi,
+                calendar_id,
+                store=self.store,
+                reconcile_interval=self.reconcile_interval,
+                controller=self.controller,
+                metrics=self.metrics,
+                limiter=self.calendar_limiter,
+            )
+            kwargs = {} if time_filter is None else {"time_filter": time_filter}
+            if ids is not None:
+                sync = gcal.sync_events(page, ids, removed)
+            elif prefetched is None:
+                sync = gcal.sync(page, **kwargs)
+            else:
+                events = FacebookPageGroup.iter_results(*prefetched)
+                sync = GoogleSyncFuture(utils.Future(events), page, gcal)
+            sync = sync.execute(dryrun=dryrun)
+            result.update(
+                responses=sync.responses,
+                digests=sync.digests,
+                errors={
+                    verb: {k: repr(v) for k, v in x.items()}
+                    for verb, x in sync.errors.items()
+                },
+            )
+            failed = sum(len(x) for x in sync.errors.values())
+            if failed:
+                self.logger.error(
+                    "%s => %s %d WRITES FAILED", page_id, calendar_id, failed
+                )
+        except Exception as err:  # pylint: disable=broad-except
+            self.logger.exception("%s => %s FAILED", page_id, calendar_id)
+            result.update(error=err)
+        return result
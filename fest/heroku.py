@@ -4,36 +4,186 @@ Heroku app
 import json
 import logging
 import os
-
-import facebook
-from google.oauth2 import service_account  # pylint: disable=no-name-in-module
-from googleapiclient import discovery
+from functools import lru_cache
 
 import fest
+from fest import state
+from fest.daemon import Daemon
+from fest.google import BatchController
+from fest.metrics import PrometheusSink
+from fest.ratelimit import RateLimiter
+from fest.ratelimit import open_backend
+from fest.webhook import Webhook
+
+FACEBOOK_PAGE_ID = os.environ.get("FACEBOOK_PAGE_ID")
+GOOGLE_CALENDAR_ID = os.environ.get("GOOGLE_CALENDAR_ID")
+FEST_SYNC_GROUP = json.loads(os.environ.get("FEST_SYNC_GROUP") or "[]")
+FEST_MAX_WORKERS = os.environ.get("FEST_MAX_WORKERS")
+FEST_STATE_PATH = os.environ.get("FEST_STATE_PATH")
+FEST_BATCH_PAGES = os.environ.get("FEST_BATCH_PAGES")
+FEST_RECONCILE_INTERVAL = os.environ.get("FEST_RECONCILE_INTERVAL")
+FEST_MAX_BATCHES = os.environ.get("FEST_MAX_BATCHES")
+FEST_DISCOVERY_PATH = os.environ.get("FEST_DISCOVERY_PATH")
+FEST_INTERVAL = os.environ.get("FEST_INTERVAL")
+FEST_MIN_INTERVAL = os.environ.get("FEST_MIN_INTERVAL")
+FEST_MAX_INTERVAL = os.environ.get("FEST_MAX_INTERVAL")
+FEST_WEBHOOK_DELAY = os.environ.get("FEST_WEBHOOK_DELAY")
+FEST_CASSETTE = os.environ.get("FEST_CASSETTE")
+FEST_METRICS_PATH = os.environ.get("FEST_METRICS_PATH")
+FEST_GRAPH_RATE = os.environ.get("FEST_GRAPH_RATE")
+FEST_CALENDAR_RATE = os.environ.get("FEST_CALENDAR_RATE")
+FEST_RATELIMIT_PATH = os.environ.get("FEST_RATELIMIT_PATH")
+PORT = os.environ.get("PORT")
+
+# Size connection pools to the number of workers
+POOL_SIZE = int(FEST_MAX_WORKERS or fest.group.MAX_WORKERS)
 
-FACEBOOK_PAGE_ID = os.environ["FACEBOOK_PAGE_ID"]
-GOOGLE_CALENDAR_ID = os.environ["GOOGLE_CALENDAR_ID"]
-
-# Get facebook/Google secrets
-FACEBOOK_PAGE_TOKEN = os.environ["FACEBOOK_PAGE_TOKEN"]
-GOOGLE_SERVICE_ACCOUNT = json.loads(os.environ["GOOGLE_SERVICE_ACCOUNT"])
-GOOGLE_CREDENTIALS = service_account.Credentials.from_service_account_info(
-    GOOGLE_SERVICE_ACCOUNT
-)
-
-# Get facebook/Google clients
-GRAPHAPI = facebook.GraphAPI(FACEBOOK_PAGE_TOKEN)
-CALENDARAPI = discovery.build(
-    "calendar",
-    "v3",
-    cache_discovery=False,
-    credentials=GOOGLE_CREDENTIALS,
-)
+# Pooled transports are thread-safe, so batches may run concurrently
+CONTROLLER = BatchController(max_concurrency=int(FEST_MAX_BATCHES or 1))
+
+# Reconcile sync state store with Calendar API on this schedule
+RECONCILE_INTERVAL = int(FEST_RECONCILE_INTERVAL) if FEST_RECONCILE_INTERVAL else None
 
 # Configure logging
 logging.basicConfig(format="%(name)s - %(levelname)s - %(message)s")
 
 
+@lru_cache(maxsize=None)
+def graphapi():
+    """
+    Get GraphAPI client, built on first use.
+    """
+    # pylint: disable=import-outside-toplevel
+    from fest.transport import Transport
+
+    token = os.environ["FACEBOOK_PAGE_TOKEN"]
+    http = Transport(
+        pool_size=POOL_SIZE,
+        adapter=adapter(),
+        metrics=metrics(),
+        limiter=graph_limiter(),
+    )
+    return http.graphapi(token)
+
+
+@lru_cache(maxsize=None)
+def calendarapi():
+    """
+    Get Google Calendar API client, built on first use.
+    """
+    # pylint: disable=import-outside-toplevel,no-name-in-module
+    from google.oauth2 import service_account
+
+    from fest.transport import Transport
+
+    info = json.loads(os.environ["GOOGLE_SERVICE_ACCOUNT"])
+    credentials = service_account.Credentials.from_service_account_info(info)
+    http = Transport.authorized(
+        credentials,
+        pool_size=POOL_SIZE,
+        adapter=adapter(),
+        metrics=metrics(),
+    )
+    return http.calendarapi(FEST_DISCOVERY_PATH)
+
+
+@lru_cache(maxsize=None)
+def cassette():
+    """
+    Get cassette recording API requests, opened on first use.
+    """
+    # pylint: disable=import-outside-toplevel
+    from fest.cassette import Cassette
+
+    return Cassette(FEST_CASSETTE) if FEST_CASSETTE else None
+
+
+def adapter():
+    """
+    Get transport adapter recording to `FEST_CASSETTE`, if set.
+    """
+    recorder = cassette()
+    if recorder is None:
+        return None
+
+    # pylint: disable=import-outside-toplevel
+    from fest.cassette import RecordingAdapter
+
+    return RecordingAdapter(
+        recorder,
+        pool_connections=POOL_SIZE,
+        pool_maxsize=POOL_SIZE,
+    )
+
+
+@lru_cache(maxsize=None)
+def store():
+    """
+    Get sync state store, opened on first use.
+    """
+    return state.open_store(FEST_STATE_PATH) if FEST_STATE_PATH else None
+
+
+@lru_cache(maxsize=None)
+def graph_limiter():
+    """
+    Get rate limiter of the facebook app's GraphAPI calls, if configured.
+
+    Limiters are shared across processes through `FEST_RATELIMIT_PATH`.
+    """
+    if not FEST_GRAPH_RATE:
+        return None
+    app_id = os.environ.get("FACEBOOK_APP_ID") or "default"
+    return RateLimiter(
+        float(FEST_GRAPH_RATE),
+        name=f"graph:{app_id}",
+        backend=ratelimit_backend(),
+    )
+
+
+@lru_cache(maxsize=None)
+def calendar_limiter():
+    """
+    Get rate limiter of the Google project's Calendar API calls, if configured.
+
+    Limiters are shared across processes through `FEST_RATELIMIT_PATH`.
+    """
+    if not FEST_CALENDAR_RATE:
+        return None
+    info = json.loads(os.environ.get("GOOGLE_SERVICE_ACCOUNT") or "{}")
+    project_id = info.get("project_id") or "default"
+    return RateLimiter(
+        float(FEST_CALENDAR_RATE),
+        name=f"calendar:{project_id}",
+        backend=ratelimit_backend(),
+    )
+
+
+@lru_cache(maxsize=None)
+def ratelimit_backend():
+    """
+    Get backend of rate limiters, opened on first use.
+    """
+    return open_backend(FEST_RATELIMIT_PATH)
+
+
+@lru_cache(maxsize=None)
+def metrics():
+    """
+    Get metrics sink exported to `FEST_METRICS_PATH`, if set.
+    """
+    return PrometheusSink() if FEST_METRICS_PATH else None
+
+
+def export():
+    """
+    Write metrics to `FEST_METRICS_PATH`, if set.
+    """
+    sink = metrics()
+    if sink is not None:
+        sink.write(FEST_METRICS_PATH)
+
+
 def main(page_id=None, cal_id=None, dryrun=False):
     """
     Heroku entrypoint.
@@ -42,17 +192,131 @@ def main(page_id=None, cal_id=None, dryrun=False):
     cal_id = cal_id or GOOGLE_CALENDAR_ID
 
     # Initialize facebook page & Google Calendar
-    page = fest.FacebookPage(GRAPHAPI, page_id)
-    gcal = fest.GoogleCalendar(CALENDARAPI, cal_id)
+    page = fest.FacebookPage(
+        graphapi(),
+        page_id,
+        metrics=metrics(),
+        limiter=graph_limiter(),
+    )
+    gcal = fest.GoogleCalendar(
+        calendarapi(),
+        cal_id,
+        store=store(),
+        reconcile_interval=RECONCILE_INTERVAL,
+        controller=CONTROLLER,
+        metrics=metrics(),
+        limiter=calendar_limiter(),
+    )
     page.logger.setLevel("INFO")
     gcal.logger.setLevel("INFO")
 
     # Sync
     sync = gcal.sync(page, time_filter="upcoming").execute(dryrun=dryrun)
+    export()
+
+    # Return created/updated/deleted objects & failed writes
+    return {
+        "responses": sync.responses,
+        "errors": {
+            verb: {k: repr(v) for k, v in x.items()} for verb, x in sync.errors.items()
+        },
+    }
+
+
+def worker():
+    """
+    Heroku one-shot worker entrypoint.
+
+    Prints the output of the sync, or sync group if `FEST_SYNC_GROUP` is
+    set, and returns a non-zero exit status if any sync or write failed.
+    """
+    if FEST_SYNC_GROUP:
+        output = results = group()
+    else:
+        output = main()
+        results = [output]
+    print(json.dumps(output))
+    failed = any(
+        x.get("error") is not None or any((x["errors"] or {}).values()) for x in results
+    )
+    return 1 if failed else 0
+
+
+def group(pairs=None, dryrun=False, max_workers=None):
+    """
+    Heroku entrypoint for syncing many page/calendar pairs.
+    """
+    sync = sync_group(pairs or FEST_SYNC_GROUP, max_workers)
+
+    # Sync & stringify errors for output
+    results = sync.execute(dryrun=dryrun)
+    export()
+    for result in results:
+        if result["error"] is not None:
+            result["error"] = repr(result["error"])
+    return results
+
+
+def daemon(pairs=None, dryrun=False, max_workers=None):
+    """
+    Heroku entrypoint for scheduling syncs in a long-running process.
+    """
+    default = [(FACEBOOK_PAGE_ID, GOOGLE_CALENDAR_ID, "upcoming")]
+    sync = sync_group(pairs or FEST_SYNC_GROUP or default, max_workers)
 
-    # Return created/updated/deleted objects
-    return sync.responses
+    # Schedule syncs until SIGTERM
+    scheduler = Daemon(
+        sync,
+        interval=float(FEST_INTERVAL or fest.daemon.INTERVAL),
+        min_interval=float(FEST_MIN_INTERVAL or fest.daemon.MIN_INTERVAL),
+        max_interval=float(FEST_MAX_INTERVAL or fest.daemon.MAX_INTERVAL),
+    )
+    scheduler.logger.setLevel("INFO")
+    scheduler.run(dryrun=dryrun)
+
+
+def webhook(pairs=None, dryrun=False, max_workers=None):
+    """
+    Heroku entrypoint for syncing changed events on webhook notifications.
+    """
+    default = [(FACEBOOK_PAGE_ID, GOOGLE_CALENDAR_ID)]
+    sync = sync_group(pairs or FEST_SYNC_GROUP or default, max_workers)
+
+    # Serve webhook until SIGTERM
+    receiver = Webhook(
+        sync,
+        os.environ["FACEBOOK_APP_SECRET"],
+        os.environ["FACEBOOK_VERIFY_TOKEN"],
+        delay=float(FEST_WEBHOOK_DELAY or fest.webhook.DEBOUNCE),
+        dryrun=dryrun,
+    )
+    receiver.logger.setLevel("INFO")
+    receiver.serve(("", int(PORT or fest.webhook.PORT)))
+
+
+def sync_group(pairs, max_workers=None):
+    """
+    Get sync group of pairs sharing clients.
+    """
+    max_workers = max_workers or int(FEST_MAX_WORKERS or fest.group.MAX_WORKERS)
+    sync = fest.SyncGroup(
+        graphapi(),
+        calendarapi(),
+        pairs,
+        max_workers,
+        store(),
+        RECONCILE_INTERVAL,
+        CONTROLLER,
+        batch_pages=bool(FEST_BATCH_PAGES),
+        metrics=metrics(),
+        graph_limiter=graph_limiter(),
+        calendar_limiter=calendar_limiter(),
+    )
+    sync.logger.setLevel("INFO")
+    logging.getLogger("fest.facebook.FacebookPage").setLevel("INFO")
+    logging.getLogger("fest.google.GoogleCalendar").setLevel("INFO")
+    return sync
 
 
 if __name__ == "__main__":
-    print(json.dumps(main()))  # pragma: no cover
+    raise SystemExit(worker())  # pragma: no cover
@@ -0,0 +1,171 @@
+"""
+Metrics & tracing sinks
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PREFIX = "fest_"
+
+
+def labelset(labels):
+    """
+    Get hashable, ordered set of metric labels.
+    """
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class NullSink:
+    """
+    Metrics sink discarding everything.
+
+    Sinks count occurrences with `increment`, record distributions of values
+    (sizes, bytes) with `observe` and time blocks of code with `span`. Every
+    metric may be qualified with labels. Subclass to forward metrics to
+    another system.
+    """
+
+    def increment(self, name, value=1, **labels):
+        """
+        Add value to a counter.
+        """
+
+    def observe(self, name, value, **labels):
+        """
+        Record a value of a distribution.
+        """
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Time a block of code, observed as `<name>_seconds`.
+
+        Blocks raising an error are also counted in `<name>_errors_total`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment(f"{name}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+
+class MemorySink(NullSink):
+    """
+    Thread-safe metrics sink keeping every value in memory, for tests.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.observations = defaultdict(list)
+
+    def increment(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[name, labelset(labels)] += value
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            self.observations[name, labelset(labels)].append(value)
+
+    def count(self, name, **labels):
+        """
+        Get total of a counter over series with all the given labels.
+        """
+        subset = set(labelset(labels))
+        with self.lock:
+            return sum(
+                value
+                for (key, series), value in self.counters.items()
+                if key == name and subset <= set(series)
+            )
+
+    def values(self, name, **labels):
+        """
+        Get observed values over series with all the given labels.
+        """
+        subset = set(labelset(labels))
+        with self.lock:
+            return [
+                value
+                for (key, series), values in self.observations.items()
+                if key == name and subset <= set(series)
+                for value in values
+            ]
+
+
+class PrometheusSink(NullSink):
+    """
+    Thread-safe metrics sink exporting the Prometheus text format.
+
+    Counters are exported as counters and distributions as summaries of
+    their count & sum, so memory use does not grow with the number of
+    observations.
+
+    :param str prefix: prefix of exported metric names
+    """
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.summaries = defaultdict(lambda: [0, 0.0])
+
+    def increment(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[name, labelset(labels)] += value
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            summary = self.summaries[name, labelset(labels)]
+            summary[0] += 1
+            summary[1] += value
+
+    @staticmethod
+    def series(name, labels, value):
+        """
+        Get sample line of a series.
+        """
+        escape = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n"})
+        pairs = ",".join(f'{key}="{val.translate(escape)}"' for key, val in labels)
+        pairs = f"{{{pairs}}}" if pairs else ""
+        return f"{name}{pairs} {value}"
+
+    def render(self):
+        """
+        Get metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            summaries = sorted((k, tuple(v)) for k, v in self.summaries.items())
+        lines = []
+        previous = None
+        for (name, labels), value in counters:
+            name = f"{self.prefix}{name}"
+            if name != previous:
+                lines.append(f"# TYPE {name} counter")
+                previous = name
+            lines.append(self.series(name, labels, value))
+        for (name, labels), (count, total) in summaries:
+            name = f"{self.prefix}{name}"
+            if name != previous:
+                lines.append(f"# TYPE {name} summary")
+                previous = name
+            lines.append(self.series(f"{name}_count", labels, count))
+            lines.append(self.series(f"{name}_sum", labels, total))
+        return "".join(f"{x}\n" for x in lines)
+
+    def write(self, path):
+        """
+        Write metrics to path atomically, e.g. for a textfile collector.
+
+        :param str path: path to metrics file
+        """
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as stream:
+            stream.write(self.render())
+        os.replace(tmp, path)
@@ -0,0 +1,227 @@
+"""
+Client-side rate limiting
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import partial
+
+MIN_SCALE = 0.05
+USAGE_HEADERS = ("X-App-Usage", "X-Page-Usage", "X-Business-Use-Case-Usage")
+USAGE_KEYS = ("call_count", "total_cputime", "total_time")
+USAGE_THRESHOLD = 75
+
+
+def open_backend(path=None):
+    """
+    Open rate limiter backend at path, using SQLite for `.db`/`.sqlite` files.
+
+    Without a path, buckets are only shared between threads.
+    """
+    if path is None:
+        return MemoryBackend()
+    _, ext = os.path.splitext(path)
+    if ext in (".db", ".sqlite", ".sqlite3"):
+        return SQLiteBackend(path)
+    return FileBackend(path)
+
+
+def iter_usage(obj):
+    """
+    Yield quota usage percentages of a Graph API usage header value.
+    """
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in USAGE_KEYS:
+                yield float(value)
+            else:
+                yield from iter_usage(value)
+    elif isinstance(obj, list):
+        for value in obj:
+            yield from iter_usage(value)
+
+
+def usage(headers):
+    """
+    Get highest percentage of a Graph API quota used, from response headers.
+    """
+    percents = [0.0]
+    for header in USAGE_HEADERS:
+        try:
+            percents.extend(iter_usage(json.loads(headers.get(header) or "{}")))
+        except ValueError:
+            continue
+    return max(percents)
+
+
+class MemoryBackend:
+    """
+    Rate limiter buckets shared between threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}
+
+    def update(self, key, func):
+        """
+        Replace state of a bucket with the state returned by `func(state)`.
+
+        `func` returns the new state and a result, which is returned.
+        """
+        with self.lock:
+            self.states[key], result = func(self.states.get(key))
+            return result
+
+
+class FileBackend:
+    """
+    Rate limiter buckets shared between processes through a locked JSON file.
+
+    :param str path: path to JSON file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def update(self, key, func):
+        """
+        Replace state of a bucket with the state returned by `func(state)`.
+
+        `func` returns the new state and a result, which is returned.
+        """
+        # pylint: disable=import-outside-toplevel
+        import fcntl
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        with self.lock, open(fd, "r+") as stream:
+            fcntl.flock(stream, fcntl.LOCK_EX)
+            try:
+                states = json.loads(stream.read() or "{}")
+            except ValueError:
+                states = {}
+            states[key], result = func(states.get(key))
+            stream.seek(0)
+            stream.truncate()
+            json.dump(states, stream)
+            return result
+
+
+class SQLiteBackend:
+    """
+    Rate limiter buckets shared between processes through a SQLite database.
+
+    :param str path: path to SQLite database
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, state TEXT)"
+            )
+
+    def update(self, key, func):
+        """
+        Replace state of a bucket with the state returned by `func(state)`.
+
+        `func` returns the new state and a result, which is returned.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT state FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                state, result = func(json.loads(row[0]) if row else None)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, state) VALUES (?, ?)",
+                    (key, json.dumps(state)),
+                )
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the rate of API calls.
+
+    The bucket refills at `rate` tokens per second, up to `burst` tokens.
+    Each call takes a token, or one per sub-request of a batch. Calls that
+    take more tokens than are left reserve them and wait until they are
+    refilled, so limiters sharing a bucket of a backend share its rate,
+    across threads or processes.
+
+    Graph API usage headers passed to `report` slow the refill rate down
+    once a quota is more than `threshold` percent used.
+
+    :param float rate: tokens per second
+    :param float burst: size of bucket (default one second of tokens)
+    :param str name: name of bucket, e.g. per API & project
+    :param object backend: backend sharing the bucket (default in-memory)
+    :param float threshold: quota usage percentage above which to slow down
+    """
+
+    def __init__(
+        self,
+        rate,
+        burst=None,
+        name="default",
+        backend=None,
+        threshold=USAGE_THRESHOLD,
+    ):
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self.name = name
+        self.backend = backend or MemoryBackend()
+        self.threshold = threshold
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, waiting until they are refilled.
+
+        Returns the number of seconds waited.
+        """
+        wait = self.backend.update(self.name, partial(self.take, tokens, time.time()))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def take(self, tokens, now, state):
+        """
+        Get bucket state after taking tokens, and seconds to wait for them.
+        """
+        state = state or {"tokens": self.burst, "updated": now, "scale": 1.0}
+        rate = self.rate * state["scale"]
+        refill = max(0.0, now - state["updated"]) * rate
+        available = min(self.burst, state["tokens"] + refill) - tokens
+        wait = max(0.0, -available / rate)
+        return dict(state, tokens=available, updated=now), wait
+
+    def report(self, headers):
+        """
+        Adapt refill rate to the Graph API quota usage of response headers.
+        """
+        if not any(x in headers for x in USAGE_HEADERS):
+            return
+        used = usage(headers)
+        if used < self.threshold:
+            scale = 1.0
+        else:
+            scale = max(MIN_SCALE, (100 - used) / (100 - self.threshold))
+        self.backend.update(self.name, partial(self.rescale, scale, time.time()))
+
+    def rescale(self, scale, now, state):
+        """
+        Get bucket state refilled up to now, at a new refill rate.
+        """
+        state, _ = self.take(0, now, state)
+        return dict(state, scale=scale), None
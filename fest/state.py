@@ -0,0 +1,241 @@
+"""
+Sync state stores
+"""
+import json
+import os
+import sqlite3
+import threading
+
+
+def open_store(path):
+    """
+    Open state store at path, using SQLite for `.db`/`.sqlite` files.
+    """
+    _, ext = os.path.splitext(path)
+    if ext in (".db", ".sqlite", ".sqlite3"):
+        return SQLiteStore(path)
+    return FileStore(path)
+
+
+def in_window(record, time_min=None, time_max=None):
+    """
+    Test if event record overlaps the `time_min`/`time_max` window.
+
+    Bounds are exclusive, as in the Calendar API `events.list` method.
+    """
+    return (time_min is None or (record["end"] or "") > time_min) and (
+        time_max is None or (record["start"] or "") < time_max
+    )
+
+
+class FileStore:
+    """
+    Sync state persisted to a local JSON file.
+
+    :param str path: path to JSON file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.locks = {}
+        self.state = None
+
+    def load(self):
+        """
+        Get state, reading from disk on first access.
+        """
+        with self.lock:
+            if self.state is None:
+                try:
+                    with open(self.path) as stream:
+                        self.state = json.load(stream)
+                except FileNotFoundError:
+                    self.state = {}
+            return self.state
+
+    def save(self):
+        """
+        Write state to disk atomically.
+        """
+        with self.lock:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as stream:
+                json.dump(self.state, stream)
+            os.replace(tmp, self.path)
+
+    def calendar(self, calendar_id):
+        """
+        Get state of a single calendar.
+        """
+        state = self.load().setdefault(calendar_id, {})
+        state.setdefault("meta", {})
+        state.setdefault("events", {})
+        return state
+
+    def calendar_lock(self, calendar_id):
+        """
+        Get lock serializing reconciliations of a calendar.
+        """
+        with self.lock:
+            return self.locks.setdefault(calendar_id, threading.Lock())
+
+    def get_meta(self, calendar_id, key):
+        """
+        Get calendar metadata value.
+        """
+        with self.lock:
+            return self.calendar(calendar_id)["meta"].get(key)
+
+    def iter_events(self, calendar_id, page_id=None, time_min=None, time_max=None):
+        """
+        Yield event records, optionally filtered by page & time window.
+        """
+        with self.lock:
+            records = list(self.calendar(calendar_id)["events"].values())
+        for record in records:
+            if page_id is None or record["page_id"] == page_id:
+                if in_window(record, time_min, time_max):
+                    yield record
+
+    def update(self, calendar_id, records=(), deleted=(), **meta):
+        """
+        Upsert event records, delete records by Google ID & update metadata.
+        """
+        with self.lock:
+            state = self.calendar(calendar_id)
+            state["meta"].update(meta)
+            for record in records:
+                state["events"][record["google_id"]] = record
+            for google_id in deleted:
+                state["events"].pop(google_id, None)
+            self.save()
+
+    def clear(self, calendar_id):
+        """
+        Forget all state for a calendar.
+        """
+        with self.lock:
+            self.load().pop(calendar_id, None)
+            self.save()
+
+
+class SQLiteStore:
+    """
+    Sync state persisted to a SQLite database.
+
+    :param str path: path to SQLite database
+    """
+
+    COLUMNS = (
+        "google_id",
+        "facebook_id",
+        "page_id",
+        "parent_id",
+        "digest",
+        "start",
+        "end",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.locks = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS meta (
+                    calendar_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    PRIMARY KEY (calendar_id, key)
+                );
+                CREATE TABLE IF NOT EXISTS events (
+                    calendar_id TEXT NOT NULL,
+                    google_id TEXT NOT NULL,
+                    facebook_id TEXT,
+                    page_id TEXT,
+                    parent_id TEXT,
+                    digest TEXT,
+                    start TEXT,
+                    end TEXT,
+                    PRIMARY KEY (calendar_id, google_id)
+                );
+                CREATE INDEX IF NOT EXISTS events_facebook_id
+                    ON events (calendar_id, facebook_id);
+                CREATE INDEX IF NOT EXISTS events_page_id
+                    ON events (calendar_id, page_id, start);
+                """
+            )
+            # Databases created before parent IDs were recorded
+            columns = [x[1] for x in self.conn.execute("PRAGMA table_info(events)")]
+            if "parent_id" not in columns:
+                self.conn.execute("ALTER TABLE events ADD COLUMN parent_id TEXT")
+
+    def calendar_lock(self, calendar_id):
+        """
+        Get lock serializing reconciliations of a calendar.
+        """
+        with self.lock:
+            return self.locks.setdefault(calendar_id, threading.Lock())
+
+    def get_meta(self, calendar_id, key):
+        """
+        Get calendar metadata value.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE calendar_id = ? AND key = ?",
+                (calendar_id, key),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def iter_events(self, calendar_id, page_id=None, time_min=None, time_max=None):
+        """
+        Yield event records, optionally filtered by page & time window.
+        """
+        sql = f"SELECT {', '.join(self.COLUMNS)} FROM events WHERE calendar_id = ?"
+        params = [calendar_id]
+        if page_id is not None:
+            sql += " AND page_id = ?"
+            params.append(page_id)
+        if time_min is not None:
+            sql += " AND COALESCE(end, '') > ?"
+            params.append(time_min)
+        if time_max is not None:
+            sql += " AND COALESCE(start, '') < ?"
+            params.append(time_max)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        for row in rows:
+            yield dict(zip(self.COLUMNS, row))
+
+    def update(self, calendar_id, records=(), deleted=(), **meta):
+        """
+        Upsert event records, delete records by Google ID & update metadata.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "REPLACE INTO meta (calendar_id, key, value) VALUES (?, ?, ?)",
+                [(calendar_id, k, json.dumps(v)) for k, v in meta.items()],
+            )
+            self.conn.executemany(
+                f"REPLACE INTO events (calendar_id, {', '.join(self.COLUMNS)}) "
+                f"VALUES (?{', ?' * len(self.COLUMNS)})",
+                [(calendar_id, *(x.get(k) for k in self.COLUMNS)) for x in records],
+            )
+            self.conn.executemany(
+                "DELETE FROM events WHERE calendar_id = ? AND google_id = ?",
+                [(calendar_id, x) for x in deleted],
+            )
+
+    def clear(self, calendar_id):
+        """
+        Forget all state for a calendar.
+        """
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM meta WHERE calendar_id = ?", (calendar_id,))
+            self.conn.execute(
+                "DELETE FROM events WHERE calendar_id = ?", (calendar_id,)
+            )
@@ -0,0 +1,190 @@
+"""
+HTTP transport
+"""
+import gzip
+import os
+import urllib
+
+import requests
+
+from fest.metrics import NullSink
+
+DISCOVERY_URI = "https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest"
+POOL_SIZE = 10
+
+
+class Response(dict):
+    """
+    httplib2-style response: lowercase headers with status & reason.
+
+    :param object response: requests Response
+    """
+
+    def __init__(self, response):
+        super().__init__((k.lower(), v) for k, v in response.headers.items())
+        self.pop("content-encoding", None)  # body is already decoded
+        self.status = response.status_code
+        self.reason = response.reason
+        self["status"] = str(response.status_code)
+
+
+class Transport:
+    """
+    Pooled, keep-alive HTTP transport that API clients can share.
+
+    Wraps a `requests.Session` mounted with a connection pool of
+    `pool_size` connections per host, which should match the number of
+    threads using it. Responses are requested gzip-compressed. The
+    httplib2-style `request` method is used by Google API clients and can
+    also gzip request bodies; GraphAPI clients use the session directly.
+
+    :param object session: requests Session (optional)
+    :param int pool_size: connections to keep alive per host
+    :param bool compress: gzip request bodies of Google API requests
+    :param float timeout: request timeout in seconds (optional)
+    :param object adapter: requests adapter to mount instead of a pool
+    :param object metrics: sink of response sizes & latencies (optional)
+    :param object limiter: RateLimiter to report API quota usage to (optional)
+    """
+
+    def __init__(
+        self,
+        session=None,
+        pool_size=POOL_SIZE,
+        compress=False,
+        timeout=None,
+        adapter=None,
+        metrics=None,
+        limiter=None,
+    ):
+        self.session = session or requests.Session()
+        self.compress = compress
+        self.timeout = timeout
+        self.metrics = metrics or NullSink()
+        self.limiter = limiter
+        adapter = adapter or requests.adapters.HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+        user_agent = self.session.headers.get("User-Agent", "")
+        if "gzip" not in user_agent:
+            # Google APIs only compress responses for gzip user agents
+            self.session.headers["User-Agent"] = f"{user_agent} (gzip)".strip()
+        if metrics is not None:
+            self.session.hooks["response"].append(self.measure)
+        if limiter is not None:
+            self.session.hooks["response"].append(self.report_usage)
+
+    def measure(self, response, **kwargs):
+        """
+        Record payload size & latency of a response.
+        """
+        # pylint: disable=unused-argument
+        host = urllib.parse.urlsplit(response.url).netloc
+        seconds = response.elapsed.total_seconds()
+        self.metrics.observe("http_response_bytes", len(response.content), host=host)
+        self.metrics.observe("http_request_seconds", seconds, host=host)
+        return response
+
+    def report_usage(self, response, **kwargs):
+        """
+        Report API quota usage of a response to the rate limiter.
+        """
+        # pylint: disable=unused-argument
+        self.limiter.report(response.headers)
+        return response
+
+    @classmethod
+    def authorized(cls, credentials, **kwargs):
+        """
+        Get transport authorizing requests with Google credentials.
+        """
+        # pylint: disable=import-outside-toplevel
+        from google.auth.transport.requests import AuthorizedSession
+
+        return cls(AuthorizedSession(credentials), **kwargs)
+
+    def request(
+        self,
+        uri,
+        method="GET",
+        body=None,
+        headers=None,
+        redirections=None,
+        connection_type=None,
+    ):
+        """
+        Send request with the httplib2 interface.
+        """
+        # pylint: disable=unused-argument
+        headers = dict(headers or {})
+        if self.compress and body:
+            body = gzip.compress(body.encode() if isinstance(body, str) else body)
+            headers.update({"content-encoding": "gzip"})
+        response = self.session.request(
+            method,
+            uri,
+            data=body,
+            headers=headers,
+            timeout=self.timeout,
+        )
+        return Response(response), response.content
+
+    def graphapi(self, access_token, **kwargs):
+        """
+        Get GraphAPI client using this transport.
+        """
+        # pylint: disable=import-outside-toplevel
+        import facebook
+
+        return facebook.GraphAPI(access_token, session=self.session, **kwargs)
+
+    def calendarapi(self, discovery_path=None, **kwargs):
+        """
+        Get Google Calendar API client using this transport.
+
+        If `discovery_path` is given, the client is built from the discovery
+        document cached there, which is downloaded on first use. Otherwise
+        the client library's own (bundled, in recent versions) document is
+        used.
+
+        :param str discovery_path: path to cached discovery document
+        """
+        # pylint: disable=import-outside-toplevel
+        from googleapiclient import discovery
+
+        if discovery_path is None:
+            return discovery.build(
+                "calendar",
+                "v3",
+                cache_discovery=False,
+                http=self,
+                **kwargs,
+            )
+        document = self.discovery_document(discovery_path)
+        return discovery.build_from_document(document, http=self, **kwargs)
+
+    def discovery_document(self, path):
+        """
+        Read Calendar API discovery document cached at path.
+
+        The document is downloaded and written to path atomically if it is
+        not cached yet.
+
+        :param str path: path to cached discovery document
+        """
+        try:
+            with open(path) as stream:
+                return stream.read()
+        except FileNotFoundError:
+            response = self.session.get(DISCOVERY_URI, timeout=self.timeout)
+            response.raise_for_status()
+            document = response.text
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as stream:
+                stream.write(document)
+            os.replace(tmp, path)
+            return document
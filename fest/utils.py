@@ -4,6 +4,21 @@ Utility functions
 import hashlib
 import json
 import logging
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from datetime import timezone
+from functools import lru_cache
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 32
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+DIGEST_PREFIX = "v2:"
+MAX_RETRIES = 3
+PARSE_CACHE_SIZE = 4096
+PREFETCH_PAGES = 1
 
 
 class Future:
@@ -14,6 +29,10 @@ class Future:
     def __init__(self, request):
         self.request = request
 
+    def __iter__(self):
+        """Iterate over request lazily."""
+        return iter(self.request)
+
     def execute(self):
         """Execute request."""
         return list(self.request)
@@ -24,13 +43,127 @@ class Future:
         return self
 
 
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """
+    Get exponential backoff delay with full jitter for a retry attempt.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def retry(func, retries=MAX_RETRIES, retryable=None, on_retry=None):
+    """
+    Call `func`, retrying errors with exponential backoff.
+
+    Errors are retried up to `retries` times, or raised immediately if
+    `retryable(err)` is false. `on_retry(err)` is called before each retry.
+    """
+    for attempt in range(retries):
+        try:
+            return func()
+        except Exception as err:  # pylint: disable=broad-except
+            if retryable is not None and not retryable(err):
+                raise
+            if on_retry is not None:
+                on_retry(err)
+            time.sleep(backoff(attempt))
+    return func()
+
+
 def digest(obj, encoding="utf-8"):
     """
     Get SHA1 hexdigest of JSON object.
+
+    This is the legacy (unversioned) digest format.
     """
     return hashlib.sha1(json.dumps(obj).encode(encoding)).hexdigest()
 
 
+def canonical_digest(obj, encoding="utf-8"):
+    """
+    Get versioned BLAKE2b hexdigest of canonical JSON object.
+
+    Keys are sorted so the digest does not depend on dict ordering.
+    """
+    data = json.dumps(obj, sort_keys=True, separators=(",", ":")).encode(encoding)
+    return DIGEST_PREFIX + hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def paginate(fetch, cursor, args, prefetch=PREFETCH_PAGES):
+    """
+    Yield responses of `fetch(**args)`, following `cursor(response)`.
+
+    `cursor` returns the args to update for the next page, or `None` on
+    the last page. Up to `prefetch` pages are fetched in a background
+    thread while the caller consumes the current one; set `prefetch` to
+    0 to fetch pages synchronously.
+    """
+    # Fetch pages synchronously
+    if prefetch < 1:
+        while args is not None:
+            response = fetch(**args)
+            yield response
+            update = cursor(response)
+            args = None if update is None else dict(args, **update)
+        return
+
+    # Fetch pages in the background into a bounded read-ahead queue
+    pages = queue.Queue(prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                return pages.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+
+    def worker():
+        try:
+            for response in paginate(fetch, cursor, args, prefetch=0):
+                put((response, None))
+                if stop.is_set():
+                    break
+        except Exception as err:  # pylint: disable=broad-except
+            put((None, err))
+        put(None)
+
+    threading.Thread(target=worker, daemon=True).start()
+    try:
+        for response, err in iter(pages.get, None):
+            if err is not None:
+                raise err
+            yield response
+    finally:
+        stop.set()
+
+
+def http_status(err):
+    """
+    Get HTTP status code of an API client error, if any.
+    """
+    try:
+        return int(err.resp.status)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_datetime(string):
+    """
+    Parse facebook/Google timestamp string.
+
+    Results are cached, since recurring events repeat the same timestamps.
+    """
+    return datetime.strptime(string, DATETIME_FORMAT)
+
+
+def to_utc(string):
+    """
+    Normalize facebook/Google timestamp string to UTC ISO format.
+    """
+    return parse_datetime(string).astimezone(timezone.utc).isoformat()
+
+
 def logger(obj):
     """
     Get logger for object.
@@ -0,0 +1,224 @@
+"""
+Facebook page webhooks
+"""
+import hashlib
+import hmac
+import json
+import signal
+import threading
+from http import server
+from urllib.parse import parse_qsl
+from urllib.parse import urlparse
+
+from fest import utils
+
+DEBOUNCE = 5
+PORT = 8080
+SIGNATURE_HEADER = "X-Hub-Signature-256"
+
+
+def verify_signature(secret, body, signature):
+    """
+    Test that a notification body is signed with the app secret.
+
+    :param str secret: facebook app secret
+    :param bytes body: notification body
+    :param str signature: value of the X-Hub-Signature-256 header
+    """
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(f"sha256={digest}", signature or "")
+
+
+def iter_changes(payload):
+    """
+    Yield `(page_id, event_id, verb)` of event changes in a notification.
+    """
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            event_id = value.get("event_id")
+            if value.get("item") == "event" and event_id:
+                yield entry["id"], event_id, value.get("verb")
+
+
+class Debouncer:
+    """
+    Coalesce event changes per page until they settle.
+
+    `callback(page_id, changes)` is called with a dict of the latest verb of
+    each changed event once no change to the page has arrived for `delay`
+    seconds.
+
+    :param function callback: handler of settled page changes
+    :param float delay: seconds to wait for further changes
+    """
+
+    def __init__(self, callback, delay=DEBOUNCE):
+        self.callback = callback
+        self.delay = delay
+        self.pending = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def push(self, page_id, event_id, verb):
+        """
+        Add event change and restart the page's timer.
+        """
+        with self.lock:
+            self.pending.setdefault(page_id, {})[event_id] = verb
+            timer = self.timers.pop(page_id, None)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.delay, self.flush, [page_id])
+            timer.daemon = True
+            timer.start()
+            self.timers[page_id] = timer
+
+    def flush(self, page_id):
+        """
+        Hand pending changes of a page to the callback.
+        """
+        with self.lock:
+            self.timers.pop(page_id, None)
+            changes = self.pending.pop(page_id, None)
+        if changes:
+            self.callback(page_id, changes)
+
+    def close(self):
+        """
+        Cancel timers and flush all pending changes now.
+        """
+        with self.lock:
+            for timer in self.timers.values():
+                timer.cancel()
+            page_ids = list(self.pending)
+        for page_id in page_ids:
+            self.flush(page_id)
+
+
+class Handler(server.BaseHTTPRequestHandler):
+    """
+    HTTP handler of webhook verification requests and notifications.
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Answer verification request.
+        """
+        params = dict(parse_qsl(urlparse(self.path).query))
+        challenge = self.server.webhook.verify(params)
+        if challenge is None:
+            self.reply(403)
+        else:
+            self.reply(200, challenge.encode())
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Accept notification.
+        """
+        body = self.rfile.read(int(self.headers.get("content-length") or 0))
+        signature = self.headers.get(SIGNATURE_HEADER)
+        self.reply(200 if self.server.webhook.receive(body, signature) else 403)
+
+    def reply(self, status, body=b""):
+        """
+        Send response.
+        """
+        self.send_response(status)
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        self.server.webhook.logger.debug(format, *args)
+
+
+class Webhook:
+    """
+    Receiver of facebook page webhook notifications.
+
+    Signed notifications of event changes are debounced per page, then
+    each of the page's calendars in the sync group is synced for only the
+    changed events.
+
+    :param object group: SyncGroup of page/calendar pairs
+    :param str secret: facebook app secret, to verify notifications
+    :param str verify_token: token to answer verification requests with
+    :param float delay: seconds to wait for further changes to a page
+    :param bool dryrun: plan syncs without writing to calendars
+    """
+
+    def __init__(self, group, secret, verify_token, delay=DEBOUNCE, dryrun=False):
+        self.group = group
+        self.secret = secret
+        self.verify_token = verify_token
+        self.dryrun = dryrun
+        self.debouncer = Debouncer(self.sync, delay)
+        self.logger = utils.logger(self)
+
+    def verify(self, params):
+        """
+        Get challenge of a valid verification request, or None.
+        """
+        if (
+            params.get("hub.mode") == "subscribe"
+            and params.get("hub.verify_token") == self.verify_token
+        ):
+            return params.get("hub.challenge")
+        return None
+
+    def receive(self, body, signature):
+        """
+        Queue event changes of a notification, if signed.
+        """
+        if not verify_signature(self.secret, body, signature):
+            self.logger.error("POST / INVALID SIGNATURE")
+            return False
+        for page_id, event_id, verb in iter_changes(json.loads(body)):
+            self.logger.info("%s %s %s", verb, page_id, event_id)
+            self.debouncer.push(page_id, event_id, verb)
+        return True
+
+    def sync(self, page_id, changes):
+        """
+        Sync changed events of a page to each of its calendars.
+        """
+        ids = list(changes)
+        removed = [x for x, verb in changes.items() if verb == "remove"]
+        return [
+            self.group.sync(
+                page_id,
+                pair["calendar_id"],
+                dryrun=self.dryrun,
+                ids=ids,
+                removed=removed,
+            )
+            for pair in self.group.pairs
+            if pair["page_id"] == page_id
+        ]
+
+    def server(self, address=("", PORT)):
+        """
+        Get HTTP server of this webhook.
+        """
+        httpd = server.ThreadingHTTPServer(address, Handler)
+        httpd.webhook = self
+        return httpd
+
+    def serve(self, address=("", PORT)):
+        """
+        Serve webhook until interrupted, flushing pending changes on exit.
+        """
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        httpd = self.server(address)
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+            self.debouncer.close()
+
+
+if __name__ == "__main__":
+    from fest import heroku  # pragma: no cover
+
+    heroku.webhook()  # pragma: no cover
@@ -0,0 +1,107 @@
+"""
+Time windows
+"""
+from datetime import datetime
+from datetime import timezone
+
+from fest import utils
+
+
+class TimeWindow:
+    """
+    Time window of facebook events.
+
+    An event is inside the window if it overlaps `since`/`until` and
+    passes every predicate. Bounds are pushed down to Graph API as query
+    params; predicates are only evaluated locally.
+
+    :param datetime since: lower bound of event times (optional)
+    :param datetime until: upper bound of event times (optional)
+    :param list predicates: functions of an event returning a bool
+    """
+
+    def __init__(self, since=None, until=None, predicates=()):
+        self.since = since
+        self.until = until
+        self.predicates = list(predicates)
+
+    @classmethod
+    def from_time_filter(cls, time_filter, now=None):
+        """
+        Get window equivalent to a Graph API `time_filter`.
+        """
+        now = now or datetime.now(timezone.utc)
+        if time_filter == "upcoming":
+            return cls(since=now)
+        if time_filter == "past":
+            return cls(until=now)
+        return cls()
+
+    def params(self):
+        """
+        Get Graph API query params for the window bounds.
+        """
+        params = {}
+        if self.since is not None:
+            params.update(since=int(self.since.timestamp()))
+        if self.until is not None:
+            params.update(until=int(self.until.timestamp()))
+        return params
+
+    def bounds(self):
+        """
+        Get window bounds as facebook timestamp strings.
+        """
+        return tuple(
+            None if x is None else x.strftime(utils.DATETIME_FORMAT)
+            for x in (self.since, self.until)
+        )
+
+    def position(self, event):
+        """
+        Get position of event relative to the window.
+
+        Returns -1 if the event (all of its occurrences, if recurring) ends
+        before the window, 1 if it starts after the window, else 0.
+        """
+        times = event.get("event_times") or [event]
+        try:
+            start = min(utils.parse_datetime(x["start_time"]) for x in times)
+            end = max(
+                utils.parse_datetime(x.get("end_time") or x["start_time"])
+                for x in times
+            )
+        except KeyError:
+            return 0
+        if self.since is not None and end <= self.since:
+            return -1
+        if self.until is not None and start >= self.until:
+            return 1
+        return 0
+
+    def contains(self, event):
+        """
+        Test if event is inside the window.
+        """
+        return self.position(event) == 0 and all(x(event) for x in self.predicates)
+
+    def exhausted(self, events):
+        """
+        Test if pages following these events are entirely outside the window.
+
+        True when every event is on the same side of the window and the
+        page's start times are not ordered back towards it. A page of one
+        event, or of events starting at the same time, is judged by the
+        positions of its events alone.
+        """
+        positions = {self.position(x) for x in events}
+        try:
+            first = utils.parse_datetime(events[0]["start_time"])
+            last = utils.parse_datetime(events[-1]["start_time"])
+        except (IndexError, KeyError):
+            return False
+        if positions == {-1}:
+            return first >= last
+        if positions == {1}:
+            return first <= last
+        return False
@@ -0,0 +1,205 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest import mock
+
+from fest import backfill
+
+FEVENTS = [
+    {"id": "1", "start_time": "2018-01-10T12:00:00-0500"},
+    {"id": "2", "start_time": "2018-06-10T12:00:00-0500"},
+]
+
+
+def parse(string):
+    return datetime.strptime(string, "%Y-%m-%dT%H:%M:%S%z")
+
+
+def get_object(path, since=None, until=None, **_):
+    return {
+        "data": [
+            x
+            for x in FEVENTS
+            if (since is None or parse(x["start_time"]).timestamp() >= since)
+            and (until is None or parse(x["start_time"]).timestamp() < until)
+        ]
+    }
+
+
+def factory():
+    graphapi = mock.MagicMock()
+    graphapi.get_object.side_effect = get_object
+    calendarapi = mock.MagicMock()
+    calendarapi.events.return_value.list.return_value.execute.return_value = {
+        "items": [
+            {
+                "id": "g3",
+                "start": {"dateTime": "2018-03-10T12:00:00-05:00"},
+                "end": {"dateTime": "2018-03-10T13:00:00-05:00"},
+                "extendedProperties": {
+                    "private": {"facebookId": "3", "facebookPageId": "MyPage"}
+                },
+            }
+        ]
+    }
+    return graphapi, calendarapi
+
+
+def test_starts_between():
+    since = datetime(2018, 1, 1, tzinfo=timezone.utc)
+    until = datetime(2018, 2, 1, tzinfo=timezone.utc)
+    assert backfill.starts_between(since, until, FEVENTS[0])
+    assert not backfill.starts_between(since, until, FEVENTS[1])
+
+
+def test_journal(tmp_path):
+    journal = backfill.Journal(str(tmp_path / "journal.jsonl"))
+    assert journal.completed("MyPage", "MyGCal") == set()
+    journal.record(
+        {"page_id": "MyPage", "calendar_id": "MyGCal", "since": "a", "until": "b"}
+    )
+    journal.record(
+        {"page_id": "OtherPage", "calendar_id": "MyGCal", "since": "b", "until": "c"}
+    )
+    with open(journal.path, "a") as stream:
+        stream.write('{"page_id": "MyPage", "cal')
+    assert journal.completed("MyPage", "MyGCal") == {("a", "b")}
+
+
+def test_sync_slice():
+    def execbatch(sync, method, verb, dryrun=False, requests=None):
+        sync.responses[verb].update({x: {} for x in sync.requests[verb]})
+
+    since = datetime(2018, 1, 1, tzinfo=timezone.utc)
+    until = datetime(2018, 4, 1, tzinfo=timezone.utc)
+    with mock.patch.object(backfill.BackfillSyncFuture, "execbatch", execbatch):
+        ret = backfill.sync_slice(factory, "MyPage", "MyGCal", since, until)
+    assert ret == {
+        "counts": {"POST": 1, "PUT": 0, "DELETE": 1},
+        "errors": {"POST": {}, "PUT": {}, "DELETE": {}},
+    }
+
+
+def test_sync_slice_moved():
+    def execbatch(sync, method, verb, dryrun=False, requests=None):
+        planned[verb].extend(sync.requests[verb])
+
+    def moved():
+        graphapi, calendarapi = factory()
+        graphapi.get_object.side_effect = None
+        graphapi.get_object.return_value = {
+            "data": [{"id": "3", "start_time": "2018-06-10T12:00:00-0500"}]
+        }
+        return graphapi, calendarapi
+
+    planned = {"POST": [], "PUT": [], "DELETE": []}
+    since = datetime(2018, 6, 1, tzinfo=timezone.utc)
+    until = datetime(2018, 7, 1, tzinfo=timezone.utc)
+    with mock.patch.object(backfill.BackfillSyncFuture, "execbatch", execbatch):
+        backfill.sync_slice(moved, "MyPage", "MyGCal", since, until)
+    assert planned == {"POST": [], "PUT": ["3"], "DELETE": []}
+
+
+def test_backfill_sync_future_index():
+    since = datetime(2018, 3, 11, tzinfo=timezone.utc)
+    until = datetime(2018, 4, 1, tzinfo=timezone.utc)
+    graphapi, calendarapi = factory()
+    page = backfill.FacebookPage(graphapi, "MyPage")
+    gcal = backfill.GoogleCalendar(calendarapi, "MyGCal")
+    window = backfill.TimeWindow(since, until)
+    sync = backfill.BackfillSyncFuture(None, page, gcal, window=window)
+    assert sync.index(*window.bounds()) == {}
+
+
+@mock.patch("fest.backfill.ProcessPoolExecutor", ThreadPoolExecutor)
+def test_backfill_execute(tmp_path):
+    journal = backfill.Journal(str(tmp_path / "journal.jsonl"))
+    window = backfill.TimeWindow(until=datetime(2018, 6, 1, tzinfo=timezone.utc))
+    job = backfill.Backfill(
+        "MyPage",
+        "MyGCal",
+        journal,
+        factory,
+        span=timedelta(days=60),
+        window=window,
+    )
+    slices = job.slices()
+    assert slices[0][0] < parse(FEVENTS[0]["start_time"]) < slices[0][1]
+    assert (slices[0][0] - backfill.EPOCH) % timedelta(days=60) == timedelta(0)
+    assert slices[-1][1] <= window.until
+    assert all(b - a <= timedelta(days=60) for a, b in slices)
+
+    calls = []
+
+    def sync_slice(factory, page_id, calendar_id, since, until, dryrun=False):
+        calls.append(since)
+        if len(calls) == 1:
+            return {"counts": {}, "errors": {"POST": {"1": "HttpError()"}}}
+        if len(calls) == 2:
+            raise ValueError("boom")
+        return {"counts": {}, "errors": {"POST": {}}}
+
+    with mock.patch("fest.backfill.sync_slice", sync_slice):
+        ret = job.execute()
+        errors = [x.get("error") for x in ret]
+        assert errors.count("ValueError('boom')") == 1
+        assert errors.count("1 writes failed") == 1
+        assert len(journal.completed("MyPage", "MyGCal")) == len(slices) - 2
+        ret = job.execute()
+    assert len(ret) == 2
+    assert all("error" not in x for x in ret)
+    assert len(journal.completed("MyPage", "MyGCal")) == len(slices)
+    assert len(calls) == len(slices) + 2
+
+
+def test_backfill_slices_limiters(tmp_path):
+    def limited():
+        return (*factory(), mock.MagicMock(), mock.MagicMock())
+
+    journal = backfill.Journal(str(tmp_path / "journal.jsonl"))
+    window = backfill.TimeWindow(until=datetime(2018, 6, 1, tzinfo=timezone.utc))
+    job = backfill.Backfill("MyPage", "MyGCal", journal, limited, window=window)
+    assert job.slices()
+
+
+def test_backfill_empty(tmp_path):
+    def empty():
+        graphapi = mock.MagicMock()
+        graphapi.get_object.return_value = {"data": []}
+        calendarapi = mock.MagicMock()
+        calendarapi.events.return_value.list.return_value.execute.return_value = {}
+        return graphapi, calendarapi
+
+    journal = backfill.Journal(str(tmp_path / "journal.jsonl"))
+    job = backfill.Backfill("MyPage", "MyGCal", journal, empty)
+    assert job.execute(dryrun=True) == []
+
+
+@mock.patch("fest.backfill.Backfill.execute")
+def test_main(mock_execute, capsys):
+    mock_execute.return_value = [{"since": "a", "until": "b"}]
+    ret = backfill.main(["MyPage", "MyGCal", "--since", "2018-01-01T00:00:00+00:00"])
+    assert ret == 0
+    assert json.loads(capsys.readouterr().out) == mock_execute.return_value
+    mock_execute.return_value = [{"since": "a", "until": "b", "error": "boom"}]
+    assert backfill.main(["MyPage", "MyGCal", "--dryrun"]) == 1
+    mock_execute.assert_called_with(dryrun=True)
+
+
+def test_backfill_processes(tmp_path):
+    journal = backfill.Journal(str(tmp_path / "journal.jsonl"))
+    job = backfill.Backfill("MyPage", "MyGCal", journal, factory, max_workers=2)
+    ret = job.execute()
+    assert ret and all("error" not in x for x in ret)
+    assert len(journal.completed("MyPage", "MyGCal")) == len(ret)
+
+
+@mock.patch("fest.heroku.calendar_limiter")
+@mock.patch("fest.heroku.graph_limiter")
+@mock.patch("fest.heroku.calendarapi")
+@mock.patch("fest.heroku.graphapi")
+def test_clients(*mocks):
+    ret = backfill.clients()
+    assert ret == tuple(x.return_value for x in mocks)
@@ -0,0 +1,133 @@
+import json
+import os
+import time
+import tracemalloc
+from unittest import mock
+
+import pytest
+
+from fest.facebook import FacebookPage
+from fest.google import GoogleCalendar
+
+from tests import fakes
+
+BASELINE = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+SIZES = [int(x) for x in os.environ.get("FEST_BENCHMARK_SIZES", "100,1000").split(",")]
+SCENARIOS = ["cold", "steady", "churn", "recurring"]
+MEMORY_TOLERANCE = 1.5
+TIME_TOLERANCE = float(os.environ.get("FEST_BENCHMARK_TIME_TOLERANCE") or 10)
+TIME_SLACK = 1
+UPDATE = bool(os.environ.get("FEST_BENCHMARK_UPDATE"))
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    with open(BASELINE) as stream:
+        baseline = json.load(stream)
+    yield baseline
+    if UPDATE:  # pragma: no cover
+        with open(BASELINE, "w") as stream:
+            json.dump(baseline, stream, indent=2, sort_keys=True)
+            stream.write("\n")
+
+
+def setup(scenario, size):
+    """
+    Get fake backends ready for the measured sync of a scenario.
+    """
+    if scenario == "recurring":
+        events = [fakes.fevent(x, occurrences=10) for x in range(size // 10)]
+    else:
+        events = [fakes.fevent(x) for x in range(size)]
+    graphapi = fakes.FakeGraphAPI(events)
+    calendarapi = fakes.FakeCalendarAPI(limit=97 if scenario == "churn" else None)
+    if scenario in ("steady", "churn"):
+        sync(graphapi, calendarapi)
+    if scenario == "churn":
+        # Update, remove & add a tenth of the events each
+        tenth = size // 10
+        updated = [fakes.fevent(x, revision=1) for x in range(tenth)]
+        added = [fakes.fevent(size + x) for x in range(tenth)]
+        graphapi = fakes.FakeGraphAPI(updated + events[2 * tenth :] + added)
+    graphapi.calls.clear()
+    calendarapi.calls.clear()
+    return graphapi, calendarapi
+
+
+def sync(graphapi, calendarapi):
+    page = FacebookPage(graphapi, "MyPage")
+    gcal = GoogleCalendar(calendarapi, "MyGCal")
+    return gcal.sync(page).execute()
+
+
+def measure(scenario, size):
+    """
+    Get wall time, peak memory & API calls of a scenario's sync.
+
+    Time and memory are measured in separate runs, since tracing memory
+    slows the sync down.
+    """
+    with mock.patch("fest.utils.backoff", return_value=0):
+        graphapi, calendarapi = setup(scenario, size)
+        start = time.perf_counter()
+        sync(graphapi, calendarapi)
+        wall = time.perf_counter() - start
+
+        graphapi, calendarapi = setup(scenario, size)
+        tracemalloc.start()
+        try:
+            ret = sync(graphapi, calendarapi)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    calls = {
+        **{f"graph.{k}": v for k, v in graphapi.calls.items()},
+        **{f"calendar.{k}": v for k, v in calendarapi.calls.items()},
+    }
+    result = {
+        "wall_s": round(wall, 4),
+        "peak_kb": peak // 1024,
+        "calls": dict(sorted(calls.items())),
+    }
+    return result, ret, calendarapi
+
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_benchmark(scenario, size, baseline):
+    key = f"{scenario}-{size}"
+    result, ret, calendarapi = measure(scenario, size)
+    print(key, json.dumps(result))
+    if UPDATE:  # pragma: no cover
+        baseline[key] = result
+    expected = baseline.get(key)
+    if expected is None:  # pragma: no cover
+        pytest.skip(f"no baseline for {key}")
+
+    # Sync is correct
+    assert not any(ret.errors.values())
+    assert len(calendarapi.items) == size
+
+    # Sync has not regressed
+    for name, count in result["calls"].items():
+        assert count <= expected["calls"].get(name, 0), name
+    assert result["peak_kb"] <= expected["peak_kb"] * MEMORY_TOLERANCE
+    assert result["wall_s"] <= expected["wall_s"] * TIME_TOLERANCE + TIME_SLACK
+
+
+def test_fake_graphapi():
+    graphapi = fakes.FakeGraphAPI([fakes.fevent(0)], latency=0.001, limit=2)
+    assert graphapi.get_objects(["0", "1"]) == {"0": fakes.fevent(0)}
+    with pytest.raises(fakes.facebook.GraphAPIError):
+        graphapi.get_object("MyPage/events")
+    assert graphapi.calls == {"get_objects": 1, "get_object": 1}
+
+
+def test_fake_calendarapi():
+    calendarapi = fakes.FakeCalendarAPI(page_size=1)
+    events = calendarapi.events()
+    for facebook_id in ["1", "2"]:
+        body = {"extendedProperties": {"private": {"facebookId": facebook_id}}}
+        events.insert(calendarId="MyGCal", body=body).execute()
+    request = events.list(privateExtendedProperty=["facebookId=2"])
+    assert [x["id"] for x in request.execute()["items"]] == ["g2"]
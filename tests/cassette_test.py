@@ -0,0 +1,91 @@
+import gzip
+import json
+from unittest import mock
+
+import pytest
+import requests
+
+import fest
+from fest import cassette
+from fest.transport import Transport
+
+
+def prepare(method, url, **kwargs):
+    return requests.Request(method, url, **kwargs).prepare()
+
+
+def respond(content, status=200, **headers):
+    response = requests.Response()
+    response.status_code = status
+    response.reason = "OK"
+    response.headers.update(headers)
+    response._content = content
+    return response
+
+
+def test_strip_url():
+    ret = cassette.strip_url("https://host/path?b=2&access_token=secret&a=1")
+    assert ret == "https://host/path?a=1&b=2"
+
+
+def test_request_key():
+    url = "https://host/path"
+    form = prepare("POST", url, data={"batch": "[]", "access_token": "secret"})
+    other = prepare("POST", url, data={"batch": "[]", "access_token": "other"})
+    assert cassette.request_key(form) == cassette.request_key(other)
+    batch1 = prepare("POST", url, data=f"<{'a' * 36} + 1><{'a' * 36} + 2>")
+    batch2 = prepare("POST", url, data=f"<{'b' * 36} + 2><{'b' * 36} + 1>")
+    assert cassette.request_key(batch1) == cassette.request_key(batch2)
+    plain = prepare("POST", url, data=gzip.compress(b"{}"))
+    plain.headers["content-encoding"] = "gzip"
+    assert cassette.request_key(plain) == cassette.request_key(
+        prepare("POST", url, data="{}")
+    )
+    assert cassette.request_key(plain) != cassette.request_key(form)
+
+
+def test_record(tmp_path):
+    path = str(tmp_path / "fest.jsonl")
+    tape = cassette.Cassette(path)
+    request = prepare("GET", "https://host/path?access_token=secret")
+    tape.record(request, respond(b"{}", **{"content-length": "2"}), 0.1)
+    tape.record(request, respond(b"\xff", 404), 0.2)
+    with open(path, "a") as stream:
+        stream.write('{"partial')
+    entries = list(tape.entries())
+    assert [x["url"] for x in entries] == ["https://host/path"] * 2
+    assert entries[0]["headers"] == {}
+    assert entries[0]["content"] == "{}"
+    assert entries[1]["base64"] is True
+    replay = cassette.ReplayAdapter(tape)
+    assert replay.send(request).content == b"{}"
+    response = replay.send(request)
+    assert response.status_code == 404
+    assert response.content == b"\xff"
+    with pytest.raises(cassette.CassetteError):
+        replay.send(request)
+    replay.close()
+
+
+def test_match_route(tmp_path):
+    tape = cassette.Cassette(str(tmp_path / "fest.jsonl"))
+    tape.record(prepare("GET", "https://host/path?a=1"), respond(b"1"), 0)
+    tape.record(prepare("GET", "https://host/path?a=2"), respond(b"2"), 0)
+    replay = cassette.ReplayAdapter(tape)
+    assert replay.send(prepare("GET", "https://host/path?a=2")).content == b"2"
+    assert replay.send(prepare("GET", "https://host/path?a=3")).content == b"1"
+    with pytest.raises(cassette.CassetteError):
+        replay.send(prepare("GET", "https://host/path?a=1"))
+
+
+@mock.patch("time.sleep")
+def test_replay(mock_sleep, recorded):
+    with gzip.open(recorded, "rt") as stream:
+        entries = [json.loads(x) for x in stream]
+        assert "secret" not in json.dumps(entries)
+    http = Transport(adapter=cassette.ReplayAdapter(cassette.Cassette(recorded), True))
+    page = fest.FacebookPage(http.graphapi("replay"), "MyPage")
+    gcal = fest.GoogleCalendar(http.calendarapi(), "MyGCal")
+    sync = gcal.sync(page).execute()
+    assert sync.responses["POST"] == {"0": {"id": "g0"}, "1": {"id": "g1"}}
+    mock_sleep.assert_has_calls([mock.call(x["elapsed"]) for x in entries])
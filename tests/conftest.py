@@ -0,0 +1,19 @@
+from unittest import mock
+
+import pytest
+
+import fest
+from fest import cassette
+from fest.transport import Transport
+from tests import fakes
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    path = str(tmp_path / "fest.jsonl.gz")
+    with mock.patch("requests.adapters.HTTPAdapter.send", fakes.send):
+        http = Transport(adapter=cassette.RecordingAdapter(cassette.Cassette(path)))
+        page = fest.FacebookPage(http.graphapi("secret"), "MyPage")
+        gcal = fest.GoogleCalendar(http.calendarapi(), "MyGCal")
+        gcal.sync(page).execute()
+    return path
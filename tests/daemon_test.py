@@ -0,0 +1,67 @@
+from unittest import mock
+
+from fest import daemon
+from fest import group
+
+
+def result(digests, error=None):
+    return {"digests": digests, "error": error}
+
+
+def sync_group():
+    pairs = [("Page1", "GCal1"), ("Page2", "GCal2")]
+    return group.SyncGroup(mock.MagicMock(), mock.MagicMock(), pairs)
+
+
+def test_daemon_tick():
+    sync = sync_group()
+    sched = daemon.Daemon(sync, interval=100, jitter=0)
+    with mock.patch.object(sync, "execute") as mock_execute:
+        mock_execute.return_value = [result({"1": "a"}), result({"2": "b"})]
+        ret = sched.tick()
+        assert 99 < ret <= 100
+        mock_execute.assert_called_once_with(dryrun=False, pairs=sync.pairs)
+        mock_execute.reset_mock()
+        assert sched.tick() <= ret
+        mock_execute.assert_not_called()
+
+
+def test_daemon_adapt():
+    sched = daemon.Daemon(sync_group(), interval=100, min_interval=40, max_interval=300)
+    entry = sched.schedule[0]
+    sched.adapt(entry, result({"1": "a"}))
+    assert entry["interval"] == 100
+    sched.adapt(entry, result({"1": "a"}))
+    assert entry["interval"] == 200
+    sched.adapt(entry, result({"1": "a"}))
+    assert entry["interval"] == 300
+    sched.adapt(entry, result(None, ValueError("boom")))
+    assert entry["interval"] == 300
+    sched.adapt(entry, result({"1": "b"}))
+    assert entry["interval"] == 150
+    sched.adapt(entry, result({"1": "c"}))
+    sched.adapt(entry, result({"1": "d"}))
+    assert entry["interval"] == 40
+
+
+def test_daemon_delay():
+    sched = daemon.Daemon(sync_group(), jitter=0.1)
+    for _ in range(10):
+        assert 90 <= sched.delay(100) <= 110
+
+
+@mock.patch("signal.signal")
+def test_daemon_run(mock_signal):
+    sync = sync_group()
+    sched = daemon.Daemon(sync, interval=0, min_interval=0)
+
+    def execute(**_):
+        if mock_execute.call_count == 2:
+            sched.stop()
+        return [result({}), result({})]
+
+    with mock.patch.object(sync, "execute", side_effect=execute) as mock_execute:
+        sched.run(dryrun=True)
+    assert mock_execute.call_count == 2
+    mock_execute.assert_called_with(dryrun=True, pairs=sync.pairs)
+    assert mock_signal.call_count == 2
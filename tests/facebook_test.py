@@ -1,6 +1,14 @@
+import json
+from datetime import datetime
+from datetime import timezone
 from unittest import mock
 
+import pytest
+
 from fest import facebook
+from fest import metrics
+from fest import utils
+from fest import window
 
 
 def test_facebook_page_iter_events():
@@ -21,16 +29,73 @@ def test_facebook_page_iter_events():
 
 
 def test_facebook_page_iter_objects():
+    mockapi = mock.MagicMock()
+    results = {str(x): {"id": str(x)} for x in range(0, 100)}
+    mockapi.get_objects.side_effect = lambda ids, **_: {x: results[x] for x in ids}
+    page = facebook.FacebookPage(mockapi, "MyPage")
+    ret = page.get_objects(list(results.keys())).execute()
+    exp = list(results.values())
+    assert ret == exp
+    assert mockapi.get_objects.call_count == 2
+
+
+def test_facebook_page_iter_objects_unordered():
+    mockapi = mock.MagicMock()
+    results = {str(x): {"id": str(x)} for x in range(0, 120)}
+    mockapi.get_objects.side_effect = lambda ids, **_: {x: results[x] for x in ids}
+    page = facebook.FacebookPage(mockapi, "MyPage")
+    ret = list(page.iter_objects(list(results.keys()), ordered=False))
+    exp = list(results.values())
+    assert sorted(ret, key=lambda x: int(x["id"])) == exp
+
+
+@mock.patch("time.sleep")
+def test_facebook_page_iter_objects_retry(mock_sleep):
     mockapi = mock.MagicMock()
     results = {str(x): {"id": str(x)} for x in range(0, 100)}
     mockapi.get_objects.side_effect = [
         {k: v for k, v in list(results.items())[:50]},
+        ValueError,
         {k: v for k, v in list(results.items())[50:]},
     ]
-    page = facebook.FacebookPage(mockapi, "MyPage")
+    sink = metrics.MemorySink()
+    page = facebook.FacebookPage(mockapi, "MyPage", max_workers=1, metrics=sink)
     ret = page.get_objects(list(results.keys())).execute()
     exp = list(results.values())
     assert ret == exp
+    mock_sleep.assert_called_once()
+    assert sink.count("retries_total", api="graph") == 1
+    assert sink.count("objects_fetched_total", api="graph") == 100
+    assert sink.count("api_request_errors_total", endpoint="objects") == 1
+    assert len(sink.values("api_request_seconds", endpoint="objects")) == 3
+
+
+def test_facebook_page_throttle():
+    mockapi = mock.MagicMock()
+    mockapi.get_object.return_value = {"data": []}
+    mockapi.get_objects.side_effect = lambda ids, **_: {x: {"id": x} for x in ids}
+    limiter = mock.MagicMock()
+    limiter.acquire.return_value = 0.5
+    sink = metrics.MemorySink()
+    page = facebook.FacebookPage(mockapi, "MyPage", metrics=sink, limiter=limiter)
+    page.get_events().execute()
+    page.get_objects(["1", "2", "3"]).execute()
+    assert limiter.acquire.call_args_list == [mock.call(1), mock.call(3)]
+    assert sink.values("ratelimit_wait_seconds", api="graph") == [0.5, 0.5]
+
+
+def test_facebook_page_fetch_events_debug(caplog):
+    caplog.set_level("DEBUG", logger="fest.facebook.FacebookPage")
+    mockapi = mock.MagicMock()
+    mockapi.get_object.return_value = {"data": []}
+    sink = metrics.MemorySink()
+    page = facebook.FacebookPage(mockapi, "MyPage", metrics=sink)
+    assert page.get_events(time_filter="upcoming").execute() == []
+    assert "GET /MyPage/events?fields=" in caplog.text
+    assert sink.count("pages_fetched_total", api="graph") == 1
+    mockapi.get_objects.return_value = {}
+    assert page.get_objects(["1", "2"]).execute() == []
+    assert "GET /1,2" in caplog.text
 
 
 def test_facebook_page_explode_event():
@@ -70,6 +135,48 @@ def test_facebook_page_explode_event():
     assert ret == exp
 
 
+def test_facebook_page_explode_event_upcoming():
+    event = {
+        "id": "1",
+        "start_time": "2018-12-10T12:00:00-0500",
+        "event_times": [
+            {"id": "2", "start_time": "2018-12-10T12:00:00-0500"},
+            {"id": "3", "start_time": "2999-12-11T12:00:00-0500"},
+        ],
+    }
+    ret = list(facebook.FacebookPage.explode_event(event, time_filter="upcoming"))
+    exp = [{"id": "3", "start_time": "2999-12-11T12:00:00-0500"}]
+    assert ret == exp
+    ret = list(facebook.FacebookPage.explode_event(event, time_filter="past"))
+    exp = [{"id": "2", "start_time": "2018-12-10T12:00:00-0500"}]
+    assert ret == exp
+    ret = list(facebook.FacebookPage.explode_event({"id": "4"}))
+    assert ret == [{"id": "4"}]
+
+
+def test_facebook_occurrence():
+    event = {
+        "id": "1",
+        "name": "name",
+        "event_times": [{"id": "2", "end_time": "2018-12-10T13:00:00-0500"}],
+        "start_time": "2018-12-10T12:00:00-0500",
+    }
+    copy = {
+        "id": "2",
+        "name": "name",
+        "start_time": "2018-12-10T12:00:00-0500",
+        "end_time": "2018-12-10T13:00:00-0500",
+    }
+    occurrence = facebook.Occurrence(event, event["event_times"][0])
+    assert occurrence == copy
+    assert list(occurrence) == list(copy)
+    assert len(occurrence) == 4
+    assert "event_times" not in occurrence
+    assert occurrence.get("event_times") is None
+    assert utils.digest(dict(occurrence)) == utils.digest(copy)
+    assert repr(occurrence) == f"Occurrence({copy!r})"
+
+
 def test_facebook_event_location_string():
     ret = facebook.FacebookPage.location_string(
         {
@@ -120,7 +227,7 @@ def test_facebook_page_to_google():
         "extendedProperties": {
             "private": {
                 "facebookPageId": "MyPage",
-                "facebookDigest": "ca00a6786b8bb6acd2488080d70ea861b0db84f3",
+                "facebookDigest": "v2:eebb2429794652819fd490ccec273be46d1efa02",
                 "facebookId": "1234567890",
             }
         },
@@ -148,7 +255,7 @@ def test_facebook_page_to_google_no_end():
         "extendedProperties": {
             "private": {
                 "facebookPageId": "MyPage",
-                "facebookDigest": "262e76ded1c9944e4c08d84939b5ef354b2574c7",
+                "facebookDigest": "v2:f6bd5eea63decd82fe63531dd036a6970185673b",
                 "facebookId": "1234567890",
             }
         },
@@ -157,3 +264,176 @@ def test_facebook_page_to_google_no_end():
         "location": "place",
     }
     assert ret == exp
+
+
+def test_facebook_page_digest():
+    page = facebook.FacebookPage(None, "MyPage")
+    event = {
+        "id": "1",
+        "name": "name",
+        "start_time": "2018-02-11T11:00:00-0500",
+        "place": {"name": "place", "id": "2"},
+    }
+    reordered = dict(reversed(list(event.items())))
+    unrelated = dict(event, attending_count=42, place={"name": "place", "id": "3"})
+    changed = dict(event, name="new name")
+    assert page.digest(event) == page.digest(reordered) == page.digest(unrelated)
+    assert page.digest(event) != page.digest(changed)
+    assert page.digest(event).startswith("v2:")
+
+
+def test_facebook_page_digest_matches():
+    page = facebook.FacebookPage(None, "MyPage")
+    event = {"id": "1", "name": "name", "start_time": "2018-02-11T11:00:00-0500"}
+    changed = dict(event, name="new name")
+    legacy = utils.digest(event)
+    default = utils.digest(
+        {"name": "name", "start_time": "2018-02-11T11:00:00-0500", "id": "1"}
+    )
+    assert page.digest_matches(event, page.digest(event))
+    assert page.digest_matches(event, legacy)
+    assert page.digest_matches(event, default)
+    assert not page.digest_matches(changed, default)
+    assert not page.digest_matches(changed, page.digest(event))
+    assert not page.digest_matches(changed, legacy)
+    assert not page.digest_matches(event, None)
+
+
+def test_facebook_page_digest_matches_legacy_occurrence():
+    page = facebook.FacebookPage(None, "MyPage")
+    event_time = {
+        "start_time": "2018-02-11T11:00:00-0500",
+        "end_time": "2018-02-11T12:00:00-0500",
+        "id": "2",
+    }
+    default = {
+        "description": "desc",
+        "end_time": "2018-02-04T12:00:00-0500",
+        "name": "name",
+        "start_time": "2018-02-04T11:00:00-0500",
+        "event_times": [event_time],
+        "id": "1",
+    }
+    projected = {key: default[key] for key in facebook.EVENT_FIELDS if key in default}
+    legacy = dict(default)
+    del legacy["event_times"]
+    legacy.update(event_time)
+    occurrence = next(page.explode_event(projected))
+    assert list(occurrence)[0] == "id"
+    assert page.digest_matches(occurrence, utils.digest(legacy))
+
+
+def test_facebook_page_iter_events_window():
+    mockapi = mock.MagicMock()
+    mockapi.get_object.side_effect = [
+        {
+            "data": [
+                {"id": "3", "start_time": "2018-12-20T12:00:00-0500"},
+                {"id": "2", "start_time": "2018-12-15T12:00:00-0500"},
+            ],
+            "paging": {"cursors": {"after": "fizz"}},
+        },
+        {
+            "data": [{"id": "1", "start_time": "2018-12-10T12:00:00-0500"}],
+            "paging": {"cursors": {"after": "buzz"}},
+        },
+        {
+            "data": [{"id": "0", "start_time": "2018-12-09T12:00:00-0500"}],
+        },
+    ]
+    since = datetime(2018, 12, 12, tzinfo=timezone.utc)
+    until = datetime(2018, 12, 18, tzinfo=timezone.utc)
+    win = window.TimeWindow(since, until)
+    page = facebook.FacebookPage(mockapi, "MyPage")
+    ret = page.get_events(window=win).execute()
+    exp = [{"id": "2", "start_time": "2018-12-15T12:00:00-0500"}]
+    assert ret == exp
+    args = {"since": 1544572800, "until": 1545091200, "fields": mock.ANY}
+    assert mockapi.get_object.call_args_list == [
+        mock.call("MyPage/events", **args),
+        mock.call("MyPage/events", after="fizz", **args),
+    ]
+
+
+def test_facebook_page_fields():
+    mockapi = mock.MagicMock()
+    mockapi.get_object.side_effect = [{"data": []}, {"data": []}]
+    mockapi.get_objects.side_effect = [{}, {}]
+    page = facebook.FacebookPage(mockapi, "MyPage", fields=["cover", "name"])
+    exp = "id,name,description,start_time,end_time,event_times,place,cover"
+    page.get_events().execute()
+    page.get_events(fields="id").execute()
+    page.get_objects(["1"]).execute()
+    page.get_objects(["1"], fields="id").execute()
+    assert mockapi.get_object.call_args_list == [
+        mock.call("MyPage/events", fields=exp),
+        mock.call("MyPage/events", fields="id"),
+    ]
+    assert mockapi.get_objects.call_args_list == [
+        mock.call(["1"], fields=exp),
+        mock.call(["1"], fields="id"),
+    ]
+
+
+def batch_response(code, body):
+    return {"code": code, "body": json.dumps(body)}
+
+
+def test_facebook_page_group_get_events():
+    mockapi = mock.MagicMock()
+    mockapi.request.side_effect = [
+        [
+            batch_response(
+                200,
+                {
+                    "data": [{"id": "1"}],
+                    "paging": {"cursors": {"after": "fizz"}},
+                },
+            ),
+            batch_response(200, {"data": [{"id": "2"}]}),
+            batch_response(400, {"error": {"message": "Unsupported get request"}}),
+        ],
+        [
+            batch_response(200, {"data": [{"id": "3"}]}),
+        ],
+    ]
+    pages = [facebook.FacebookPage(mockapi, x) for x in ["Page1", "Page2", "Page3"]]
+    group = facebook.FacebookPageGroup(mockapi, pages)
+    ret = group.get_events(time_filter="upcoming")
+    assert ret["Page1"].execute() == [{"id": "1"}, {"id": "3"}]
+    assert ret["Page2"].execute() == [{"id": "2"}]
+    with pytest.raises(facebook.GraphBatchError):
+        ret["Page3"].execute()
+    batches = [
+        json.loads(x[1]["post_args"]["batch"]) for x in mockapi.request.call_args_list
+    ]
+    assert [[x["relative_url"].split("?")[0] for x in y] for y in batches] == [
+        ["Page1/events", "Page2/events", "Page3/events"],
+        ["Page1/events"],
+    ]
+    assert "after=fizz" in batches[1][0]["relative_url"]
+    assert "time_filter=upcoming" in batches[1][0]["relative_url"]
+
+
+def test_facebook_page_group_batch_size():
+    mockapi = mock.MagicMock()
+    mockapi.request.side_effect = lambda path, post_args: [
+        batch_response(200, {"data": []}) for _ in json.loads(post_args["batch"])
+    ]
+    pages = [facebook.FacebookPage(mockapi, str(x)) for x in range(120)]
+    limiter = mock.MagicMock()
+    group = facebook.FacebookPageGroup(mockapi, pages, limiter)
+    events, errors = group.fetch()
+    assert mockapi.request.call_count == 3
+    assert events == {str(x): [] for x in range(120)}
+    assert errors == {}
+    assert limiter.acquire.call_args_list == [
+        mock.call(50),
+        mock.call(50),
+        mock.call(20),
+    ]
+
+
+def test_facebook_page_group_parse_timeout():
+    with pytest.raises(facebook.GraphBatchError):
+        facebook.FacebookPageGroup.parse(None)
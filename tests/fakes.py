@@ -0,0 +1,259 @@
+"""
+In-process fakes of Graph API and Calendar API clients
+"""
+import json
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import facebook
+import requests
+
+START = datetime(2018, 12, 12, 12, tzinfo=timezone.utc)
+
+
+class HttpError(Exception):
+    """
+    Calendar API error with an HTTP status.
+    """
+
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = type("Response", (), {"status": status})()
+        self.content = b""
+
+
+def fevent(index, occurrences=0, revision=0):
+    """
+    Get synthetic facebook event, recurring if it has `occurrences`.
+    """
+    start = START + timedelta(hours=index)
+    event = {
+        "id": str(index),
+        "name": f"Event {index} rev {revision}",
+        "description": f"Description of event {index}",
+        "start_time": start.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "end_time": (start + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "place": {"name": "Boston Public Library"},
+    }
+    if occurrences:
+        event["event_times"] = [
+            {
+                "id": f"{index}.{x}",
+                "start_time": (start + timedelta(days=x)).strftime(
+                    "%Y-%m-%dT%H:%M:%S%z"
+                ),
+            }
+            for x in range(occurrences)
+        ]
+    return event
+
+
+class Backend:
+    """
+    Call counter with modeled latency & rate limiting.
+
+    Every `limit`-th call is throttled, if set.
+    """
+
+    def __init__(self, latency=0, limit=None):
+        self.latency = latency
+        self.limit = limit
+        self.calls = Counter()
+
+    def call(self, name):
+        """
+        Count call, sleeping for its latency.
+
+        Returns True if the call is throttled.
+        """
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return bool(self.limit) and sum(self.calls.values()) % self.limit == 0
+
+
+class FakeGraphAPI(Backend):
+    """
+    Graph API of pages of events, paginated by offset cursors.
+    """
+
+    def __init__(self, events=(), page_size=25, **kwargs):
+        super().__init__(**kwargs)
+        self.events = list(events)
+        self.page_size = page_size
+        self.objects = {x["id"]: x for x in self.events}
+
+    def throttle(self, name):
+        if self.call(name):
+            raise facebook.GraphAPIError(
+                {"error": {"code": 4, "message": "Application request limit"}}
+            )
+
+    def get_object(self, path, after=None, **_):
+        self.throttle("get_object")
+        offset = int(after or 0)
+        response = {"data": self.events[offset : offset + self.page_size]}
+        if offset + self.page_size < len(self.events):
+            after = str(offset + self.page_size)
+            response.update(paging={"cursors": {"after": after}})
+        return response
+
+    def get_objects(self, ids, **_):
+        self.throttle("get_objects")
+        return {x: self.objects[x] for x in ids if x in self.objects}
+
+
+class FakeCalendarAPI(Backend):
+    """
+    Calendar API of events listed by page token and written in batches.
+
+    Throttled batch sub-requests fail with HTTP 429.
+    """
+
+    def __init__(self, page_size=250, **kwargs):
+        super().__init__(**kwargs)
+        self.page_size = page_size
+        self.items = {}
+        self.serial = 0
+        self.listing = None
+
+    def events(self):
+        return FakeEvents(self)
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def list(self, pageToken=None, privateExtendedProperty=(), **_):
+        self.call("list")
+        if pageToken is None:
+            filters = [privateExtendedProperty]
+            if isinstance(privateExtendedProperty, list):
+                filters = privateExtendedProperty
+            props = dict(x.split("=", 1) for x in filters if x)
+            self.listing = [
+                x
+                for x in self.items.values()
+                if all(
+                    x["extendedProperties"]["private"].get(k) == v
+                    for k, v in props.items()
+                )
+            ]
+        offset = int(pageToken or 0)
+        response = {"items": self.listing[offset : offset + self.page_size]}
+        if offset + self.page_size < len(self.listing):
+            response.update(nextPageToken=str(offset + self.page_size))
+        return response
+
+    def insert(self, calendarId, body):
+        self.serial += 1
+        event = dict(body, id=f"g{self.serial}")
+        self.items[event["id"]] = event
+        return event
+
+    def update(self, calendarId, eventId, body):
+        event = dict(body, id=eventId)
+        self.items[eventId] = event
+        return event
+
+    def delete(self, calendarId, eventId):
+        del self.items[eventId]
+        return ""
+
+
+class FakeEvents:
+    """
+    Calendar API `events()` resource.
+    """
+
+    def __init__(self, api):
+        self.api = api
+
+    def list(self, **kwargs):
+        return FakeRequest(self.api.list, kwargs)
+
+    def insert(self, **kwargs):
+        return FakeRequest(self.api.insert, kwargs)
+
+    def update(self, **kwargs):
+        return FakeRequest(self.api.update, kwargs)
+
+    def delete(self, **kwargs):
+        return FakeRequest(self.api.delete, kwargs)
+
+
+class FakeRequest:
+    """
+    Calendar API request.
+    """
+
+    def __init__(self, func, kwargs):
+        self.func = func
+        self.kwargs = kwargs
+
+    def execute(self):
+        return self.func(**self.kwargs)
+
+
+class FakeBatch:
+    """
+    Calendar API batch request.
+    """
+
+    def __init__(self, api, callback):
+        self.api = api
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.api.call("batch")
+        for request_id, request in self.requests:
+            if self.api.call(request.func.__name__):
+                self.callback(request_id, None, HttpError(429))
+            else:
+                self.callback(request_id, request.execute(), None)
+
+
+def send(adapter, request, **kwargs):
+    """
+    Answer Graph API & Calendar API requests sent over HTTP, without network.
+
+    Pages list `fevent(0)` and `fevent(1)`, calendars are empty and every
+    batched insert succeeds. Patch over `requests.adapters.HTTPAdapter.send`.
+    """
+    # pylint: disable=unused-argument
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = "OK"
+    response.url = request.url
+    response.request = request
+    response.headers["content-type"] = "application/json; charset=UTF-8"
+    if "graph.facebook.com" in request.url:
+        body = {"data": [fevent(0), fevent(1)], "paging": {}}
+    elif "/batch/" in request.url:
+        body = (
+            request.body.decode() if isinstance(request.body, bytes) else request.body
+        )
+        content_ids = re.findall(r"<([0-9a-f-]{36}) \+ ([^>]*)>", body)
+        parts = [
+            "--fake\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <response-{base} + {request_id}>\r\n\r\n"
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/json\r\n\r\n"
+            f'{{"id": "g{request_id}"}}\r\n'
+            for base, request_id in content_ids
+        ]
+        response.headers["content-type"] = "multipart/mixed; boundary=fake"
+        response._content = ("".join(parts) + "--fake--").encode()
+        return response
+    else:
+        body = {"items": []}
+    response._content = json.dumps(body).encode()
+    return response
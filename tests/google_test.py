@@ -1,9 +1,19 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
 from unittest import mock
 
 import pytest
 
 from fest import facebook
 from fest import google
+from fest import metrics
+from fest import state
+from fest import window
+from tests import fakes
 
 
 def test_google_page_iter_events():
@@ -21,6 +31,9 @@ def test_google_page_iter_events():
     ret = gcal.get_events().filter(lambda x: x["id"] < "4").execute()
     exp = [{"id": "1"}, {"id": "2"}, {"id": "3"}]
     assert ret == exp
+    mockapi.events.return_value.list.assert_called_with(
+        calendarId="MyGCal", pageToken="fizz"
+    )
 
 
 def test_google_page_sync():
@@ -141,7 +154,7 @@ def test_google_page_sync():
             },
             "extendedProperties": {
                 "private": {
-                    "facebookDigest": "6a1960a370ba8f16031d729ebfdbccb1110b5fd7",
+                    "facebookDigest": "v2:1b5def650f6c5f0627e44e914779d5ec194f61e0",
                     "facebookId": "3",
                     "facebookPageId": "MyPage",
                 },
@@ -167,7 +180,7 @@ def test_google_page_sync():
             },
             "extendedProperties": {
                 "private": {
-                    "facebookDigest": "505f25b09ebde5a6e2587849d364d118ad740454",
+                    "facebookDigest": "v2:1b27aee0d5dcef4b6fac68c4e52bf9352d7fcf5f",
                     "facebookId": "2",
                     "facebookPageId": "MyPage",
                 },
@@ -178,9 +191,10 @@ def test_google_page_sync():
         calendarId="MyGCal",
         eventId="4",
     )
+    mockf.get_objects.assert_called_once_with(["4"], fields="id")
 
 
-@mock.patch("fest.utils.digest")
+@mock.patch("fest.utils.canonical_digest")
 def test_google_page_sync_multibatch(mock_digest):
     mock_digest.return_value = "<digest>"
     mockf = mock.MagicMock()
@@ -283,7 +297,7 @@ def test_callback():
             "private": {"facebookId": "1"},
         },
     }
-    callback("id", res, None)
+    callback("1", res, None)
     assert sync.responses["POST"] == {"1": res}
 
 
@@ -292,6 +306,635 @@ def test_callback_err():
     gcal = google.GoogleCalendar(mockapi, "MyGCal")
     page = facebook.FacebookPage(mockapi, "MyPage")
     sync = gcal.sync(page, time_filter="upcoming")
-    callback = sync.callbackgen([])
+    callback = sync.callbackgen("POST")
+    err = ValueError()
+    callback("1", None, err)
+    assert sync.errors["POST"] == {"1": err}
+    assert sync.responses["POST"] == {}
+
+
+def http_error(status, content=b""):
+    err = Exception(f"<HttpError {status}>")
+    err.resp = mock.MagicMock(status=status)
+    err.content = content
+    return err
+
+
+def test_retryable():
+    assert google.retryable(http_error(429))
+    assert google.retryable(http_error(503))
+    assert google.retryable(http_error(403, b'{"reason": "rateLimitExceeded"}'))
+    assert not google.retryable(http_error(403, b'{"reason": "forbidden"}'))
+    assert not google.retryable(http_error(404))
+    assert not google.retryable(ValueError())
+
+
+class FakeBatch:
+    def __init__(self, callback, outcomes):
+        self.callback = callback
+        self.outcomes = outcomes
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append(request_id)
+
+    def execute(self):
+        for request_id in self.requests:
+            err = self.outcomes[request_id].pop(0)
+            self.callback(request_id, None if err else {"id": request_id}, err)
+
+
+@mock.patch("time.sleep")
+def test_execbatch_batch_error(mock_sleep):
+    failures = [http_error(503)]
+    outcomes = {"1": [None, None], "2": [None]}
+
+    def new_batch(callback):
+        batch = FakeBatch(callback, outcomes)
+        if failures:
+            batch.execute = mock.MagicMock(side_effect=failures.pop(0))
+        return batch
+
+    mockapi = mock.MagicMock()
+    mockapi.new_batch_http_request.side_effect = new_batch
+    controller = google.BatchController()
+    gcal = google.GoogleCalendar(mockapi, "MyGCal", controller=controller)
+    sync = gcal.sync(facebook.FacebookPage(mockapi, "MyPage"))
+    sync.requests["POST"] = {x: {"calendarId": "MyGCal"} for x in outcomes}
+    sync.execbatch(mockapi.events.return_value.insert, "POST")
+    assert sorted(sync.responses["POST"]) == ["1", "2"]
+    assert sync.errors["POST"] == {}
+    assert controller.size < google.MAX_BATCH_REQUESTS
+    mock_sleep.assert_called_once()
+    failures.append(http_error(400))
+    sync.requests["PUT"] = {"1": {"calendarId": "MyGCal", "eventId": "g1"}}
+    with pytest.raises(Exception, match="400"):
+        sync.execbatch(mockapi.events.return_value.update, "PUT")
+
+
+def test_batch_controller():
+    controller = google.BatchController(max_concurrency=4, max_size=50, min_size=5)
+    assert (controller.concurrency, controller.size) == (1, 50)
+    for _ in range(5):
+        controller.record(0.1)
+    assert (controller.concurrency, controller.size) == (4, 50)
+    controller.record(0.1, limited=True)
+    assert (controller.concurrency, controller.size) == (2, 25)
+    controller.record(60)
+    controller.record(60)
+    controller.record(60)
+    assert (controller.concurrency, controller.size) == (1, 5)
+    controller.record(0.1)
+    assert (controller.concurrency, controller.size) == (2, 10)
+
+
+def test_dispatch_concurrent():
+    lock = threading.Lock()
+    state = {"inflight": 0, "peak": 0, "sizes": []}
+
+    class SlowBatch(FakeBatch):
+        def execute(self):
+            with lock:
+                state["inflight"] += 1
+                state["peak"] = max(state["peak"], state["inflight"])
+                state["sizes"].append(len(self.requests))
+            time.sleep(0.05)
+            with lock:
+                state["inflight"] -= 1
+            super().execute()
+
+    outcomes = {str(x): [None] for x in range(200)}
+    mockapi = mock.MagicMock()
+    mockapi.new_batch_http_request.side_effect = lambda x: SlowBatch(x, outcomes)
+    controller = google.BatchController(max_concurrency=3, max_size=20)
+    gcal = google.GoogleCalendar(mockapi, "MyGCal", controller=controller)
+    page = facebook.FacebookPage(mockapi, "MyPage")
+    sync = gcal.sync(page)
+    sync.requests["POST"] = {x: {"calendarId": "MyGCal"} for x in outcomes}
+    sync.execbatch(mockapi.events.return_value.insert, "POST")
+    assert sorted(sync.responses["POST"]) == sorted(outcomes)
+    assert state["peak"] == 3
+    assert max(state["sizes"]) == 20
+    assert controller.concurrency == 3
+
+
+@mock.patch("time.sleep")
+def test_execbatch_retry(mock_sleep, caplog):
+    caplog.set_level("DEBUG", logger="fest.google.GoogleCalendar")
+    outcomes = {
+        "1": [None],
+        "2": [http_error(429), http_error(503), None],
+        "3": [http_error(404)],
+        "4": [http_error(500), http_error(500), http_error(500), http_error(500)],
+    }
+    mockapi = mock.MagicMock()
+    mockapi.new_batch_http_request.side_effect = lambda x: FakeBatch(x, outcomes)
+    sink = metrics.MemorySink()
+    gcal = google.GoogleCalendar(mockapi, "MyGCal", metrics=sink)
+    page = facebook.FacebookPage(mockapi, "MyPage")
+    sync = gcal.sync(page)
+    sync.requests["POST"] = {x: {"calendarId": "MyGCal"} for x in outcomes}
+    sync.execbatch(mockapi.events.return_value.insert, "POST")
+    assert sorted(sync.responses["POST"]) == ["1", "2"]
+    assert sorted(sync.errors["POST"]) == ["3", "4"]
+    assert mockapi.new_batch_http_request.call_count == 4
+    assert mock_sleep.call_count == 3
+    assert sink.values("batch_size", verb="POST") == [4, 2, 2, 1]
+    assert len(sink.values("api_request_seconds", endpoint="batch")) == 4
+    assert sink.count("retries_total", api="calendar", verb="POST") == 5
+    assert sink.count("requests_executed_total", verb="POST", status="ok") == 2
+    assert sink.count("requests_executed_total", verb="POST", status="error") == 2
+    assert "POST /MyGCal/events/" in caplog.text
+    assert "POST x 2" in caplog.text
+
+
+def test_google_page_sync_metrics(caplog):
+    caplog.set_level("DEBUG", logger="fest.google.GoogleCalendar")
+    mockf = mock.MagicMock()
+    mockf.get_object.return_value = {
+        "data": [
+            {"id": "1", "start_time": "2018-12-12T12:00:00-0500"},
+            {"id": "2", "start_time": "2018-12-13T12:00:00-0500"},
+        ],
+    }
+    mockf.get_objects.return_value = {}
+    mockg = mock.MagicMock()
+    mockg.events.return_value.list.return_value.execute.return_value = {
+        "items": [gevent("g2", "2"), gevent("g3", "3")],
+    }
+    mockg.new_batch_http_request.side_effect = lambda x: FakeBatch(
+        x, {"1": [None], "2": [None], "3": [None]}
+    )
+    sink = metrics.MemorySink()
+    limiter = mock.MagicMock()
+    limiter.acquire.return_value = 0.0
+    page = facebook.FacebookPage(mockf, "MyPage", metrics=sink)
+    gcal = google.GoogleCalendar(mockg, "MyGCal", metrics=sink, limiter=limiter)
+    gcal.sync(page).execute()
+    assert limiter.acquire.call_args_list == [mock.call(1)] * 4
+    assert sink.values("ratelimit_wait_seconds", api="calendar") == [0.0] * 4
+    for verb in ("POST", "PUT", "DELETE"):
+        assert sink.count("requests_planned_total", verb=verb) == 1
+        assert sink.count("requests_executed_total", verb=verb, status="ok") == 1
+    assert sink.count("pages_fetched_total", api="calendar") == 1
+    assert sink.count("pages_fetched_total", api="graph") == 1
+    assert "GET /MyGCal?" in caplog.text
+
+
+def gevent(google_id, facebook_id, status=None):
+    event = {
+        "id": google_id,
+        "start": {"dateTime": "2018-12-12T12:00:00-05:00"},
+        "end": {"dateTime": "2018-12-12T13:00:00-05:00"},
+        "extendedProperties": {
+            "private": {
+                "facebookId": facebook_id,
+                "facebookPageId": "MyPage",
+                "facebookDigest": "<digest>",
+            }
+        },
+    }
+    if status:
+        event.update(status=status)
+    return event
+
+
+def test_google_calendar_record():
+    ret = google.GoogleCalendar.record(gevent("g1", "1"))
+    exp = {
+        "google_id": "g1",
+        "facebook_id": "1",
+        "page_id": "MyPage",
+        "parent_id": None,
+        "digest": "<digest>",
+        "start": "2018-12-12T17:00:00+00:00",
+        "end": "2018-12-12T18:00:00+00:00",
+    }
+    assert ret == exp
+
+
+def test_google_calendar_iter_index_incremental(tmp_path):
+    mockapi = mock.MagicMock()
+    mockapi.events.return_value.list.return_value.execute.side_effect = [
+        {"items": [gevent("g1", "1"), gevent("g2", "2")], "nextPageToken": "p"},
+        {"items": [{"id": "x"}], "nextSyncToken": "s1"},
+        {"items": [gevent("g1", "1", "cancelled")], "nextSyncToken": "s2"},
+    ]
+    store = state.FileStore(str(tmp_path / "state.json"))
+    gcal = google.GoogleCalendar(mockapi, "MyGCal", store=store)
+    ret = [x["google_id"] for x in gcal.iter_index("MyPage")]
+    assert ret == ["g1", "g2"]
+    assert store.get_meta("MyGCal", "syncToken") == "s1"
+    ret = [x["google_id"] for x in gcal.iter_index("MyPage")]
+    assert ret == ["g2"]
+    assert store.get_meta("MyGCal", "syncToken") == "s2"
+    mockapi.events.return_value.list.assert_called_with(
+        calendarId="MyGCal",
+        fields=google.INDEX_FIELDS,
+        maxResults=2500,
+        singleEvents=True,
+        syncToken="s1",
+    )
+
+
+def test_google_calendar_iter_index_gone(tmp_path):
+    gone = Exception("Gone")
+    gone.resp = mock.MagicMock(status=410)
+    mockapi = mock.MagicMock()
+    mockapi.events.return_value.list.return_value.execute.side_effect = [
+        gone,
+        {"items": [gevent("g3", "3")], "nextSyncToken": "s2"},
+    ]
+    store = state.FileStore(str(tmp_path / "state.json"))
+    store.update("MyGCal", [google.GoogleCalendar.record(gevent("g1", "1"))])
+    store.update("MyGCal", syncToken="s1")
+    gcal = google.GoogleCalendar(mockapi, "MyGCal", store=store)
+    ret = [x["google_id"] for x in gcal.iter_index("MyPage")]
+    assert ret == ["g3"]
+    assert store.get_meta("MyGCal", "syncToken") == "s2"
+
+
+def test_google_calendar_iter_index_err(tmp_path):
+    mockapi = mock.MagicMock()
+    mockapi.events.return_value.list.return_value.execute.side_effect = [
+        ValueError,
+    ]
+    store = state.FileStore(str(tmp_path / "state.json"))
+    store.update("MyGCal", syncToken="s1")
+    gcal = google.GoogleCalendar(mockapi, "MyGCal", store=store)
     with pytest.raises(ValueError):
-        callback("id", "response", ValueError)
+        list(gcal.iter_index("MyPage"))
+
+
+def test_google_calendar_iter_index_reconcile_interval(tmp_path):
+    mockapi = mock.MagicMock()
+    mockapi.events.return_value.list.return_value.execute.side_effect = [
+        {"items": [gevent("g1", "1")], "nextSyncToken": "s1"},
+    ]
+    store = state.FileStore(str(tmp_path / "state.json"))
+    gcal = google.GoogleCalendar(mockapi, "MyGCal", store=store, reconcile_interval=60)
+    assert [x["google_id"] for x in gcal.iter_index("MyPage")] == ["g1"]
+    assert [x["google_id"] for x in gcal.iter_index("MyPage")] == ["g1"]
+    mockapi.events.return_value.list.assert_called_once()
+    store.update("MyGCal", reconciledAt=0)
+    assert gcal.reconcile_due()
+
+
+@pytest.mark.parametrize("path", ["state.json", "state.db"])
+def test_google_calendar_iter_index_serialized(path, tmp_path):
+    lock = threading.Lock()
+    listing = []
+
+    def execute():
+        assert lock.acquire(blocking=False), "concurrent reconciliation"
+        listing.append(len(listing))
+        time.sleep(0.01)
+        lock.release()
+        return {"items": [gevent("g1", "1")], "nextSyncToken": f"s{len(listing)}"}
+
+    mockapi = mock.MagicMock()
+    mockapi.events.return_value.list.return_value.execute.side_effect = execute
+    store = state.open_store(str(tmp_path / path))
+    gcals = [google.GoogleCalendar(mockapi, "MyGCal", store=store) for _ in range(4)]
+    with mock.patch.object(store, "clear", wraps=store.clear) as mock_clear:
+        with ThreadPoolExecutor(4) as executor:
+            rets = list(executor.map(lambda x: list(x.iter_index("MyPage")), gcals))
+    assert [[x["google_id"] for x in ret] for ret in rets] == [["g1"]] * 4
+    assert len(listing) == 4
+    mock_clear.assert_called_once_with("MyGCal")
+    assert store.calendar_lock("MyGCal") is store.calendar_lock("MyGCal")
+
+
+def test_google_page_sync_save_index(tmp_path):
+    mockf = mock.MagicMock()
+    mockg = mock.MagicMock()
+    fevent = {
+        "id": "1",
+        "start_time": "2018-12-12T12:00:00-0500",
+        "end_time": "2018-12-12T13:00:00-0500",
+    }
+    mockf.get_object.side_effect = [{"data": [fevent]}]
+    mockf.get_objects.side_effect = [{}]
+    store = state.FileStore(str(tmp_path / "state.json"))
+    store.update("MyGCal", [google.GoogleCalendar.record(gevent("g2", "2"))])
+    store.update("MyGCal", reconciledAt=time.time())
+    gcal = google.GoogleCalendar(mockg, "MyGCal", store=store, reconcile_interval=60)
+    page = facebook.FacebookPage(mockf, "MyPage")
+    sync = gcal.sync(page)
+    sync.callbackgen("POST")("1", gevent("g1", "1"), None)
+    sync.callbackgen("DELETE")("2", {}, None)
+    sync.execute()
+    mockg.events.return_value.list.assert_not_called()
+    assert sync.requests["DELETE"] == {"2": {"calendarId": "MyGCal", "eventId": "g2"}}
+    assert [x["google_id"] for x in store.iter_events("MyGCal")] == ["g1"]
+
+
+def test_google_page_sync_no_probe():
+    mockf = mock.MagicMock()
+    mockg = mock.MagicMock()
+    mockf.get_object.side_effect = [
+        {"data": [{"id": "1", "start_time": "2018-12-12T12:00:00-0500"}]},
+    ]
+    mockg.events.return_value.list.return_value.execute.side_effect = [
+        {"items": [gevent("g1", "1"), gevent("g2", "2")]},
+    ]
+    gcal = google.GoogleCalendar(mockg, "MyGCal")
+    page = facebook.FacebookPage(mockf, "MyPage")
+    sync = gcal.sync(page, probe=False).execute()
+    mockf.get_objects.assert_not_called()
+    assert sync.requests["DELETE"] == {"2": {"calendarId": "MyGCal", "eventId": "g2"}}
+
+
+def test_google_page_sync_window():
+    mockf = mock.MagicMock()
+    mockg = mock.MagicMock()
+    mockf.get_object.side_effect = [
+        {"data": [{"id": "1", "start_time": "2018-12-12T12:00:00-0500"}]},
+    ]
+    mockg.events.return_value.list.return_value.execute.side_effect = [
+        {"items": []},
+    ]
+    since = datetime(2018, 12, 1, tzinfo=timezone.utc)
+    gcal = google.GoogleCalendar(mockg, "MyGCal")
+    page = facebook.FacebookPage(mockf, "MyPage")
+    gcal.sync(page, window=window.TimeWindow(since)).execute()
+    mockg.events.return_value.list.assert_called_once_with(
+        calendarId="MyGCal",
+        fields=google.INDEX_FIELDS,
+        maxResults=2500,
+        singleEvents=True,
+        privateExtendedProperty="facebookPageId=MyPage",
+        timeMin="2018-12-01T00:00:00+0000",
+        timeMax="2018-12-12T12:00:00-0500",
+    )
+
+
+def test_google_calendar_sync_events():
+    mockf = mock.MagicMock()
+    mockg = mock.MagicMock()
+    mockf.get_objects.return_value = {
+        "1": {"id": "1", "start_time": "2018-12-12T12:00:00-0500"},
+        "3": {"id": "3", "start_time": "2018-12-14T12:00:00-0500"},
+    }
+
+    def list_events(privateExtendedProperty, **_):
+        items = {
+            "facebookId=1": [gevent("g1", "1")],
+            "facebookId=2": [gevent("g2", "2")],
+            "facebookParentId=1": [gevent("g1", "1")],
+        }
+        facebook_id = privateExtendedProperty[1]
+        return mock.MagicMock(
+            execute=mock.MagicMock(return_value={"items": items.get(facebook_id, [])})
+        )
+
+    mockg.events.return_value.list.side_effect = list_events
+    gcal = google.GoogleCalendar(mockg, "MyGCal")
+    page = facebook.FacebookPage(mockf, "MyPage")
+    sync = gcal.sync_events(page, ["1", "2", "3"], removed=["2"]).execute()
+    mockf.get_objects.assert_called_once_with(["1", "3"], fields=page.fields)
+    assert list(sync.requests["POST"]) == ["3"]
+    assert list(sync.requests["PUT"]) == ["1"]
+    assert sync.requests["DELETE"] == {"2": {"calendarId": "MyGCal", "eventId": "g2"}}
+    assert mockg.events.return_value.list.call_count == 6
+
+
+@pytest.mark.parametrize("store", [None, "state.json"])
+def test_google_calendar_sync_events_recurring(store, tmp_path):
+    graphapi = fakes.FakeGraphAPI([fakes.fevent(1, occurrences=3), fakes.fevent(2)])
+    calendarapi = fakes.FakeCalendarAPI()
+    store = store and state.open_store(str(tmp_path / store))
+    gcal = google.GoogleCalendar(calendarapi, "MyGCal", store=store)
+    page = facebook.FacebookPage(graphapi, "MyPage")
+    gcal.sync(page).execute()
+    assert len(calendarapi.items) == 4
+    parents = [
+        x["extendedProperties"]["private"].get("facebookParentId")
+        for x in calendarapi.items.values()
+    ]
+    assert sorted(parents, key=str) == ["1", "1", "1", None]
+
+    # Occurrence dropped from an edited event
+    graphapi.objects["1"] = fakes.fevent(1, occurrences=2, revision=1)
+    sync = gcal.sync_events(page, ["1"]).execute()
+    assert sorted(sync.requests["PUT"]) == ["1.0", "1.1"]
+    assert list(sync.requests["DELETE"]) == ["1.2"]
+    assert len(calendarapi.items) == 3
+
+    # Removed event
+    del graphapi.objects["1"]
+    sync = gcal.sync_events(page, ["1"], removed=["1"]).execute()
+    assert sorted(sync.requests["DELETE"]) == ["1.0", "1.1"]
+    assert len(calendarapi.items) == 1
+
+
+def test_google_calendar_iter_index_ids(tmp_path):
+    store = state.FileStore(str(tmp_path / "state.json"))
+    records = [google.GoogleCalendar.record(gevent(f"g{x}", x)) for x in "123"]
+    store.update("MyGCal", records, reconciledAt=time.time())
+    gcal = google.GoogleCalendar(
+        mock.MagicMock(), "MyGCal", store=store, reconcile_interval=60
+    )
+    ret = [x["google_id"] for x in gcal.iter_index("MyPage", facebook_ids={"1", "3"})]
+    assert ret == ["g1", "g3"]
+
+
+def sync_slices(fevents, gevents, probe=False, found=()):
+    def get_object(path, since=None, until=None, **_):
+        data = [
+            x
+            for x in fevents
+            if (since is None or parse(x["start_time"]).timestamp() >= since)
+            and (until is None or parse(x["start_time"]).timestamp() < until)
+        ]
+        return {"data": data}
+
+    def list_events(timeMin=None, timeMax=None, privateExtendedProperty=None, **_):
+        props = privateExtendedProperty
+        facebook_id = props[1].split("=")[1] if isinstance(props, list) else None
+        items = [
+            x
+            for x in gevents
+            if (timeMin is None or parse(x["end"]["dateTime"]) > parse(timeMin))
+            and (timeMax is None or parse(x["start"]["dateTime"]) < parse(timeMax))
+            and facebook_id in (None, x["extendedProperties"]["private"]["facebookId"])
+        ]
+        return mock.MagicMock(execute=mock.MagicMock(return_value={"items": items}))
+
+    def execbatch(sync, method, verb, dryrun):
+        planned[verb].extend(sync.requests[verb])
+        sync.responses[verb].update({x: {} for x in sync.requests[verb]})
+
+    mockf = mock.MagicMock()
+    mockf.get_object.side_effect = get_object
+    mockf.get_objects.return_value = {x: {"id": x} for x in found}
+    mockg = mock.MagicMock()
+    mockg.events.return_value.list.side_effect = list_events
+    planned = {"POST": [], "PUT": [], "DELETE": []}
+    gcal = google.GoogleCalendar(mockg, "MyGCal")
+    page = facebook.FacebookPage(mockf, "MyPage")
+    with mock.patch.object(google.GoogleSyncFuture, "execbatch", execbatch):
+        sync = gcal.sync_slices(
+            page,
+            probe=probe,
+            window=window.TimeWindow(
+                datetime(2018, 1, 1, tzinfo=timezone.utc),
+                datetime(2018, 7, 1, tzinfo=timezone.utc),
+            ),
+            span=timedelta(days=60),
+        ).execute()
+    return planned, sync, mockf, mockg
+
+
+def gevent_at(google_id, facebook_id, start, end=None):
+    event = gevent(google_id, facebook_id)
+    event["start"] = {"dateTime": f"{start}T12:00:00-05:00"}
+    event["end"] = {"dateTime": f"{end or start}T13:00:00-05:00"}
+    return event
+
+
+def test_google_calendar_sync_slices():
+    fevents = [
+        {"id": "1", "start_time": "2018-01-10T12:00:00-0500"},
+        {"id": "2", "start_time": "2018-06-10T12:00:00-0500"},
+    ]
+    gevents = [gevent_at("g1", "1", "2018-01-10"), gevent_at("g3", "3", "2018-03-10")]
+    planned, sync, mockf, mockg = sync_slices(fevents, gevents)
+    assert planned == {"POST": ["2"], "PUT": ["1"], "DELETE": ["3"]}
+    assert sync.counts == {"POST": 1, "PUT": 1, "DELETE": 1}
+    assert sync.digests.startswith("v2:")
+    assert mockf.get_object.call_count == 4
+    assert mockg.events.return_value.list.call_count == 5
+
+
+def test_google_calendar_sync_slices_moved():
+    fevents = [{"id": "1", "start_time": "2018-05-01T12:00:00-0500"}]
+    gevents = [gevent_at("g1", "1", "2018-01-02")]
+    planned, *_ = sync_slices(fevents, gevents, probe=True, found=["1"])
+    assert planned == {"POST": [], "PUT": ["1"], "DELETE": []}
+
+
+def test_google_calendar_sync_slices_long_event():
+    fevents = [
+        {
+            "id": "1",
+            "start_time": "2018-01-10T12:00:00-0500",
+            "end_time": "2018-05-10T13:00:00-0500",
+        }
+    ]
+    gevents = [gevent_at("g1", "1", "2018-01-10", "2018-05-10")]
+    planned, *_ = sync_slices(fevents, gevents)
+    assert planned == {"POST": [], "PUT": ["1"], "DELETE": []}
+
+
+@pytest.mark.parametrize("method", ["sync", "sync_pipelined"])
+def test_google_sync_future_save_index_on_error(method, tmp_path):
+    runbatch = google.GoogleSyncFuture.runbatch
+    calls = []
+
+    def flaky(sync, *args, **kwargs):
+        calls.append(1)
+        if len(calls) > 1:
+            raise ValueError("boom")
+        return runbatch(sync, *args, **kwargs)
+
+    graphapi = fakes.FakeGraphAPI([fakes.fevent(x) for x in range(60)])
+    store = state.FileStore(str(tmp_path / "state.json"))
+    gcal = google.GoogleCalendar(
+        fakes.FakeCalendarAPI(), "MyGCal", store=store, reconcile_interval=3600
+    )
+    page = facebook.FacebookPage(graphapi, "MyPage")
+    with mock.patch.object(google.GoogleSyncFuture, "runbatch", flaky):
+        with pytest.raises(ValueError):
+            getattr(gcal, method)(page).execute()
+    assert len(list(store.iter_events("MyGCal"))) == 50
+
+
+@mock.patch("fest.google.MAX_LOOKUPS", 1)
+def test_google_sync_future_lookup():
+    mockg = mock.MagicMock()
+    mockg.events.return_value.list.return_value.execute.return_value = {
+        "items": [gevent("g1", "1"), gevent("g3", "3")]
+    }
+    gcal = google.GoogleCalendar(mockg, "MyGCal")
+    page = facebook.FacebookPage(mock.MagicMock(), "MyPage")
+    sync = google.GoogleSyncFuture(None, page, gcal, resolve=True)
+    assert sync.lookup([]) == {}
+    assert list(sync.lookup(["1", "2"])) == ["1"]
+    mockg.events.return_value.list.assert_called_once_with(
+        calendarId="MyGCal",
+        fields=google.INDEX_FIELDS,
+        maxResults=google.MAX_RESULTS,
+        singleEvents=True,
+        privateExtendedProperty="facebookPageId=MyPage",
+    )
+
+
+def test_google_calendar_sync_slices_empty():
+    mockf = mock.MagicMock()
+    mockf.get_object.return_value = {"data": []}
+    mockg = mock.MagicMock()
+    mockg.events.return_value.list.return_value.execute.return_value = {"items": []}
+    since = datetime(2018, 12, 1, tzinfo=timezone.utc)
+    gcal = google.GoogleCalendar(mockg, "MyGCal")
+    page = facebook.FacebookPage(mockf, "MyPage")
+    sync = gcal.sync_slices(page, window=window.TimeWindow(since)).execute()
+    assert sync.counts == {"POST": 0, "PUT": 0, "DELETE": 0}
+    assert sync.digests is None
+
+
+def parse(string):
+    return datetime.strptime(string, "%Y-%m-%dT%H:%M:%S%z")
+
+
+def test_google_calendar_sync_pipelined():
+    mockf = mock.MagicMock()
+    mockf.get_object.side_effect = [
+        {
+            "data": [
+                {"id": "1", "start_time": "2018-12-12T12:00:00-0500"},
+                {"id": "2", "start_time": "2018-12-13T12:00:00-0500"},
+                {"id": "3", "start_time": "2018-12-14T12:00:00-0500"},
+            ],
+            "paging": {"cursors": {"after": "p2"}},
+        },
+        {"data": [{"id": "2", "start_time": "2018-12-13T12:00:00-0500"}]},
+    ]
+    mockg = mock.MagicMock()
+    mockg.events.return_value.list.return_value.execute.return_value = {
+        "items": [gevent("g1", "1"), gevent("g4", "4")],
+    }
+    batches = []
+
+    def execbatch(sync, method, verb, dryrun=False, requests=None):
+        batches.append((verb, list(requests)))
+
+    controller = google.BatchController(max_size=2, min_size=2)
+    gcal = google.GoogleCalendar(mockg, "MyGCal", controller=controller)
+    page = facebook.FacebookPage(mockf, "MyPage")
+    with mock.patch.object(google.GoogleSyncFuture, "execbatch", execbatch):
+        sync = gcal.sync_pipelined(page, probe=False, time_filter="upcoming")
+        sync.execute()
+    assert batches == [("POST", ["2", "3"]), ("PUT", ["1"]), ("DELETE", ["4"])]
+    assert sorted(sync.digests) == ["1", "2", "3"]
+    kwargs = mockg.events.return_value.list.call_args[1]
+    assert "timeMin" in kwargs and "timeMax" not in kwargs
+
+
+def test_google_calendar_sync_pipelined_write_err():
+    mockf = mock.MagicMock()
+    mockf.get_object.return_value = {
+        "data": [
+            {"id": str(x), "start_time": "2018-12-12T12:00:00-0500"} for x in range(10)
+        ],
+    }
+    mockg = mock.MagicMock()
+    mockg.events.return_value.list.return_value.execute.return_value = {"items": []}
+    controller = google.BatchController(max_size=1, min_size=1)
+    gcal = google.GoogleCalendar(mockg, "MyGCal", controller=controller)
+    page = facebook.FacebookPage(mockf, "MyPage")
+    sync = gcal.sync_pipelined(page, depth=1)
+    with mock.patch.object(sync, "execbatch", side_effect=ValueError("boom")):
+        with pytest.raises(ValueError):
+            sync.execute()
+    assert len(sync.requests["POST"]) == 10
@@ -0,0 +1,110 @@
+import json
+from unittest import mock
+
+from fest import group
+
+
+def test_sync_group_pair():
+    ret = [
+        group.SyncGroup.pair(("MyPage", "MyGCal")),
+        group.SyncGroup.pair(["MyPage", "MyGCal", "upcoming"]),
+        group.SyncGroup.pair({"page_id": "MyPage", "calendar_id": "MyGCal"}),
+    ]
+    exp = [
+        {"page_id": "MyPage", "calendar_id": "MyGCal", "time_filter": None},
+        {"page_id": "MyPage", "calendar_id": "MyGCal", "time_filter": "upcoming"},
+        {"page_id": "MyPage", "calendar_id": "MyGCal", "time_filter": None},
+    ]
+    assert ret == exp
+
+
+@mock.patch("fest.google.GoogleCalendar.sync")
+def test_sync_group_execute(mock_sync):
+    err = ValueError("boom")
+
+    def sync(page, **_):
+        if page.id == "BadPage":
+            raise err
+        return mock.DEFAULT
+
+    mock_sync.side_effect = sync
+    mock_sync.return_value.execute.return_value.responses = {
+        "POST": {},
+        "PUT": {},
+        "DELETE": {},
+    }
+    mock_sync.return_value.execute.return_value.errors = {
+        "POST": {"1": err},
+        "PUT": {},
+        "DELETE": {},
+    }
+    mockf = mock.MagicMock()
+    mockg = mock.MagicMock()
+    pairs = [
+        ("Page1", "GCal1", "upcoming"),
+        ("BadPage", "GCal2"),
+        {"page_id": "Page3", "calendar_id": "GCal3"},
+    ]
+    ret = group.SyncGroup(mockf, mockg, pairs, max_workers=2).execute()
+    assert [x["page_id"] for x in ret] == ["Page1", "BadPage", "Page3"]
+    assert [x["error"] for x in ret] == [None, err, None]
+    assert ret[0]["responses"] == {"POST": {}, "PUT": {}, "DELETE": {}}
+    assert ret[1]["responses"] is None
+    assert ret[0]["errors"] == {
+        "POST": {"1": "ValueError('boom')"},
+        "PUT": {},
+        "DELETE": {},
+    }
+    assert ret[1]["errors"] is None
+    mock_sync.assert_any_call(mock.ANY, time_filter="upcoming")
+    assert mock_sync.call_count == 3
+
+
+def test_sync_group_batch_pages():
+    mockf = mock.MagicMock()
+    mockg = mock.MagicMock()
+    mockf.request.side_effect = [
+        [
+            {"code": 200, "body": json.dumps({"data": []})},
+            {"code": 500, "body": json.dumps({"error": {"message": "boom"}})},
+        ],
+        ValueError("batch failed"),
+    ]
+    mockf.get_object.return_value = {"data": []}
+    pairs = [
+        ("Page1", "GCal1"),
+        ("Page2", "GCal2"),
+        ("Page1", "GCal3"),
+        ("Page3", "GCal3", "upcoming"),
+    ]
+    graph_limiter = mock.MagicMock()
+    sync = group.SyncGroup(
+        mockf, mockg, pairs, batch_pages=True, graph_limiter=graph_limiter
+    )
+    ret = sync.execute()
+    graph_limiter.acquire.assert_any_call(2)
+    assert sync.page("Page1").limiter is graph_limiter
+    assert [x["error"] is None for x in ret] == [True, False, True, True]
+    assert str(ret[1]["error"]) == "boom"
+    mockf.get_object.assert_called_once_with(
+        "Page3/events", fields=mock.ANY, time_filter="upcoming"
+    )
+
+
+@mock.patch("fest.google.GoogleCalendar.sync")
+def test_sync_group_execute_pairs(mock_sync):
+    mock_sync.return_value.execute.return_value.digests = {"1": "v2:abc"}
+    pairs = [("Page1", "GCal1"), ("Page2", "GCal2")]
+    sync = group.SyncGroup(mock.MagicMock(), mock.MagicMock(), pairs)
+    ret = sync.execute(pairs=[("Page2", "GCal2")])
+    assert [x["page_id"] for x in ret] == ["Page2"]
+    assert ret[0]["digests"] == {"1": "v2:abc"}
+    mock_sync.assert_called_once()
+
+
+@mock.patch("fest.google.GoogleCalendar.sync_events")
+def test_sync_group_sync_ids(mock_sync_events):
+    sync = group.SyncGroup(mock.MagicMock(), mock.MagicMock(), [("Page1", "GCal1")])
+    ret = sync.sync("Page1", "GCal1", ids=["1", "2"], removed=["2"])
+    assert ret["error"] is None
+    mock_sync_events.assert_called_once_with(mock.ANY, ["1", "2"], ["2"])
@@ -1,4 +1,7 @@
+import json
 import os
+import subprocess
+import sys
 from unittest import mock
 
 os.environ["FACEBOOK_PAGE_ID"] = "MyPage"
@@ -6,14 +9,176 @@ os.environ["GOOGLE_CALENDAR_ID"] = "id@group.calendar.google.com"
 os.environ["FACEBOOK_PAGE_TOKEN"] = "token"
 os.environ["GOOGLE_SERVICE_ACCOUNT"] = "{}"
 
-with mock.patch(
-    "google.oauth2.service_account.Credentials." "from_service_account_info"
-):
-    from fest import heroku
+from fest import heroku  # noqa: E402
 
+IMPORT_BUDGET = 1.0
+HEAVY_MODULES = ["facebook", "googleapiclient", "google.oauth2", "requests"]
 
+
+def test_import_budget():
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import fest.heroku\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(sorted(x for x in {HEAVY_MODULES!r} if x in sys.modules))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    elapsed, heavy = proc.stdout.splitlines()
+    assert float(elapsed) < IMPORT_BUDGET
+    assert heavy == "[]"
+
+
+@mock.patch("fest.transport.Transport.graphapi")
+def test_graphapi(mock_graphapi):
+    heroku.graphapi.cache_clear()
+    assert heroku.graphapi() is heroku.graphapi()
+    mock_graphapi.assert_called_once_with("token")
+
+
+@mock.patch("fest.transport.Transport.calendarapi")
+@mock.patch("fest.transport.Transport.authorized")
+@mock.patch("google.oauth2.service_account.Credentials.from_service_account_info")
+def test_calendarapi(mock_creds, mock_authorized, mock_calendarapi):
+    heroku.calendarapi.cache_clear()
+    assert heroku.calendarapi() is heroku.calendarapi()
+    mock_creds.assert_called_once_with({})
+    mock_authorized.assert_called_once_with(
+        mock_creds.return_value,
+        pool_size=heroku.POOL_SIZE,
+        adapter=None,
+        metrics=None,
+    )
+    mock_authorized.return_value.calendarapi.assert_called_once_with(None)
+
+
+def test_adapter(tmp_path):
+    heroku.cassette.cache_clear()
+    assert heroku.adapter() is None
+    heroku.cassette.cache_clear()
+    with mock.patch("fest.heroku.FEST_CASSETTE", str(tmp_path / "fest.jsonl")):
+        ret = heroku.adapter()
+        assert ret.cassette is heroku.cassette()
+        assert ret.cassette.path == str(tmp_path / "fest.jsonl")
+    heroku.cassette.cache_clear()
+
+
+def test_metrics(tmp_path):
+    heroku.metrics.cache_clear()
+    heroku.export()
+    assert heroku.metrics() is None
+    heroku.metrics.cache_clear()
+    path = tmp_path / "fest.prom"
+    with mock.patch("fest.heroku.FEST_METRICS_PATH", str(path)):
+        heroku.metrics().increment("syncs_total")
+        heroku.export()
+    heroku.metrics.cache_clear()
+    assert "fest_syncs_total 1.0" in path.read_text()
+
+
+def test_limiters(tmp_path):
+    heroku.graph_limiter.cache_clear()
+    heroku.calendar_limiter.cache_clear()
+    assert heroku.graph_limiter() is None
+    assert heroku.calendar_limiter() is None
+    heroku.graph_limiter.cache_clear()
+    heroku.calendar_limiter.cache_clear()
+    heroku.ratelimit_backend.cache_clear()
+    env = {
+        "FACEBOOK_APP_ID": "1234",
+        "GOOGLE_SERVICE_ACCOUNT": '{"project_id": "my-project"}',
+    }
+    with mock.patch.multiple(
+        "fest.heroku",
+        FEST_GRAPH_RATE="50",
+        FEST_CALENDAR_RATE="10",
+        FEST_RATELIMIT_PATH=str(tmp_path / "limits.db"),
+    ), mock.patch.dict("os.environ", env):
+        graph = heroku.graph_limiter()
+        calendar = heroku.calendar_limiter()
+    assert (graph.rate, graph.name) == (50, "graph:1234")
+    assert (calendar.rate, calendar.name) == (10, "calendar:my-project")
+    assert graph.backend is calendar.backend
+    assert graph.backend.path == str(tmp_path / "limits.db")
+    heroku.graph_limiter.cache_clear()
+    heroku.calendar_limiter.cache_clear()
+    heroku.ratelimit_backend.cache_clear()
+
+
+def test_store(tmp_path):
+    heroku.store.cache_clear()
+    with mock.patch("fest.heroku.FEST_STATE_PATH", str(tmp_path / "fest.db")):
+        assert heroku.store() is heroku.store()
+        assert heroku.store() is not None
+    heroku.store.cache_clear()
+    assert heroku.store() is None
+
+
+@mock.patch("fest.heroku.calendarapi")
+@mock.patch("fest.heroku.graphapi")
 @mock.patch("fest.GoogleCalendar.sync")
-def test_main(mock_sync):
-    heroku.main()
+def test_main(mock_sync, *_):
+    mock_sync.return_value.execute.return_value.errors = {"POST": {"1": Exception()}}
+    ret = heroku.main()
+    assert ret["errors"] == {"POST": {"1": "Exception()"}}
     mock_sync.assert_called_once()
     mock_sync.return_value.execute.assert_called_once_with(dryrun=False)
+
+
+@mock.patch("fest.heroku.main")
+@mock.patch("fest.heroku.group")
+def test_worker(mock_group, mock_main, capsys):
+    mock_main.return_value = {"responses": {}, "errors": {"POST": {}}}
+    assert heroku.worker() == 0
+    assert json.loads(capsys.readouterr().out) == mock_main.return_value
+    mock_main.return_value = {"responses": {}, "errors": {"POST": {"1": "boom"}}}
+    assert heroku.worker() == 1
+    mock_group.return_value = [
+        {"page_id": "MyPage", "errors": {"POST": {}}, "error": None},
+        {"page_id": "BadPage", "errors": None, "error": "ValueError('boom')"},
+    ]
+    with mock.patch("fest.heroku.FEST_SYNC_GROUP", [("MyPage", "MyGCal")]):
+        assert heroku.worker() == 1
+        mock_group.return_value.pop()
+        assert heroku.worker() == 0
+    assert json.loads(capsys.readouterr().out.splitlines()[-1]) == [
+        {"page_id": "MyPage", "errors": {"POST": {}}, "error": None}
+    ]
+
+
+@mock.patch("fest.heroku.calendarapi")
+@mock.patch("fest.heroku.graphapi")
+@mock.patch("fest.SyncGroup.execute")
+def test_group(mock_execute, *_):
+    mock_execute.return_value = [
+        {"page_id": "MyPage", "error": None},
+        {"page_id": "BadPage", "error": ValueError("boom")},
+    ]
+    ret = heroku.group([("MyPage", "MyGCal"), ("BadPage", "MyGCal")])
+    mock_execute.assert_called_once_with(dryrun=False)
+    assert ret[0]["error"] is None
+    assert ret[1]["error"] == "ValueError('boom')"
+
+
+@mock.patch("fest.heroku.calendarapi")
+@mock.patch("fest.heroku.graphapi")
+@mock.patch("fest.daemon.Daemon.run")
+def test_daemon(mock_run, *_):
+    heroku.daemon(dryrun=True)
+    mock_run.assert_called_once_with(dryrun=True)
+
+
+@mock.patch.dict(
+    "os.environ", {"FACEBOOK_APP_SECRET": "secret", "FACEBOOK_VERIFY_TOKEN": "token"}
+)
+@mock.patch("fest.heroku.calendarapi")
+@mock.patch("fest.heroku.graphapi")
+@mock.patch("fest.webhook.Webhook.serve")
+def test_webhook(mock_serve, *_):
+    heroku.webhook()
+    mock_serve.assert_called_once_with(("", 8080))
@@ -0,0 +1,29 @@
+from unittest import mock
+
+from fest import __main__ as cli
+from fest import cassette
+
+
+def test_targets(recorded):
+    ret = cli.targets(cassette.Cassette(recorded))
+    assert ret == ("MyPage", "MyGCal")
+
+
+def test_profile(recorded, capsys):
+    ret = cli.main(["profile", recorded, "--time-filter", "all", "--top", "3"])
+    out = capsys.readouterr().out
+    assert ret == 0
+    assert "MyPage => MyGCal" in out
+    assert "{'POST': 2, 'PUT': 0, 'DELETE': 0} errors={}" in out
+    assert "Ordered by: cumulative time" in out
+    assert "Peak memory:" in out
+
+
+@mock.patch("fest.google.GoogleSyncFuture.execute")
+def test_profile_errors(mock_execute, recorded, capsys):
+    mock_execute.return_value.responses = {"POST": {}}
+    mock_execute.return_value.errors = {"POST": {"0": "boom"}, "PUT": {}}
+    ret = cli.main(["profile", recorded, "-p", "Other", "-c", "Other", "--dryrun"])
+    assert ret == 1
+    assert "Other => Other" in capsys.readouterr().out
+    mock_execute.assert_called_once_with(dryrun=True)
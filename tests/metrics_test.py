@@ -0,0 +1,59 @@
+import pytest
+
+from fest import metrics
+
+
+def test_null_sink():
+    sink = metrics.NullSink()
+    sink.increment("calls_total")
+    sink.observe("batch_size", 50)
+    with sink.span("request"):
+        pass
+
+
+def test_memory_sink_span():
+    sink = metrics.MemorySink()
+    with sink.span("request", api="graph"):
+        pass
+    with pytest.raises(ValueError):
+        with sink.span("request", api="calendar"):
+            raise ValueError
+    assert len(sink.values("request_seconds")) == 2
+    assert len(sink.values("request_seconds", api="graph")) == 1
+    assert sink.count("request_errors_total") == 1
+    assert sink.count("request_errors_total", api="graph") == 0
+
+
+def test_memory_sink():
+    sink = metrics.MemorySink()
+    sink.increment("calls_total", verb="POST")
+    sink.increment("calls_total", 2, verb="PUT")
+    sink.observe("batch_size", 50, verb="POST")
+    sink.observe("batch_size", 25, verb="POST")
+    assert sink.count("calls_total") == 3
+    assert sink.count("calls_total", verb="PUT") == 2
+    assert sink.count("calls_total", verb="DELETE") == 0
+    assert sink.values("batch_size", verb="POST") == [50, 25]
+
+
+def test_prometheus_sink(tmp_path):
+    sink = metrics.PrometheusSink()
+    sink.increment("calls_total", verb="POST")
+    sink.increment("calls_total", 2, verb="PUT")
+    sink.increment("syncs_total")
+    sink.observe("batch_size", 50, verb='"POST"\n')
+    sink.observe("batch_size", 25, verb='"POST"\n')
+    exp = (
+        "# TYPE fest_calls_total counter\n"
+        'fest_calls_total{verb="POST"} 1.0\n'
+        'fest_calls_total{verb="PUT"} 2.0\n'
+        "# TYPE fest_syncs_total counter\n"
+        "fest_syncs_total 1.0\n"
+        "# TYPE fest_batch_size summary\n"
+        'fest_batch_size_count{verb="\\"POST\\"\\n"} 2\n'
+        'fest_batch_size_sum{verb="\\"POST\\"\\n"} 75.0\n'
+    )
+    assert sink.render() == exp
+    path = tmp_path / "fest.prom"
+    sink.write(str(path))
+    assert path.read_text() == exp
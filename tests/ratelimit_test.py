@@ -0,0 +1,105 @@
+import json
+import multiprocessing
+from unittest import mock
+
+import pytest
+
+from fest import ratelimit
+
+
+def test_open_backend(tmp_path):
+    assert isinstance(ratelimit.open_backend(), ratelimit.MemoryBackend)
+    ret = ratelimit.open_backend(str(tmp_path / "limits.db"))
+    assert isinstance(ret, ratelimit.SQLiteBackend)
+    ret = ratelimit.open_backend(str(tmp_path / "limits.json"))
+    assert isinstance(ret, ratelimit.FileBackend)
+
+
+def test_usage():
+    headers = {
+        "X-App-Usage": json.dumps({"call_count": 28, "total_time": 25}),
+        "X-Page-Usage": "<invalid>",
+        "X-Business-Use-Case-Usage": json.dumps(
+            {"1234": [{"type": "pages", "call_count": 10, "total_cputime": 80}]}
+        ),
+    }
+    assert ratelimit.usage(headers) == 80
+    assert ratelimit.usage({}) == 0
+
+
+@mock.patch("time.sleep")
+@mock.patch("time.time")
+def test_rate_limiter_acquire(mock_time, mock_sleep):
+    mock_time.return_value = 1000.0
+    limiter = ratelimit.RateLimiter(10, burst=20)
+    assert limiter.acquire(15) == 0
+    assert limiter.acquire(10) == 0.5
+    mock_sleep.assert_called_once_with(0.5)
+    mock_time.return_value = 1001.0
+    assert limiter.acquire(10) == pytest.approx(0.5)
+    mock_time.return_value = 1010.0
+    assert limiter.acquire(20) == 0
+
+
+@mock.patch("time.sleep")
+@mock.patch("time.time")
+def test_rate_limiter_report(mock_time, mock_sleep):
+    mock_time.return_value = 1000.0
+    limiter = ratelimit.RateLimiter(10)
+    limiter.report({"Content-Type": "application/json"})
+    assert limiter.backend.states == {}
+    limiter.report({"X-App-Usage": json.dumps({"call_count": 50})})
+    assert limiter.backend.states["default"]["scale"] == 1
+    limiter.report({"X-App-Usage": json.dumps({"call_count": 95})})
+    assert limiter.backend.states["default"]["scale"] == pytest.approx(0.2)
+    assert limiter.acquire(12) == pytest.approx(1)
+    limiter.report({"X-Page-Usage": json.dumps({"call_count": 100})})
+    assert limiter.backend.states["default"]["scale"] == ratelimit.MIN_SCALE
+    mock_sleep.assert_called_once()
+
+
+@pytest.mark.parametrize("name", ["limits.db", "limits.json"])
+def test_backend_update(tmp_path, name):
+    path = str(tmp_path / name)
+    backend = ratelimit.open_backend(path)
+    assert backend.update("a", lambda x: ({"n": 1}, x)) is None
+    assert backend.update("a", lambda x: ({"n": x["n"] + 1}, x)) == {"n": 1}
+    other = ratelimit.open_backend(path)
+    assert other.update("a", lambda x: (x, x)) == {"n": 2}
+    assert other.update("b", lambda x: (x, x)) is None
+
+
+def test_sqlite_backend_rollback(tmp_path):
+    backend = ratelimit.SQLiteBackend(str(tmp_path / "limits.db"))
+    backend.update("a", lambda x: ({"n": 1}, None))
+    with pytest.raises(ValueError):
+        backend.update("a", mock.MagicMock(side_effect=ValueError))
+    assert backend.update("a", lambda x: (x, x)) == {"n": 1}
+
+
+def test_file_backend_corrupt(tmp_path):
+    path = tmp_path / "limits.json"
+    path.write_text('{"a": ')
+    backend = ratelimit.FileBackend(str(path))
+    assert backend.update("a", lambda x: ({"n": 1}, x)) is None
+    assert json.loads(path.read_text()) == {"a": {"n": 1}}
+
+
+def count(path, key, times):
+    backend = ratelimit.open_backend(path)
+    for _ in range(times):
+        backend.update(key, lambda x: ((x or 0) + 1, None))
+
+
+@pytest.mark.parametrize("name", ["limits.db", "limits.json"])
+def test_backend_processes(tmp_path, name):
+    path = str(tmp_path / name)
+    procs = [
+        multiprocessing.Process(target=count, args=(path, "a", 50)) for _ in range(4)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    count(path, "a", 1)
+    assert ratelimit.open_backend(path).update("a", lambda x: (x, x)) == 201
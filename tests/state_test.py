@@ -0,0 +1,109 @@
+import sqlite3
+
+import pytest
+
+from fest import state
+
+RECORDS = [
+    {
+        "google_id": "g1",
+        "facebook_id": "1",
+        "page_id": "MyPage",
+        "parent_id": None,
+        "digest": "a",
+        "start": "2018-12-12T17:00:00+00:00",
+        "end": "2018-12-12T18:00:00+00:00",
+    },
+    {
+        "google_id": "g2",
+        "facebook_id": "2",
+        "page_id": "MyPage",
+        "parent_id": None,
+        "digest": "b",
+        "start": "2018-12-13T17:00:00+00:00",
+        "end": "2018-12-13T18:00:00+00:00",
+    },
+    {
+        "google_id": "g3",
+        "facebook_id": "3",
+        "page_id": "OtherPage",
+        "parent_id": "0",
+        "digest": "c",
+        "start": "2018-12-14T17:00:00+00:00",
+        "end": "2018-12-14T18:00:00+00:00",
+    },
+]
+
+
+@pytest.fixture(params=["state.json", "state.db"])
+def store(request, tmp_path):
+    return state.open_store(str(tmp_path / request.param))
+
+
+def test_open_store(tmp_path):
+    assert isinstance(state.open_store(str(tmp_path / "x.json")), state.FileStore)
+    assert isinstance(state.open_store(str(tmp_path / "x.db")), state.SQLiteStore)
+
+
+def test_store_meta(store):
+    assert store.get_meta("MyGCal", "syncToken") is None
+    store.update("MyGCal", syncToken="fizz")
+    assert store.get_meta("MyGCal", "syncToken") == "fizz"
+    assert store.get_meta("OtherGCal", "syncToken") is None
+
+
+def test_store_events(store):
+    store.update("MyGCal", RECORDS)
+    store.update("MyGCal", [dict(RECORDS[0], digest="z")], ["g2"])
+    ret = sorted(store.iter_events("MyGCal"), key=lambda x: x["google_id"])
+    exp = [dict(RECORDS[0], digest="z"), RECORDS[2]]
+    assert ret == exp
+
+
+def test_store_events_filter(store):
+    store.update("MyGCal", RECORDS)
+    ret = list(
+        store.iter_events(
+            "MyGCal",
+            "MyPage",
+            "2018-12-12T18:00:00+00:00",
+            "2018-12-14T00:00:00+00:00",
+        )
+    )
+    assert ret == [RECORDS[1]]
+
+
+def test_store_clear(store):
+    store.update("MyGCal", RECORDS, syncToken="fizz")
+    store.update("OtherGCal", RECORDS, syncToken="buzz")
+    store.clear("MyGCal")
+    assert list(store.iter_events("MyGCal")) == []
+    assert store.get_meta("MyGCal", "syncToken") is None
+    assert store.get_meta("OtherGCal", "syncToken") == "buzz"
+
+
+def test_file_store_persist(tmp_path):
+    path = str(tmp_path / "state.json")
+    state.FileStore(path).update("MyGCal", RECORDS, syncToken="fizz")
+    store = state.FileStore(path)
+    assert store.get_meta("MyGCal", "syncToken") == "fizz"
+    assert len(list(store.iter_events("MyGCal"))) == 3
+
+
+def test_sqlite_store_migrate(tmp_path):
+    path = str(tmp_path / "state.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE events (calendar_id TEXT NOT NULL, google_id TEXT NOT NULL, "
+        "facebook_id TEXT, page_id TEXT, digest TEXT, start TEXT, end TEXT, "
+        "PRIMARY KEY (calendar_id, google_id))"
+    )
+    conn.execute(
+        "INSERT INTO events VALUES ('MyGCal', 'g1', '1', 'MyPage', 'a', NULL, NULL)"
+    )
+    conn.commit()
+    conn.close()
+    store = state.SQLiteStore(path)
+    store.update("MyGCal", [RECORDS[2]])
+    ret = sorted(store.iter_events("MyGCal"), key=lambda x: x["google_id"])
+    assert [x["parent_id"] for x in ret] == [None, "0"]
@@ -0,0 +1,133 @@
+import gzip
+import json
+import threading
+from http import server
+from unittest import mock
+
+import pytest
+
+from fest import metrics
+from fest import transport
+
+
+class Handler(server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.reply({"port": self.client_address[1]})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["content-length"]))
+        if self.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.reply(json.loads(body))
+
+    def reply(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        if "gzip" in self.headers.get("accept-encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("content-encoding", "gzip")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def url():
+    httpd = server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_request_metrics(url):
+    sink = metrics.MemorySink()
+    http = transport.Transport(metrics=sink)
+    http.request(url)
+    http.session.get(url)
+    host = url.split("/")[2]
+    sizes = sink.values("http_response_bytes", host=host)
+    assert len(sizes) == 2 and all(x > 0 for x in sizes)
+    assert len(sink.values("http_request_seconds", host=host)) == 2
+
+
+def test_request_limiter(url):
+    limiter = mock.MagicMock()
+    http = transport.Transport(limiter=limiter)
+    http.request(url)
+    limiter.report.assert_called_once()
+    assert limiter.report.call_args[0][0]["content-type"] == "application/json"
+
+
+def test_request_keepalive(url):
+    http = transport.Transport()
+    resp1, content1 = http.request(url)
+    resp2, content2 = http.request(url)
+    assert resp1.status == 200
+    assert resp1["status"] == "200"
+    assert resp1["content-type"] == "application/json"
+    assert "content-encoding" not in resp1
+    assert json.loads(content1) == json.loads(content2)
+
+
+def test_request_compress(url):
+    http = transport.Transport(compress=True)
+    resp, content = http.request(url, "POST", body='{"fizz": "buzz"}')
+    assert resp.status == 200
+    assert json.loads(content) == {"fizz": "buzz"}
+
+
+def test_user_agent():
+    http = transport.Transport(requests_session())
+    assert http.session.headers["User-Agent"] == "fest (gzip)"
+    assert http.session.headers["Accept-Encoding"] == "gzip"
+
+
+def test_authorized():
+    with mock.patch("google.auth.transport.requests.AuthorizedSession") as mock_session:
+        mock_session.return_value = requests_session()
+        http = transport.Transport.authorized("creds", pool_size=4)
+    mock_session.assert_called_once_with("creds")
+    assert http.session is mock_session.return_value
+
+
+def test_graphapi():
+    http = transport.Transport()
+    graphapi = http.graphapi("token", version="3.1")
+    assert graphapi.session is http.session
+    assert graphapi.access_token == "token"
+
+
+@mock.patch("googleapiclient.discovery.build")
+def test_calendarapi(mock_build):
+    http = transport.Transport()
+    http.calendarapi()
+    mock_build.assert_called_once_with(
+        "calendar", "v3", cache_discovery=False, http=http
+    )
+
+
+def requests_session():
+    session = transport.requests.Session()
+    session.headers["User-Agent"] = "fest"
+    return session
+
+
+@mock.patch("googleapiclient.discovery.build_from_document")
+def test_calendarapi_discovery_path(mock_build, tmp_path, url):
+    path = tmp_path / "calendar.json"
+    http = transport.Transport()
+    with mock.patch("fest.transport.DISCOVERY_URI", url):
+        http.calendarapi(str(path))
+    document = path.read_text()
+    mock_build.assert_called_once_with(document, http=http)
+    with mock.patch("fest.transport.DISCOVERY_URI", "http://127.0.0.1:1/"):
+        http.calendarapi(str(path))
+    mock_build.assert_called_with(document, http=http)
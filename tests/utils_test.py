@@ -1,3 +1,8 @@
+import time
+from unittest import mock
+
+import pytest
+
 from fest import utils
 
 
@@ -17,8 +22,99 @@ def test_digest():
     assert utils.digest(ret) == "f45195aef08daea1be5dbb1c7feb5763c5bc7b37"
 
 
+def test_canonical_digest():
+    ret = utils.canonical_digest({"fizz": "buzz", "jazz": "fuzz"})
+    exp = utils.canonical_digest({"jazz": "fuzz", "fizz": "buzz"})
+    assert ret == exp
+    assert ret == "v2:98214e4c2e4c18ebf5955b893707f8cd9124db1c"
+
+
 def test_logger():
     obj = SomeClass()
     ret = utils.logger(obj)
     exp = "tests.utils_test.SomeClass"
     assert ret.name == exp
+
+
+def test_paginate():
+    pages = {None: {"page": 1, "next": "a"}, "a": {"page": 2, "next": "b"}}
+    pages["b"] = {"page": 3}
+
+    def fetch(after=None):
+        return pages[after]
+
+    def cursor(response):
+        return {"after": response["next"]} if "next" in response else None
+
+    for prefetch in [0, 1, 3]:
+        ret = list(utils.paginate(fetch, cursor, {}, prefetch))
+        exp = [{"page": 1, "next": "a"}, {"page": 2, "next": "b"}, {"page": 3}]
+        assert ret == exp
+
+
+def test_paginate_err():
+    def fetch():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        list(utils.paginate(fetch, lambda x: None, {}))
+
+
+def test_paginate_close():
+    calls = []
+
+    def fetch(page=0):
+        calls.append(page)
+        return page
+
+    pages = utils.paginate(fetch, lambda x: {"page": x + 1}, {}, prefetch=1)
+    assert next(pages) == 0
+    time.sleep(0.3)
+    pages.close()
+    time.sleep(0.3)
+    count = len(calls)
+    time.sleep(0.3)
+    assert len(calls) == count <= 3
+
+
+def test_http_status():
+    err = Exception()
+    assert utils.http_status(err) is None
+    err.resp = mock.MagicMock(status=410)
+    assert utils.http_status(err) == 410
+
+
+def test_to_utc():
+    exp = "2018-12-12T17:00:00+00:00"
+    assert utils.to_utc("2018-12-12T12:00:00-0500") == exp
+    assert utils.to_utc("2018-12-12T12:00:00-05:00") == exp
+    assert utils.to_utc("2018-12-12T17:00:00Z") == exp
+
+
+def test_backoff():
+    for attempt in range(10):
+        assert 0 <= utils.backoff(attempt, 1, 4) <= min(4, 2**attempt)
+
+
+@mock.patch("time.sleep")
+def test_retry(mock_sleep):
+    func = mock.MagicMock(side_effect=[ValueError, ValueError, "ok"])
+    on_retry = mock.MagicMock()
+    assert utils.retry(func, 3, on_retry=on_retry) == "ok"
+    assert mock_sleep.call_count == 2
+    assert on_retry.call_count == 2
+
+
+@mock.patch("time.sleep")
+def test_retry_exhausted(mock_sleep):
+    func = mock.MagicMock(side_effect=ValueError)
+    with pytest.raises(ValueError):
+        utils.retry(func, 2)
+    assert func.call_count == 3
+
+
+def test_retry_not_retryable():
+    func = mock.MagicMock(side_effect=ValueError)
+    with pytest.raises(ValueError):
+        utils.retry(func, 2, lambda err: False)
+    func.assert_called_once()
@@ -0,0 +1,139 @@
+import hashlib
+import hmac
+import json
+import threading
+import urllib.request
+from unittest import mock
+
+import pytest
+
+from fest import group
+from fest import webhook
+
+SECRET = "secret"
+
+
+def sign(body):
+    digest = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def notification(*changes):
+    return {
+        "object": "page",
+        "entry": [
+            {
+                "id": "MyPage",
+                "changes": [
+                    {"field": "feed", "value": value}
+                    for value in [*changes, {"item": "status", "verb": "add"}]
+                ],
+            }
+        ],
+    }
+
+
+def receiver():
+    pairs = [("MyPage", "GCal1"), ("MyPage", "GCal2"), ("OtherPage", "GCal3")]
+    sync = group.SyncGroup(mock.MagicMock(), mock.MagicMock(), pairs)
+    hook = webhook.Webhook(sync, SECRET, "token", delay=60)
+    hook.debouncer.callback = mock.MagicMock()
+    return hook
+
+
+def test_verify_signature():
+    assert webhook.verify_signature(SECRET, b"{}", sign(b"{}"))
+    assert not webhook.verify_signature(SECRET, b"{}", sign(b"[]"))
+    assert not webhook.verify_signature(SECRET, b"{}", None)
+
+
+def test_iter_changes():
+    payload = notification(
+        {"item": "event", "verb": "add", "event_id": "1"},
+        {"item": "event", "verb": "remove", "event_id": "2"},
+    )
+    ret = list(webhook.iter_changes(payload))
+    assert ret == [("MyPage", "1", "add"), ("MyPage", "2", "remove")]
+
+
+def test_debouncer():
+    callback = mock.MagicMock()
+    debouncer = webhook.Debouncer(callback, delay=60)
+    debouncer.push("MyPage", "1", "add")
+    debouncer.push("MyPage", "1", "edited")
+    debouncer.push("MyPage", "2", "remove")
+    debouncer.push("OtherPage", "3", "add")
+    assert list(debouncer.timers) == ["MyPage", "OtherPage"]
+    debouncer.flush("MyPage")
+    callback.assert_called_once_with("MyPage", {"1": "edited", "2": "remove"})
+    debouncer.flush("MyPage")
+    assert callback.call_count == 1
+    debouncer.close()
+    callback.assert_called_with("OtherPage", {"3": "add"})
+    assert not debouncer.timers
+
+
+def test_debouncer_timer():
+    done = threading.Event()
+    debouncer = webhook.Debouncer(lambda *_: done.set(), delay=0.01)
+    debouncer.push("MyPage", "1", "add")
+    assert done.wait(5)
+
+
+def test_webhook_verify():
+    hook = receiver()
+    params = {"hub.mode": "subscribe", "hub.verify_token": "token"}
+    assert hook.verify({**params, "hub.challenge": "abc"}) == "abc"
+    assert hook.verify({**params, "hub.verify_token": "bad"}) is None
+
+
+def test_webhook_sync():
+    hook = receiver()
+    with mock.patch.object(hook.group, "sync") as mock_sync:
+        ret = hook.sync("MyPage", {"1": "edited", "2": "remove"})
+    assert len(ret) == 2
+    mock_sync.assert_any_call(
+        "MyPage", "GCal1", dryrun=False, ids=["1", "2"], removed=["2"]
+    )
+    mock_sync.assert_any_call(
+        "MyPage", "GCal2", dryrun=False, ids=["1", "2"], removed=["2"]
+    )
+
+
+def test_webhook_server():
+    hook = receiver()
+    httpd = hook.server(("127.0.0.1", 0))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{httpd.server_port}/"
+    body = json.dumps(
+        notification({"item": "event", "verb": "add", "event_id": "1"})
+    ).encode()
+    try:
+        query = "?hub.mode=subscribe&hub.verify_token=token&hub.challenge=abc"
+        with urllib.request.urlopen(url + query) as res:
+            assert res.read() == b"abc"
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "?hub.mode=subscribe")
+        req = urllib.request.Request(url, body, {webhook.SIGNATURE_HEADER: sign(body)})
+        with urllib.request.urlopen(req) as res:
+            assert res.status == 200
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(urllib.request.Request(url, body))
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    hook.debouncer.close()
+    hook.debouncer.callback.assert_called_once_with("MyPage", {"1": "add"})
+
+
+@mock.patch("signal.signal")
+def test_webhook_serve(mock_signal):
+    hook = receiver()
+    hook.debouncer.push("MyPage", "1", "add")
+    with mock.patch("http.server.ThreadingHTTPServer.serve_forever") as mock_serve:
+        mock_serve.side_effect = KeyboardInterrupt
+        with pytest.raises(KeyboardInterrupt):
+            hook.serve(("127.0.0.1", 0))
+    hook.debouncer.callback.assert_called_once_with("MyPage", {"1": "add"})
+    mock_signal.assert_called_once()
@@ -0,0 +1,66 @@
+from datetime import datetime
+from datetime import timezone
+
+from fest import window
+
+NOW = datetime(2018, 12, 12, 17, tzinfo=timezone.utc)
+
+
+def event(day, hour=12, **kwargs):
+    return dict(
+        start_time=f"2018-12-{day:02d}T{hour:02d}:00:00-0500",
+        end_time=f"2018-12-{day:02d}T{hour + 1:02d}:00:00-0500",
+        **kwargs,
+    )
+
+
+def test_time_window_from_time_filter():
+    upcoming = window.TimeWindow.from_time_filter("upcoming", NOW)
+    past = window.TimeWindow.from_time_filter("past", NOW)
+    anytime = window.TimeWindow.from_time_filter(None)
+    assert (upcoming.since, upcoming.until) == (NOW, None)
+    assert (past.since, past.until) == (None, NOW)
+    assert (anytime.since, anytime.until) == (None, None)
+
+
+def test_time_window_params():
+    ret = window.TimeWindow(NOW, NOW.replace(day=13)).params()
+    exp = {"since": 1544634000, "until": 1544720400}
+    assert ret == exp
+
+
+def test_time_window_bounds():
+    ret = window.TimeWindow(NOW).bounds()
+    exp = ("2018-12-12T17:00:00+0000", None)
+    assert ret == exp
+
+
+def test_time_window_position():
+    win = window.TimeWindow(NOW, NOW.replace(day=14))
+    assert win.position(event(11)) == -1
+    assert win.position(event(12)) == 0
+    assert win.position(event(15)) == 1
+    assert win.position({"id": "1"}) == 0
+    assert win.position({"event_times": [event(11), event(13)]}) == 0
+    assert win.position({"event_times": [event(10), event(11)]}) == -1
+
+
+def test_time_window_contains():
+    win = window.TimeWindow(NOW, predicates=[lambda x: x.get("name") != "skip"])
+    assert win.contains(event(13))
+    assert not win.contains(event(11))
+    assert not win.contains(event(13, name="skip"))
+
+
+def test_time_window_exhausted():
+    win = window.TimeWindow(NOW, NOW.replace(day=20))
+    assert win.exhausted([event(10), event(9)])
+    assert not win.exhausted([event(9), event(10)])
+    assert win.exhausted([event(21), event(22)])
+    assert not win.exhausted([event(22), event(21)])
+    assert not win.exhausted([event(13), event(9)])
+    assert win.exhausted([event(9), event(9)])
+    assert win.exhausted([event(9)])
+    assert win.exhausted([event(21)])
+    assert not win.exhausted([event(13)])
+    assert not win.exhausted([])